@@ -0,0 +1,126 @@
+"""
+Agent benchmarks against libvirt's test:///default driver.
+
+    python -m benchmarks                       # run, compare with baseline.json if present
+    python -m benchmarks --save-baseline       # run and store the results as the new baseline
+    python -m benchmarks --vm-counts 10,100 --scenarios list_vms,get_vm
+
+Run from the agent/ directory.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from .harness import (
+    BENCH_DIR,
+    compare,
+    environment_info,
+    print_comparison,
+    print_summary,
+    result_key,
+    run_concurrent,
+    setup_env,
+    write_results,
+)
+
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(prog="python -m benchmarks", description="Agent benchmark suite")
+    p.add_argument("--vm-counts", type=_ints, default=[10, 100, 1000], help="domains defined per run (default 10,100,1000)")
+    p.add_argument("--concurrency", type=_ints, default=[1, 8, 32], help="requests in flight (default 1,8,32)")
+    p.add_argument("--requests", type=int, default=200, help="requests per run (default 200)")
+    p.add_argument("--scenarios", type=lambda s: s.split(","), default=None, help="only run these scenarios")
+    p.add_argument("--output", type=Path, default=BENCH_DIR / "results" / "latest.json")
+    p.add_argument("--baseline", type=Path, default=BENCH_DIR / "baseline.json")
+    p.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    p.add_argument("--threshold", type=float, default=0.25, help="regression threshold (default 0.25 = 25%%)")
+    p.add_argument("--fail-on-regression", action="store_true", help="exit 1 when a run regressed")
+    p.add_argument("--keep-workdir", action="store_true")
+    return p.parse_args()
+
+
+async def run(args, workdir: Path) -> dict:
+    # imported here: setup_env() has to configure the agent first
+    import libvirt
+    from .scenarios import SCENARIOS, Context, make_client, open_test_connection, seed_domains
+
+    scenarios = [s for s in SCENARIOS if args.scenarios is None or s.name in args.scenarios]
+    conn = open_test_connection(workdir)
+    results = {}
+    try:
+        version = conn.getLibVersion()
+        env = environment_info(f"{version // 1000000}.{version // 1000 % 1000}.{version % 1000}")
+        async with make_client() as client:
+            for vms in sorted(args.vm_counts):
+                print(f"Seeding {vms} domains...")
+                seed_domains(conn, workdir, vms)
+                ctx = Context(conn=conn, client=client, workdir=workdir, vms=vms)
+                for scenario in scenarios:
+                    total = min(args.requests, scenario.max_requests or args.requests)
+                    levels = [c for c in args.concurrency if scenario.concurrency is None or c in scenario.concurrency]
+                    for c in levels:
+                        op = scenario.make_op(ctx)
+                        # warm caches/connections so the first samples aren't outliers
+                        await run_concurrent(op, 1, min(3, total))
+                        res = await run_concurrent(op, c, total)
+                        key = result_key(scenario.name, vms, c)
+                        results[key] = res.summary()
+                        print(f"  {key}: p50={results[key]['p50_ms']}ms rps={results[key]['throughput_rps']}"
+                              + (f" errors={res.errors} ({res.first_error})" if res.errors else ""))
+                        if scenario.cleanup is not None:
+                            scenario.cleanup(ctx)
+    except libvirt.libvirtError as e:
+        print(f"Libvirt error: {e}")
+        raise
+    finally:
+        conn.close()
+    return {"environment": env, "results": results}
+
+
+def main() -> int:
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix="agent-bench-"))
+    setup_env(workdir)
+    try:
+        out = asyncio.run(run(args, workdir))
+    finally:
+        if args.keep_workdir:
+            print(f"Workdir kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_summary(out["results"])
+    write_results(args.output, out["environment"], out["results"])
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        write_results(args.baseline, out["environment"], out["results"])
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline} (create one with --save-baseline)")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    rows = compare(out["results"], baseline.get("results", {}), args.threshold)
+    print_comparison(rows)
+    regressions = [r for r in rows if r["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
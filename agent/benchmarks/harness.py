@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+AGENT_DIR = BENCH_DIR.parent
+STUBS_DIR = BENCH_DIR / "stubs"
+
+TEST_URI = "test:///default"
+
+
+def setup_env(workdir: Path) -> None:
+    """
+    Points the agent at libvirt's in-memory test driver and a scratch
+    directory. Must run before anything under `src` is imported: module-level
+    settings (LIBVIRT_URI, CLOUDIMG_DIR, ...) are read at import time.
+    """
+    workdir.mkdir(parents=True, exist_ok=True)
+    keys = workdir / "keys"
+    keys.mkdir(exist_ok=True)
+    private_key = keys / "agent_private.pem"
+    if not private_key.exists():
+        subprocess.run(
+            ["openssl", "genpkey", "-algorithm", "ed25519", "-out", str(private_key)],
+            check=True, capture_output=True,
+        )
+
+    os.environ.update({
+        "LIBVIRT_URI": TEST_URI,
+        # the test driver only accepts <domain type='test'>
+        "VM_DOMAIN_TYPE": "test",
+        "SYSTEM": "linux",
+        "CLOUDIMG_DIR": str(workdir / "cloudimgs"),
+        "STATE_DIR": str(workdir / "state"),
+        "TRACE_FILE": str(workdir / "traces.jsonl"),
+        "AGENT_PRIVATE_KEY_PATH": str(private_key),
+        "SNAPSHOT_PRISTINE": "false",
+        "VERIFY_API_SIGNATURES": "false",
+        # test domains have no guest agent to re-identify clones through
+        "TEMPLATE_REQUIRE_REIDENTIFY": "false",
+        "PATH": f"{STUBS_DIR}{os.pathsep}{os.environ.get('PATH', '')}",
+    })
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Measurements                                 #
+# ---------------------------------------------------------------------------- #
+@dataclass
+class RunResult:
+    latencies_s: List[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed_s: float = 0.0
+    first_error: Optional[str] = None
+
+    def summary(self) -> dict:
+        lat = sorted(self.latencies_s)
+
+        def pct(p: float) -> Optional[float]:
+            if not lat:
+                return None
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 3)
+
+        done = len(lat)
+        return {
+            "requests": done + self.errors,
+            "errors": self.errors,
+            "first_error": self.first_error,
+            "p50_ms": pct(0.50),
+            "p90_ms": pct(0.90),
+            "p99_ms": pct(0.99),
+            "max_ms": pct(1.0),
+            "mean_ms": round(statistics.fmean(lat) * 1000, 3) if lat else None,
+            "throughput_rps": round(done / self.elapsed_s, 2) if self.elapsed_s else None,
+        }
+
+
+async def run_concurrent(op: Callable[[int], Awaitable[None]], concurrency: int, total: int) -> RunResult:
+    """
+    Runs `op(i)` for i in range(total) with `concurrency` workers in flight.
+    `op` raises to signal a failed request.
+    """
+    result = RunResult()
+    next_i = 0
+
+    async def worker():
+        nonlocal next_i
+        while next_i < total:
+            i = next_i
+            next_i += 1
+            t0 = time.perf_counter()
+            try:
+                await op(i)
+            except Exception as e:
+                result.errors += 1
+                if result.first_error is None:
+                    result.first_error = f"{type(e).__name__}: {e}"[:300]
+                continue
+            result.latencies_s.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed_s = time.perf_counter() - t0
+    return result
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Results                                   #
+# ---------------------------------------------------------------------------- #
+def result_key(scenario: str, vms: int, concurrency: int) -> str:
+    return f"{scenario}|vms={vms}|c={concurrency}"
+
+
+def environment_info(libvirt_version: Optional[str]) -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "libvirt": libvirt_version,
+        "timestamp": time.time(),
+    }
+
+
+def write_results(path: Path, env: dict, results: Dict[str, dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"environment": env, "results": results}, indent=2, sort_keys=True))
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[dict]:
+    """
+    Compares matching runs against a baseline. A run regresses when p50/p99
+    grow, or throughput drops, by more than `threshold` (0.25 = 25%).
+
+    :return: One row per compared metric, with "regression" set where it got worse
+    """
+    rows = []
+    for key in sorted(set(current) & set(baseline)):
+        cur, base = current[key], baseline[key]
+        for metric, higher_is_worse in (("p50_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            a, b = base.get(metric), cur.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            worse = change > threshold if higher_is_worse else change < -threshold
+            rows.append({
+                "run": key,
+                "metric": metric,
+                "baseline": a,
+                "current": b,
+                "change_pct": round(change * 100, 1),
+                "regression": worse,
+            })
+    return rows
+
+
+def print_summary(results: Dict[str, dict]) -> None:
+    print(f"{'run':<48} {'n':>6} {'err':>5} {'p50 ms':>9} {'p99 ms':>9} {'rps':>9}")
+    for key, r in results.items():
+        print(
+            f"{key:<48} {r['requests']:>6} {r['errors']:>5} "
+            f"{_fmt(r['p50_ms']):>9} {_fmt(r['p99_ms']):>9} {_fmt(r['throughput_rps']):>9}"
+        )
+
+
+def print_comparison(rows: List[dict]) -> None:
+    if not rows:
+        print("No runs in common with the baseline")
+        return
+    print(f"\n{'run':<48} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['run']:<48} {row['metric']:<15} {_fmt(row['baseline']):>10} "
+            f"{_fmt(row['current']):>10} {row['change_pct']:>7}%{flag}"
+        )
+
+
+def _fmt(v) -> str:
+    return "-" if v is None else f"{v:.2f}"
@@ -0,0 +1,324 @@
+"""
+Benchmark scenarios. Imports the agent, so `harness.setup_env` has to run first.
+"""
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+import libvirt
+
+from src.server import app
+from src.libs.virt.format import attach_seed_iso, detach_seed_iso, get_vda_path, list_cdrom_devices
+from src.libs.virt.list import __domain_to_dict__
+from src.libs.virt.cloud_init import MetaTemplate, NetworkingTemplate, UserKeyTemplate, generate_cloud_init_iso_alt
+from src.libs.store import vm_templates as template_store
+
+from .harness import TEST_URI
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "src" / "libs" / "virt" / "templates"
+SEED_PREFIX = "bench-seed-"
+CREATE_PREFIX = "bench-create-"
+CLONE_PREFIX = "bench-clone-"
+BENCH_TEMPLATE = "bench"
+
+
+@dataclass
+class Context:
+    conn: libvirt.virConnect
+    client: httpx.AsyncClient
+    workdir: Path
+    vms: int
+
+
+@dataclass
+class Scenario:
+    name: str
+    # builds op(i) for one run; op raises on failure
+    make_op: Callable[[Context], Callable[[int], Awaitable[None]]]
+    # cap on requests per run (slow scenarios), None = use --requests
+    max_requests: Optional[int] = None
+    # only these concurrency levels make sense (e.g. helpers mutating one domain)
+    concurrency: Optional[List[int]] = None
+    cleanup: Optional[Callable[[Context], None]] = None
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Test driver                                 #
+# ---------------------------------------------------------------------------- #
+def open_test_connection(workdir: Path) -> libvirt.virConnect:
+    """
+    Opens the connection that keeps test:///default alive for the whole run
+    (the driver drops its state when the last connection closes) and gives
+    it a 'default' pool under the scratch directory.
+    """
+    conn = libvirt.open(TEST_URI)
+    pool_dir = workdir / "pool"
+    pool_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        conn.storagePoolLookupByName("default")
+    except libvirt.libvirtError:
+        pool = conn.storagePoolDefineXML(
+            f"<pool type='dir'><name>default</name><target><path>{pool_dir}</path></target></pool>", 0
+        )
+        pool.create(0)
+    return conn
+
+
+def render_domain_xml(name: str, disk_path: str, index: int) -> str:
+    xml = (TEMPLATE_DIR / "vm_template.xml").read_text()
+    return xml.format(
+        domain_type="test",
+        name=name,
+        vcpus=2,
+        max_vcpus=2,
+        memory_mib=512,
+        max_memory_mib=512,
+        disk_type="file",
+        disk_format="qcow2",
+        disk_source="file",
+        disk_driver_opts="",
+        disk_path=disk_path,
+        disk_iotune="",
+        mac=f"52:54:00:{(index >> 16) & 0xff:02x}:{(index >> 8) & 0xff:02x}:{index & 0xff:02x}",
+        cputune="",
+        numatune="",
+        memory_backing="",
+        guest_agent_channel="",
+        net_in_kbps=12207, net_in_peak_kbps=24414, net_in_burst_kb=12207,
+        net_out_kbps=12207, net_out_peak_kbps=24414, net_out_burst_kb=12207,
+    )
+
+
+def seed_domains(conn: libvirt.virConnect, workdir: Path, count: int) -> None:
+    """
+    Defines bench-seed-N domains until there are `count` of them. Every other
+    one is started so listings see a mix of running and shut off VMs.
+    """
+    existing = {d.name() for d in conn.listAllDomains() if d.name().startswith(SEED_PREFIX)}
+    for i in range(count):
+        name = f"{SEED_PREFIX}{i}"
+        if name in existing:
+            continue
+        disk = workdir / "pool" / f"{name}.qcow2"
+        disk.touch()
+        dom = conn.defineXML(render_domain_xml(name, str(disk), i))
+        if i % 2 == 0:
+            dom.create()
+
+
+def _cleanup_prefix(ctx: Context, prefix: str) -> None:
+    for dom in ctx.conn.listAllDomains():
+        if not dom.name().startswith(prefix):
+            continue
+        if dom.isActive():
+            dom.destroy()
+        dom.undefine()
+    pool = ctx.conn.storagePoolLookupByName("default")
+    pool.refresh(0)
+    for vol in pool.listAllVolumes():
+        if vol.name().startswith(prefix):
+            vol.delete(0)
+
+
+def _cleanup_created(ctx: Context) -> None:
+    _cleanup_prefix(ctx, CREATE_PREFIX)
+
+
+def _cleanup_clones(ctx: Context) -> None:
+    _cleanup_prefix(ctx, CLONE_PREFIX)
+
+
+def ensure_template(conn: libvirt.virConnect, workdir: Path) -> None:
+    """
+    Stands in for a built template: a test-driver domain saved with
+    virDomainSave (the test driver writes its own small save format) and a
+    ready row in the template store. The test driver has no guest agent, so
+    clones skip re-identification (TEMPLATE_REQUIRE_REIDENTIFY=false).
+    """
+    existing = template_store.get(BENCH_TEMPLATE)
+    if existing is not None and existing["state"] == "ready":
+        return
+    tdir = workdir / "pool" / ".templates" / BENCH_TEMPLATE
+    tdir.mkdir(parents=True, exist_ok=True)
+    disk = tdir / "disk.qcow2"
+    disk.touch()
+    dom = conn.defineXML(render_domain_xml(f"tmpl-{BENCH_TEMPLATE}", str(disk), 0xffffff))
+    interface = ET.fromstring(dom.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE)).find("./devices/interface")
+    dom.create()
+    save_path = tdir / "state.save"
+    dom.save(str(save_path))
+    dom.undefine()
+    template_store.begin_build(BENCH_TEMPLATE)
+    template_store.mark_ready(
+        BENCH_TEMPLATE,
+        disk_path=str(disk),
+        save_path=str(save_path),
+        interface_xml=ET.tostring(interface, encoding="unicode"),
+        vcpus=2,
+        memory_mib=512,
+        disk_bytes=10 * 1024 ** 3,
+        image_bytes=save_path.stat().st_size,
+        build_ms=0,
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Scenarios                                  #
+# ---------------------------------------------------------------------------- #
+def _expect_ok(r: httpx.Response) -> None:
+    if r.status_code >= 400:
+        raise RuntimeError(f"HTTP {r.status_code}: {r.text[:200]}")
+
+
+def _list_vms(ctx: Context):
+    async def op(i: int):
+        _expect_ok(await ctx.client.get("/api/v1/vms/"))
+    return op
+
+
+def _get_vm(ctx: Context):
+    async def op(i: int):
+        _expect_ok(await ctx.client.get(f"/api/v1/vms/{SEED_PREFIX}{i % ctx.vms}"))
+    return op
+
+
+def _info(ctx: Context):
+    async def op(i: int):
+        _expect_ok(await ctx.client.get("/api/v1/info/", params={"sample_interval": 0}))
+    return op
+
+
+_create_runs = 0
+
+
+def _create_vm(ctx: Context):
+    global _create_runs
+    _create_runs += 1
+    run = _create_runs
+
+    async def op(i: int):
+        body = {
+            "vm_id": f"{CREATE_PREFIX}{run}-{i}",
+            "vm": {
+                "vcpus": 1,
+                "memory": 512,
+                "disk_size": 10,
+                "mac": f"52:54:01:{run & 0xff:02x}:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}",
+                "network": {
+                    "in_avg_mbps": 100, "in_peak_mbps": 200, "in_burst_mbps": 100,
+                    "out_avg_mbps": 100, "out_peak_mbps": 200, "out_burst_mbps": 100,
+                },
+            },
+        }
+        _expect_ok(await ctx.client.post("/api/v1/vms/", json=body))
+    return op
+
+
+_clone_runs = 0
+
+
+def _template_clone(ctx: Context):
+    global _clone_runs
+    _clone_runs += 1
+    run = _clone_runs
+    ensure_template(ctx.conn, ctx.workdir)
+
+    async def op(i: int):
+        body = {
+            "vm_id": f"{CLONE_PREFIX}{run}-{i}",
+            "host": {"hostname": f"clone-{i}", "username": "bench", "public_key": "ssh-ed25519 AAAA bench"},
+            "network": {
+                "mac_address": f"52:54:02:{run & 0xff:02x}:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}",
+                "ip_cidr": "10.0.0.10",
+                "gateway": "10.0.0.1",
+            },
+            "bandwidth": {
+                "in_avg_mbps": 100, "in_peak_mbps": 200, "in_burst_mbps": 100,
+                "out_avg_mbps": 100, "out_peak_mbps": 200, "out_burst_mbps": 100,
+            },
+        }
+        r = await ctx.client.post(f"/api/v1/templates/{BENCH_TEMPLATE}/clone", json=body)
+        _expect_ok(r)
+        job_id = r.json()["job"]["id"]
+        # the clone is a job: the latency is until it finished, not the 202
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            r = await ctx.client.get(f"/api/v1/jobs/{job_id}")
+            _expect_ok(r)
+            job = r.json()["job"]
+            if job["status"] == "succeeded":
+                return
+            if job["status"] in ("failed", "cancelled"):
+                raise RuntimeError(f"clone job {job['status']}: {job.get('error')}")
+            await asyncio.sleep(0.005)
+        raise RuntimeError("clone job did not finish within 60s")
+    return op
+
+
+def _domain_to_dict(ctx: Context):
+    domains = [d for d in ctx.conn.listAllDomains() if d.name().startswith(SEED_PREFIX)]
+
+    async def op(i: int):
+        __domain_to_dict__(domains[i % len(domains)])
+    return op
+
+
+def _format_helpers(ctx: Context):
+    # odd seeds are shut off, like a VM in the middle of a format
+    stopped = [ctx.conn.lookupByName(f"{SEED_PREFIX}{i}") for i in range(1, ctx.vms, 2)]
+    iso = ctx.workdir / "bench-seed.iso"
+    iso.touch()
+
+    def step(i: int):
+        dom = stopped[i % len(stopped)]
+        get_vda_path(dom)
+        attach_seed_iso(dom, str(iso), "sda")
+        list_cdrom_devices(dom)
+        detach_seed_iso(dom, seed_iso_path=str(iso))
+
+    async def op(i: int):
+        await asyncio.to_thread(step, i)
+    return op
+
+
+def _cloud_init_iso(ctx: Context):
+    out_dir = ctx.workdir / "seeds"
+    out_dir.mkdir(exist_ok=True)
+
+    def step(i: int):
+        generate_cloud_init_iso_alt(
+            MetaTemplate(vm_id=f"vm-{i}", hostname=f"vm-{i}"),
+            NetworkingTemplate(
+                mac_address="52:54:00:00:00:01",
+                ip_cidr="10.0.0.10/24",
+                gateway="10.0.0.1",
+                dns_servers=["1.1.1.1"],
+            ),
+            UserKeyTemplate(hostname=f"vm-{i}", username="bench", ssh_public_key="ssh-ed25519 AAAA bench"),
+            str(out_dir / f"vm-{i}-seed.iso"),
+        )
+
+    async def op(i: int):
+        await asyncio.to_thread(step, i)
+    return op
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("list_vms", _list_vms),
+    Scenario("get_vm", _get_vm),
+    Scenario("domain_to_dict", _domain_to_dict, concurrency=[1]),
+    Scenario("info", _info, max_requests=50),
+    Scenario("create_vm", _create_vm, max_requests=50, cleanup=_cleanup_created),
+    Scenario("template_clone", _template_clone, max_requests=50, cleanup=_cleanup_clones),
+    Scenario("format_helpers", _format_helpers, concurrency=[1]),
+    Scenario("cloud_init_iso", _cloud_init_iso, max_requests=50, concurrency=[1, 8]),
+]
+
+
+def make_client() -> httpx.AsyncClient:
+    # in-process: requests go straight into the ASGI app, no sockets involved
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://agent.bench")
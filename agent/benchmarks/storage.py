@@ -0,0 +1,193 @@
+"""
+Disk backend benchmark: qcow2 file, raw sparse file and raw block devices
+(a loop device, optionally an LVM thin LV on one), driven by `qemu-img bench`
+with O_DIRECT and native AIO, the way QEMU does I/O for a cache='none' disk.
+
+    python -m benchmarks.storage                        # qcow2 and raw files in a temp dir
+    sudo python -m benchmarks.storage --loop --lvm      # plus a loop device and an LVM thin LV
+    python -m benchmarks.storage --dir /srv/nvme --size-gb 4 --block-sizes 4k,64k
+
+Each backend is created fresh per block size and measured three times:
+first write (allocating: qcow2 clusters, file extents, thin chunks),
+overwrite of the now allocated space, and read. Needs the real qemu-img
+(benchmarks/stubs only fakes it), root for --loop/--lvm. Run from the agent/ directory.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from .harness import BENCH_DIR, environment_info, write_results
+
+PHASES = ("first_write", "overwrite", "read")
+
+_COMPLETED = re.compile(r"Run completed in ([0-9.]+) seconds")
+_UNITS = {"k": 1024, "m": 1024 ** 2}
+
+
+def _size(s: str) -> int:
+    s = s.strip().lower()
+    if s and s[-1] in _UNITS:
+        return int(s[:-1]) * _UNITS[s[-1]]
+    return int(s)
+
+
+def _run(*cmd: str) -> str:
+    return subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _qemu_img() -> str:
+    path = shutil.which("qemu-img")
+    if not path or Path(path).resolve().parent == BENCH_DIR / "stubs":
+        sys.exit("The real qemu-img is needed (apt install qemu-utils)")
+    return path
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Backends                                   #
+# ---------------------------------------------------------------------------- #
+@contextmanager
+def _file_backend(workdir: Path, fmt: str, size: int) -> Iterator[Tuple[str, str]]:
+    path = workdir / f"bench.{fmt}"
+    if fmt == "qcow2":
+        # same layout the pool creates for VM disks: no preallocation, 64k clusters
+        _run(_qemu_img(), "create", "-q", "-f", "qcow2", str(path), str(size))
+    else:
+        with open(path, "wb") as f:
+            f.truncate(size)
+    try:
+        yield fmt, str(path)
+    finally:
+        path.unlink(missing_ok=True)
+
+
+@contextmanager
+def _loop_device(workdir: Path, size: int, name: str) -> Iterator[str]:
+    backing = workdir / f"{name}.img"
+    with open(backing, "wb") as f:
+        f.truncate(size)
+    dev = _run("losetup", "--find", "--show", "--direct-io=on", str(backing))
+    try:
+        yield dev
+    finally:
+        subprocess.run(["losetup", "-d", dev], capture_output=True)
+        backing.unlink(missing_ok=True)
+
+
+@contextmanager
+def _loop_backend(workdir: Path, size: int) -> Iterator[Tuple[str, str]]:
+    with _loop_device(workdir, size, "loop") as dev:
+        yield "raw", dev
+
+
+@contextmanager
+def _lvm_thin_backend(workdir: Path, size: int) -> Iterator[Tuple[str, str]]:
+    vg = f"benchvg{uuid.uuid4().hex[:8]}"
+    # room for the thin pool's metadata on top of the volume
+    with _loop_device(workdir, size + 256 * 1024 ** 2, "lvm") as dev:
+        _run("pvcreate", "-q", "-y", dev)
+        try:
+            _run("vgcreate", "-q", vg, dev)
+            _run("lvcreate", "-q", "-y", "--type", "thin-pool", "-l", "90%FREE", "-n", "pool", vg)
+            _run("lvcreate", "-q", "-y", "--thin", "-V", f"{size}b", "-n", "bench", f"{vg}/pool")
+            yield "raw", f"/dev/{vg}/bench"
+        finally:
+            subprocess.run(["vgremove", "-q", "-f", vg], capture_output=True)
+            subprocess.run(["pvremove", "-q", "-y", dev], capture_output=True)
+
+
+def _backend(name: str, workdir: Path, size: int):
+    if name in ("qcow2", "raw"):
+        return _file_backend(workdir, name, size)
+    if name == "loop":
+        return _loop_backend(workdir, size)
+    return _lvm_thin_backend(workdir, size)
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Measurements                                 #
+# ---------------------------------------------------------------------------- #
+def _bench(fmt: str, path: str, write: bool, block_size: int, count: int, depth: int) -> float:
+    cmd = [
+        _qemu_img(), "bench", "-f", fmt, "-t", "none", "-i", "native",
+        "-c", str(count), "-s", str(block_size), "-d", str(depth),
+    ]
+    if write:
+        cmd.append("-w")
+    out = _run(*cmd, path)
+    match = _COMPLETED.search(out)
+    if not match:
+        raise RuntimeError(f"Unexpected qemu-img bench output: {out}")
+    return float(match.group(1))
+
+
+def run_backend(name: str, workdir: Path, size: int, block_size: int, depth: int) -> Dict[str, dict]:
+    count = size // block_size
+    results = {}
+    with _backend(name, workdir, size) as (fmt, path):
+        for phase in PHASES:
+            seconds = _bench(fmt, path, phase != "read", block_size, count, depth)
+            results[phase] = {
+                "seconds": round(seconds, 3),
+                "mb_s": round(count * block_size / seconds / 1024 ** 2, 1) if seconds else None,
+                "iops": round(count / seconds) if seconds else None,
+            }
+    return results
+
+
+def parse_args():
+    p = argparse.ArgumentParser(prog="python -m benchmarks.storage", description="Disk backend benchmark")
+    p.add_argument("--dir", type=Path, default=None, help="where the files and loop backing files go (default: a temp dir)")
+    p.add_argument("--size-gb", type=float, default=1.0, help="bytes written per phase (default 1 GiB)")
+    p.add_argument("--block-sizes", type=lambda s: [_size(x) for x in s.split(",")], default=[4096, 65536],
+                   help="request sizes (default 4k,64k)")
+    p.add_argument("--depth", type=int, default=32, help="requests in flight (default 32)")
+    p.add_argument("--loop", action="store_true", help="also a raw loop device (root)")
+    p.add_argument("--lvm", action="store_true", help="also an LVM thin LV on a loop device (root, lvm2)")
+    p.add_argument("--output", type=Path, default=BENCH_DIR / "results" / "storage.json")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    _qemu_img()
+    backends: List[str] = ["qcow2", "raw"]
+    if args.loop:
+        backends.append("loop")
+    if args.lvm:
+        if not shutil.which("lvcreate"):
+            sys.exit("--lvm needs lvm2")
+        backends.append("lvm-thin")
+    if (args.loop or args.lvm) and os.geteuid() != 0:
+        sys.exit("--loop and --lvm need root")
+
+    size = int(args.size_gb * 1024 ** 3)
+    workdir = Path(tempfile.mkdtemp(prefix="storage-bench-", dir=args.dir))
+    results = {}
+    try:
+        for block_size in args.block_sizes:
+            for name in backends:
+                for phase, res in run_backend(name, workdir, size, block_size, args.depth).items():
+                    key = f"{name}|bs={block_size}|{phase}"
+                    results[key] = res
+                    print(f"  {key}: {res['mb_s']} MB/s, {res['iops']} IOPS")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    env = environment_info(None)
+    env["qemu_img"] = _run(_qemu_img(), "--version").splitlines()[0]
+    env["size_bytes"] = size
+    env["depth"] = args.depth
+    write_results(args.output, env, results)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,11 @@ import time
 from pathlib import Path
 from typing import Optional
 
-from src.libs.crypto.crypto import agent_get
+from src.libs.controlplane import client as controlplane
+from src.libs.telemetry.tracing import span
+from src.libs.store import images as image_index
+from src.libs.store.db import owner_alive
+from src.libs.store.locks import ProcessLock, process_lock
 
 CLOUDIMG_DIR = Path(os.getenv("CLOUDIMG_DIR", "./.cache/cloudimgs")).resolve()
 _SAFE_NAME = re.compile(r"^[a-zA-Z0-9._-]+$")
@@ -37,24 +41,29 @@ def get_cloudimg_path(os_name: str) -> Path:
     return p
 
 
-def _acquire_lock(lock_path: Path, timeout_s: int = 300) -> None:
-    deadline = time.time() + timeout_s
-    while True:
-        try:
-            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-            os.close(fd)
-            return
-        except FileExistsError:
-            if time.time() > deadline:
-                raise TimeoutError(f"Timed out waiting for lock: {lock_path}")
-            time.sleep(0.25)
-
-
-def _release_lock(lock_path: Path) -> None:
+def lock_is_stale(lock_path: Path) -> bool:
+    """
+    For "<os>.qcow2.lock" files left in CLOUDIMG_DIR by older agents, which
+    locked downloads with an O_EXCL file. Such a lock is stale when the process
+    named in it is gone, or, without an owner, once it is an hour old.
+    """
     try:
-        lock_path.unlink()
+        owner = lock_path.read_text().strip()
+        age = time.time() - lock_path.stat().st_mtime
     except FileNotFoundError:
-        pass
+        return False
+    if not owner:
+        return age > 3600
+    return not owner_alive(owner)
+
+
+def download_lock(os_name: str) -> ProcessLock:
+    """
+    Serializes downloads of one image across threads and workers. flock is
+    dropped by the kernel when its holder dies, so a crash leaves nothing to
+    take over.
+    """
+    return process_lock(f"cloudimg-{_validate_name(os_name)}")
 
 
 def download_cloudimg(os_name: str, url: str, sha256: Optional[str] = None) -> Path:
@@ -62,9 +71,10 @@ def download_cloudimg(os_name: str, url: str, sha256: Optional[str] = None) -> P
 
     dst = _img_path(os_name)
     part = dst.with_suffix(dst.suffix + ".part")
-    lock = dst.with_suffix(dst.suffix + ".lock")
+    lock = download_lock(os_name)
 
-    _acquire_lock(lock)
+    if not lock.acquire(timeout=300):
+        raise TimeoutError(f"Timed out waiting for lock: {lock.path}")
     try:
         if dst.exists():
             return dst
@@ -72,7 +82,7 @@ def download_cloudimg(os_name: str, url: str, sha256: Optional[str] = None) -> P
         if part.exists():
             part.unlink()
 
-        with agent_get(url, stream=True, timeout=(10, 300)) as r:
+        with span("cloudimg.download", os=os_name) as s, controlplane.get(url, stream=True, timeout=(10, 300)) as r:
             r.raise_for_status()
 
             ct = (r.headers.get("Content-Type") or "").lower()
@@ -92,6 +102,8 @@ def download_cloudimg(os_name: str, url: str, sha256: Optional[str] = None) -> P
                     if h:
                         h.update(chunk)
 
+            s.set(bytes=part.stat().st_size)
+
         if sha256 and h:
             got = h.hexdigest().lower()
             if got != sha256.lower():
@@ -99,15 +111,18 @@ def download_cloudimg(os_name: str, url: str, sha256: Optional[str] = None) -> P
                 raise ValueError(f"SHA256 mismatch for {os_name}: expected {sha256}, got {got}")
 
         os.replace(part, dst)
+        image_index.record_download(os_name, str(dst), url, sha256, dst.stat().st_size)
         return dst
 
     finally:
         part.unlink(missing_ok=True)
-        _release_lock(lock)
+        lock.release()
 
 
 def ensure_cloudimg(os_name: str, url: str, sha256: Optional[str] = None) -> Path:
     try:
-        return get_cloudimg_path(os_name)
+        path = get_cloudimg_path(os_name)
+        image_index.touch(os_name, str(path))
+        return path
     except FileNotFoundError:
         return download_cloudimg(os_name, url, sha256)
@@ -0,0 +1,285 @@
+import asyncio
+import errno
+import os
+import socket
+import termios
+import threading
+import time
+import tty
+import uuid
+import xml.etree.ElementTree as ET
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+import libvirt
+from dotenv import load_dotenv
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+load_dotenv()
+
+CONSOLE_MAX_SESSIONS = int(os.getenv("CONSOLE_MAX_SESSIONS", "256"))
+CONSOLE_BUFFER_SIZE = int(os.getenv("CONSOLE_BUFFER_SIZE", str(64 * 1024)))
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Buffer reuse                                 #
+# ---------------------------------------------------------------------------- #
+class _BufferPool:
+    """
+    Keeps relay buffers around between sessions so a busy host doesn't
+    allocate (and zero) 64 KiB per direction for every new console.
+    """
+
+    def __init__(self, size: int, keep: int):
+        self.size = size
+        self.keep = keep
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.size)
+
+    def put(self, buf: bytearray) -> None:
+        with self._lock:
+            if len(self._free) < self.keep:
+                self._free.append(buf)
+
+
+_BUFFERS = _BufferPool(CONSOLE_BUFFER_SIZE, keep=64)
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Stats                                     #
+# ---------------------------------------------------------------------------- #
+@dataclass
+class ConsoleSession:
+    vm_id: str
+    kind: str
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    started_at: float = field(default_factory=time.time)
+    ended_at: Optional[float] = None
+    bytes_to_client: int = 0
+    bytes_from_client: int = 0
+    chunks_to_client: int = 0
+    # seconds between reading a chunk from QEMU and the websocket accepting it
+    relay_latency_s: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+    def to_dict(self) -> dict:
+        end = self.ended_at or time.time()
+        duration = max(end - self.started_at, 1e-9)
+        lat = sorted(self.relay_latency_s)
+
+        def pct(p: float) -> Optional[float]:
+            if not lat:
+                return None
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 3)
+
+        return {
+            "id": self.id,
+            "vm_id": self.vm_id,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "duration_s": round(duration, 3),
+            "bytes_to_client": self.bytes_to_client,
+            "bytes_from_client": self.bytes_from_client,
+            "throughput_to_client_bps": round(self.bytes_to_client * 8 / duration, 1),
+            "throughput_from_client_bps": round(self.bytes_from_client * 8 / duration, 1),
+            "relay_latency_ms": {"p50": pct(0.50), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+
+_SESSIONS: Dict[str, ConsoleSession] = {}
+_RECENT: Deque[ConsoleSession] = deque(maxlen=100)
+_TOTALS = {"sessions": 0, "rejected": 0, "bytes_to_client": 0, "bytes_from_client": 0}
+
+
+def console_stats() -> dict:
+    return {
+        "active": len(_SESSIONS),
+        "max_sessions": CONSOLE_MAX_SESSIONS,
+        "totals": dict(_TOTALS),
+        "sessions": [s.to_dict() for s in _SESSIONS.values()],
+        "recent": [s.to_dict() for s in _RECENT],
+    }
+
+
+def try_open_session(vm_id: str, kind: str) -> Optional[ConsoleSession]:
+    """
+    Registers a session, or returns None when the host is at CONSOLE_MAX_SESSIONS.
+    Only called from the event loop, so no locking is needed.
+    """
+    if len(_SESSIONS) >= CONSOLE_MAX_SESSIONS:
+        _TOTALS["rejected"] += 1
+        return None
+    session = ConsoleSession(vm_id=vm_id, kind=kind)
+    _SESSIONS[session.id] = session
+    _TOTALS["sessions"] += 1
+    return session
+
+
+def close_session(session: ConsoleSession) -> None:
+    session.ended_at = time.time()
+    _SESSIONS.pop(session.id, None)
+    _RECENT.append(session)
+    _TOTALS["bytes_to_client"] += session.bytes_to_client
+    _TOTALS["bytes_from_client"] += session.bytes_from_client
+
+
+# ---------------------------------------------------------------------------- #
+#                              Endpoint discovery                              #
+# ---------------------------------------------------------------------------- #
+def console_endpoint(domain: libvirt.virDomain, kind: str) -> Tuple[str, str, int]:
+    """
+    Finds where QEMU exposes the console from the live domain XML.
+
+    :param kind: "vnc" or "serial"
+    :return: ("tcp", host, port) for VNC or ("pty", path, 0) for the serial console
+    :raises LookupError: VM not running or console not configured
+    """
+    if not domain.isActive():
+        raise LookupError("VM is not running")
+    root = ET.fromstring(domain.XMLDesc(0))
+
+    if kind == "vnc":
+        gfx = root.find("./devices/graphics[@type='vnc']")
+        if gfx is None or not gfx.get("port") or gfx.get("port") == "-1":
+            raise LookupError("VM has no VNC server")
+        listen = gfx.get("listen") or "127.0.0.1"
+        if listen in ("0.0.0.0", "::"):
+            listen = "127.0.0.1"
+        return "tcp", listen, int(gfx.get("port"))
+
+    for xpath in ("./devices/console[@type='pty']/source", "./devices/serial[@type='pty']/source"):
+        src = root.find(xpath)
+        if src is not None and src.get("path"):
+            return "pty", src.get("path"), 0
+    raise LookupError("VM has no pty serial console")
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Relays                                    #
+# ---------------------------------------------------------------------------- #
+async def _ws_to_backend(websocket: WebSocket, session: ConsoleSession, write) -> None:
+    while True:
+        msg = await websocket.receive()
+        if msg["type"] == "websocket.disconnect":
+            return
+        data = msg.get("bytes")
+        if data is None:
+            text = msg.get("text")
+            if text is None:
+                continue
+            data = text.encode("utf-8")
+        session.bytes_from_client += len(data)
+        # awaiting the write is the backpressure: we don't read the next
+        # websocket frame until the backend took this one
+        await write(data)
+
+
+async def _backend_to_ws(websocket: WebSocket, session: ConsoleSession, readinto, buf: bytearray) -> None:
+    view = memoryview(buf)
+    while True:
+        n = await readinto(view)
+        if n == 0:
+            return
+        t0 = time.perf_counter()
+        # websocket send awaits the transport's flow control, so a slow client
+        # stops us from reading QEMU, which in turn throttles the guest
+        await websocket.send_bytes(bytes(view[:n]))
+        session.relay_latency_s.append(time.perf_counter() - t0)
+        session.bytes_to_client += n
+        session.chunks_to_client += 1
+
+
+async def _pump(websocket: WebSocket, session: ConsoleSession, readinto, write) -> None:
+    buf = _BUFFERS.get()
+    tasks = [
+        asyncio.create_task(_ws_to_backend(websocket, session, write)),
+        asyncio.create_task(_backend_to_ws(websocket, session, readinto, buf)),
+    ]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for t in done:
+            exc = t.exception()
+            if exc is not None and not isinstance(exc, (WebSocketDisconnect, ConnectionError)):
+                raise exc
+    finally:
+        _BUFFERS.put(buf)
+
+
+async def relay_tcp(websocket: WebSocket, session: ConsoleSession, host: str, port: int) -> None:
+    """
+    Relays a websocket to a TCP endpoint (QEMU's VNC server).
+    """
+    loop = asyncio.get_running_loop()
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        await loop.sock_connect(sock, (host, port))
+
+        async def readinto(view: memoryview) -> int:
+            return await loop.sock_recv_into(sock, view)
+
+        async def write(data: bytes) -> None:
+            await loop.sock_sendall(sock, data)
+
+        await _pump(websocket, session, readinto, write)
+    finally:
+        sock.close()
+
+
+async def relay_pty(websocket: WebSocket, session: ConsoleSession, path: str) -> None:
+    """
+    Relays a websocket to QEMU's serial pty.
+    """
+    loop = asyncio.get_running_loop()
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd, termios.TCSANOW)
+
+        async def readinto(view: memoryview) -> int:
+            while True:
+                try:
+                    return os.readv(fd, [view])
+                except BlockingIOError:
+                    pass
+                except OSError as e:
+                    if e.errno == errno.EIO:  # VM went away
+                        return 0
+                    raise
+                ready = loop.create_future()
+                loop.add_reader(fd, ready.set_result, None)
+                try:
+                    await ready
+                finally:
+                    loop.remove_reader(fd)
+
+        async def write(data: bytes) -> None:
+            view = memoryview(data)
+            while view:
+                try:
+                    n = os.write(fd, view)
+                    view = view[n:]
+                    continue
+                except BlockingIOError:
+                    pass
+                ready = loop.create_future()
+                loop.add_writer(fd, ready.set_result, None)
+                try:
+                    await ready
+                finally:
+                    loop.remove_writer(fd)
+
+        await _pump(websocket, session, readinto, write)
+    finally:
+        os.close(fd)
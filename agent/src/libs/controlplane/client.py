@@ -0,0 +1,171 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from src.libs.crypto.crypto import sign_headers
+from src.libs.telemetry.tracing import span
+
+load_dotenv()
+
+CONTROLPLANE_POOL_SIZE = int(os.getenv("CONTROLPLANE_POOL_SIZE", "16"))
+CONTROLPLANE_RETRIES = int(os.getenv("CONTROLPLANE_RETRIES", "3"))
+CONTROLPLANE_BACKOFF_S = float(os.getenv("CONTROLPLANE_BACKOFF_S", "0.5"))
+CONTROLPLANE_BACKOFF_MAX_S = float(os.getenv("CONTROLPLANE_BACKOFF_MAX_S", "10"))
+DEFAULT_TIMEOUT = (10, 60)
+
+# Safe to send twice: the control plane must not see a side effect happen twice
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_LATENCY_S: deque = deque(maxlen=2048)
+_TOTALS = {"requests": 0, "retries": 0, "errors": 0}
+
+
+def get_session() -> requests.Session:
+    """
+    Shared keep-alive session: one TCP/TLS connection per host is reused
+    across calls instead of a new handshake for every request.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                # retries are done by hand below, so every attempt gets a fresh nonce
+                adapter = HTTPAdapter(
+                    pool_connections=CONTROLPLANE_POOL_SIZE,
+                    pool_maxsize=CONTROLPLANE_POOL_SIZE,
+                    max_retries=0,
+                )
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def _path_with_query(url: str, params: Optional[dict]) -> str:
+    # Build path+query exactly how Fastify verifies it
+    u = urlsplit(url)
+    if params:
+        return u.path + "?" + urlencode(params, doseq=True)
+    return u.path + (("?" + u.query) if u.query else "")
+
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": spreads retries of many agents hitting the same outage
+    return random.uniform(0, min(CONTROLPLANE_BACKOFF_MAX_S, CONTROLPLANE_BACKOFF_S * 2 ** attempt))
+
+
+def request(method: str, url: str, params: Optional[dict] = None, range_header: str = "", **kwargs) -> requests.Response:
+    """
+    Signed request to a FULL control plane url, over the shared pool.
+    Idempotent methods are retried on connection errors and 429/502/503/504.
+    Supports requests kwargs like stream=True, timeout=(10,300), json=..., etc.
+
+    :raises requests.RequestException: last error once retries are exhausted
+    """
+    method = method.upper()
+    path_with_query = _path_with_query(url, params)
+    extra_headers = kwargs.pop("headers", {}) or {}
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    retries = CONTROLPLANE_RETRIES if method in IDEMPOTENT_METHODS else 0
+    session = get_session()
+
+    attempt = 0
+    while True:
+        headers = dict(extra_headers)
+        headers.update(sign_headers(method, path_with_query, range_header=range_header))
+        if range_header:
+            headers["Range"] = range_header
+
+        t0 = time.perf_counter()
+        _TOTALS["requests"] += 1
+        try:
+            with span("controlplane.request", method=method, path=path_with_query, attempt=attempt) as s:
+                r = session.request(method, url, params=params, headers=headers, **kwargs)
+                s.set(status=r.status_code)
+        except (requests.ConnectionError, requests.Timeout):
+            _TOTALS["errors"] += 1
+            if attempt >= retries:
+                raise
+        else:
+            # with stream=True this is time to headers, not to the last byte
+            _LATENCY_S.append(time.perf_counter() - t0)
+            if r.status_code not in RETRY_STATUSES or attempt >= retries:
+                return r
+            r.close()
+
+        delay = _backoff(attempt)
+        attempt += 1
+        _TOTALS["retries"] += 1
+        print(f"Control plane {method} {path_with_query}: retry {attempt}/{retries} in {delay:.2f}s")
+        time.sleep(delay)
+
+
+def get(url: str, params: Optional[dict] = None, range_header: str = "", **kwargs) -> requests.Response:
+    return request("GET", url, params=params, range_header=range_header, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+async def arequest(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    `request` for event-loop code paths: the blocking I/O runs in a worker
+    thread so the loop keeps serving other requests. Don't use stream=True
+    here, reading the body would block the loop again.
+    """
+    return await asyncio.to_thread(request, method, url, **kwargs)
+
+
+async def aget(url: str, **kwargs) -> requests.Response:
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url: str, **kwargs) -> requests.Response:
+    return await arequest("POST", url, **kwargs)
+
+
+def client_stats() -> dict:
+    """
+    Connection reuse (urllib3 pool counters) and request latency.
+    """
+    connections = 0
+    pooled_requests = 0
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                try:
+                    pool = pools[key]
+                except KeyError:
+                    continue
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+
+    lat = sorted(_LATENCY_S)
+
+    def pct(p: float):
+        if not lat:
+            return None
+        return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 2)
+
+    return {
+        "totals": dict(_TOTALS),
+        "connections_opened": connections,
+        "connection_reuse_ratio": round(1 - connections / pooled_requests, 3) if pooled_requests else None,
+        "latency_ms": {"p50": pct(0.50), "p99": pct(0.99), "max": pct(1.0), "samples": len(lat)},
+    }
@@ -0,0 +1,152 @@
+import base64
+import json
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from dotenv import load_dotenv
+
+from src.libs.store import nonces as nonce_store
+
+load_dotenv()
+
+API_PUBLIC_KEY_PATH = os.getenv("API_PUBLIC_KEY_PATH", "/etc/agent/api_public.pem")
+
+
+@lru_cache(maxsize=1)
+def get_api_public_key() -> Ed25519PublicKey:
+    """
+    Control plane (web API) Ed25519 public key. Parsed once, then cached.
+    """
+    key = load_pem_public_key(Path(API_PUBLIC_KEY_PATH).read_bytes())
+    if not isinstance(key, Ed25519PublicKey):
+        raise ValueError(f"{API_PUBLIC_KEY_PATH} is not an Ed25519 public key")
+    return key
+
+
+def _b64url_decode(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def verify_console_token(token: str, vm_id: str) -> dict:
+    """
+    Validates a console token minted by the control plane:
+    `base64url(json payload) + "." + base64url(Ed25519 signature of the first part)`.
+
+    Payload: {"typ": "vm-console", "vm": "<vm_id>", "kind": "vnc|serial", "exp": <unix seconds>,
+              "jti": "<unique id>"}
+
+    Tokens are single use: the jti is remembered (in the shared nonce
+    table) until exp, so a captured token can't reopen the console.
+
+    :return: Decoded payload
+    :rtype: dict
+    :raises ValueError: malformed, expired, reused, wrong VM or bad signature
+    """
+    try:
+        body_b64, sig_b64 = token.split(".", 1)
+        body = body_b64.encode("ascii")
+        sig = _b64url_decode(sig_b64)
+    except ValueError:
+        raise ValueError("Malformed console token")
+
+    try:
+        get_api_public_key().verify(sig, body)
+    except InvalidSignature:
+        raise ValueError("Bad console token signature")
+
+    payload = json.loads(_b64url_decode(body_b64))
+    if payload.get("typ") != "vm-console":
+        raise ValueError("Wrong token type")
+    if payload.get("vm") != vm_id:
+        raise ValueError("Token is for another VM")
+    exp = int(payload.get("exp", 0))
+    if exp < time.time():
+        raise ValueError("Console token expired")
+    jti = payload.get("jti")
+    if not isinstance(jti, str) or not jti:
+        raise ValueError("Console token has no jti")
+    if not nonce_store.add(f"console:{jti}", exp - time.time() + 1):
+        raise ValueError("Console token was already used")
+    return payload
+
+
+# ---------------------------------------------------------------------------- #
+#                         API -> agent request signatures                      #
+# ---------------------------------------------------------------------------- #
+# Same scheme as crypto.sign_headers (agent -> API), mirrored:
+#   canonical = f"{method}\n{path_with_query}\n{ts}\n{nonce}\n{range}\n"
+SIGNATURE_MAX_SKEW_S = int(os.getenv("SIGNATURE_MAX_SKEW_S", "60"))
+# the timestamp window is +-skew, so a nonce has to be remembered for 2*skew
+NONCE_TTL_S = 2 * SIGNATURE_MAX_SKEW_S
+
+_VERIFY_LATENCY_S: deque = deque(maxlen=4096)
+_VERIFY_TOTALS = {"ok": 0, "rejected": 0}
+
+
+def verify_request_signature(method: str, path_with_query: str, headers) -> None:
+    """
+    Checks the X-Timestamp / X-Nonce / X-Signature headers of a control plane request.
+
+    :param headers: Mapping with case-insensitive lookups (Starlette Headers)
+    :raises ValueError: missing headers, stale timestamp, replay or bad signature
+    """
+    t0 = time.perf_counter()
+    try:
+        ts = headers.get("x-timestamp")
+        nonce = headers.get("x-nonce")
+        sig_b64 = headers.get("x-signature")
+        if not ts or not nonce or not sig_b64:
+            raise ValueError("missing auth headers")
+
+        try:
+            ts_num = int(ts)
+        except ValueError:
+            raise ValueError("bad timestamp")
+        if abs(time.time() - ts_num) > SIGNATURE_MAX_SKEW_S:
+            raise ValueError("timestamp out of range")
+
+        range_header = headers.get("range", "")
+        canonical = f"{method}\n{path_with_query}\n{ts}\n{nonce}\n{range_header}\n"
+        try:
+            get_api_public_key().verify(base64.b64decode(sig_b64), canonical.encode("utf-8"))
+        except (InvalidSignature, ValueError):
+            raise ValueError("bad signature")
+
+        # only remember nonces of genuine requests, so garbage can't fill the table;
+        # the table is shared, so a replay to another worker is caught too
+        if not nonce_store.add(nonce, NONCE_TTL_S):
+            raise ValueError("replay detected")
+        _VERIFY_TOTALS["ok"] += 1
+    except ValueError:
+        _VERIFY_TOTALS["rejected"] += 1
+        raise
+    finally:
+        _VERIFY_LATENCY_S.append(time.perf_counter() - t0)
+
+
+def signature_stats() -> dict:
+    lat = sorted(_VERIFY_LATENCY_S)
+
+    def pct(p: float):
+        if not lat:
+            return None
+        return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1e6, 1)
+
+    return {
+        "totals": dict(_VERIFY_TOTALS),
+        "nonce_cache": {"size": nonce_store.count(), "ttl_s": NONCE_TTL_S},
+        "verify_latency_us": {"p50": pct(0.50), "p99": pct(0.99), "max": pct(1.0), "samples": len(lat)},
+    }
+
+
+def prune_nonces() -> None:
+    """
+    Periodic task: forgets nonces older than the timestamp window.
+    """
+    nonce_store.prune()
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.cloudimgs.check import CLOUDIMG_DIR
+from src.libs.jobs.jobs import queue_depth
+from src.libs.store.db import STATE_DB_PATH, get_db
+from src.libs.virt.connection import get_connection_read_only
+from src.libs.virt.storage_pools import STORAGE_POOLS
+
+load_dotenv()
+
+HEALTH_CHECK_INTERVAL_S = float(os.getenv("HEALTH_CHECK_INTERVAL_S", "10"))
+# empty = every pool in STORAGE_POOLS
+HEALTH_POOL_NAME = os.getenv("HEALTH_POOL_NAME", "")
+HEALTH_MIN_POOL_FREE_GB = float(os.getenv("HEALTH_MIN_POOL_FREE_GB", "5"))
+HEALTH_MIN_CACHE_FREE_GB = float(os.getenv("HEALTH_MIN_CACHE_FREE_GB", "5"))
+HEALTH_MAX_QUEUED_JOBS = int(os.getenv("HEALTH_MAX_QUEUED_JOBS", "16"))
+HEALTH_MAX_LOOP_LAG_MS = float(os.getenv("HEALTH_MAX_LOOP_LAG_MS", "250"))
+
+GIB = 1024 ** 3
+
+# Latest results; probes only ever read these
+_RESULTS: Dict[str, dict] = {}
+_CHECKED_AT: Optional[float] = None
+_LOCK = threading.Lock()
+
+_LOOP_LAG = {"current_ms": None, "max_ms": 0.0}
+
+
+def check_libvirt() -> dict:
+    t0 = time.perf_counter()
+    conn = get_connection_read_only()
+    try:
+        version = conn.getLibVersion()
+        return {
+            "ok": True,
+            "libvirt_version": f"{version // 1000000}.{version // 1000 % 1000}.{version % 1000}",
+            "latency_ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
+    finally:
+        conn.close()
+
+
+def _check_one_pool(conn: libvirt.virConnect, name: str) -> dict:
+    try:
+        pool = conn.storagePoolLookupByName(name)
+    except libvirt.libvirtError:
+        return {"ok": False, "pool": name, "error": "pool not defined"}
+    if not pool.isActive():
+        return {"ok": False, "pool": name, "active": False}
+    _, capacity, allocation, available = pool.info()
+    return {
+        "ok": available >= HEALTH_MIN_POOL_FREE_GB * GIB,
+        "pool": name,
+        "active": True,
+        "capacity_gb": round(capacity / GIB, 2),
+        "allocation_gb": round(allocation / GIB, 2),
+        "available_gb": round(available / GIB, 2),
+        "min_available_gb": HEALTH_MIN_POOL_FREE_GB,
+    }
+
+
+def check_pool() -> dict:
+    conn = get_connection_read_only()
+    try:
+        if HEALTH_POOL_NAME:
+            return _check_one_pool(conn, HEALTH_POOL_NAME)
+        pools = [_check_one_pool(conn, p.name) for p in STORAGE_POOLS]
+        return {"ok": all(p["ok"] for p in pools), "pools": pools}
+    finally:
+        conn.close()
+
+
+def check_image_cache() -> dict:
+    if not CLOUDIMG_DIR.exists():
+        # created on first download; the parent has to be writable for that
+        parent = CLOUDIMG_DIR.parent
+        while not parent.exists():
+            parent = parent.parent
+        return {"ok": os.access(parent, os.W_OK), "path": str(CLOUDIMG_DIR), "exists": False}
+
+    usage = shutil.disk_usage(CLOUDIMG_DIR)
+    images = list(CLOUDIMG_DIR.glob("*.qcow2"))
+    return {
+        "ok": os.access(CLOUDIMG_DIR, os.W_OK) and usage.free >= HEALTH_MIN_CACHE_FREE_GB * GIB,
+        "path": str(CLOUDIMG_DIR),
+        "exists": True,
+        "writable": os.access(CLOUDIMG_DIR, os.W_OK),
+        "free_gb": round(usage.free / GIB, 2),
+        "min_free_gb": HEALTH_MIN_CACHE_FREE_GB,
+        "images": len(images),
+        "partial_downloads": len(list(CLOUDIMG_DIR.glob("*.part"))),
+    }
+
+
+def check_jobs() -> dict:
+    depth = queue_depth()
+    return {"ok": depth["queued"] <= HEALTH_MAX_QUEUED_JOBS, "max_queued": HEALTH_MAX_QUEUED_JOBS, **depth}
+
+
+def check_state_db() -> dict:
+    t0 = time.perf_counter()
+    get_db().execute("SELECT 1").fetchone()
+    return {
+        "ok": True,
+        "path": str(STATE_DB_PATH),
+        "latency_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+CHECKS: Dict[str, Callable[[], dict]] = {
+    "libvirt": check_libvirt,
+    "pool": check_pool,
+    "image_cache": check_image_cache,
+    "jobs": check_jobs,
+    "state_db": check_state_db,
+}
+
+
+def run_checks() -> None:
+    """
+    Runs every dependency check and stores the results (background task).
+    """
+    global _CHECKED_AT
+    results = {}
+    for name, fn in CHECKS.items():
+        t0 = time.perf_counter()
+        try:
+            results[name] = fn()
+        except Exception as e:
+            results[name] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        results[name]["check_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    with _LOCK:
+        _RESULTS.clear()
+        _RESULTS.update(results)
+        _CHECKED_AT = time.time()
+
+
+async def monitor_loop_lag(interval_s: float = 0.5) -> None:
+    """
+    Sleeps `interval_s` over and over and measures how late the loop wakes us up.
+    Lag here means something is blocking the event loop (sync I/O in an async route).
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval_s)
+        lag_ms = max(loop.time() - t0 - interval_s, 0) * 1000
+        _LOOP_LAG["current_ms"] = round(lag_ms, 2)
+        _LOOP_LAG["max_ms"] = round(max(_LOOP_LAG["max_ms"], lag_ms), 2)
+
+
+def readiness() -> dict:
+    """
+    Cached readiness report. Costs a dict copy, never a libvirt call.
+    """
+    with _LOCK:
+        checks = {k: dict(v) for k, v in _RESULTS.items()}
+        checked_at = _CHECKED_AT
+
+    lag = _LOOP_LAG["current_ms"]
+    checks["event_loop"] = {
+        "ok": lag is not None and lag <= HEALTH_MAX_LOOP_LAG_MS,
+        "lag_ms": lag,
+        "max_lag_ms": _LOOP_LAG["max_ms"],
+        "threshold_ms": HEALTH_MAX_LOOP_LAG_MS,
+    }
+
+    age = None if checked_at is None else round(time.time() - checked_at, 2)
+    # results older than a few intervals mean the checker itself is stuck
+    fresh = age is not None and age <= 3 * HEALTH_CHECK_INTERVAL_S
+    return {
+        "ready": fresh and all(c.get("ok") for c in checks.values()),
+        "checked_at": checked_at,
+        "age_s": age,
+        "checks": checks,
+    }
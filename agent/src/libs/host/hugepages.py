@@ -0,0 +1,71 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .sysfs import list_numa_node_dirs, read_int
+
+HUGEPAGES_DIR = Path("/sys/kernel/mm/hugepages")
+
+
+def _page_sizes_kib(base: Path) -> List[int]:
+    """
+    Page sizes (KiB) found under a `hugepages` directory ("hugepages-2048kB").
+    """
+    try:
+        names = [p.name for p in base.iterdir() if p.name.startswith("hugepages-")]
+    except Exception:
+        return []
+    sizes = []
+    for name in names:
+        try:
+            sizes.append(int(name[len("hugepages-"):-len("kB")]))
+        except ValueError:
+            continue
+    return sorted(sizes)
+
+
+def read_hugepage_pools() -> Dict[int, dict]:
+    """
+    Reads the kernel hugepage pools, globally and per NUMA node.
+
+    :return: {page_kib: {"total", "free", "reserved", "surplus", "nodes": {node: {"total", "free", "surplus"}}}}
+    :rtype: Dict[int, dict]
+    """
+    pools: Dict[int, dict] = {}
+    for size in _page_sizes_kib(HUGEPAGES_DIR):
+        d = HUGEPAGES_DIR / f"hugepages-{size}kB"
+        pools[size] = {
+            "total": read_int(str(d / "nr_hugepages")) or 0,
+            "free": read_int(str(d / "free_hugepages")) or 0,
+            # pages promised to a mapping but not faulted in yet
+            "reserved": read_int(str(d / "resv_hugepages")) or 0,
+            "surplus": read_int(str(d / "surplus_hugepages")) or 0,
+            "nodes": {},
+        }
+
+    for nd in list_numa_node_dirs():
+        node_id = int(nd.name[4:])
+        for size in _page_sizes_kib(nd / "hugepages"):
+            d = nd / "hugepages" / f"hugepages-{size}kB"
+            pool = pools.setdefault(size, {"total": 0, "free": 0, "reserved": 0, "surplus": 0, "nodes": {}})
+            pool["nodes"][node_id] = {
+                "total": read_int(str(d / "nr_hugepages")) or 0,
+                "free": read_int(str(d / "free_hugepages")) or 0,
+                "surplus": read_int(str(d / "surplus_hugepages")) or 0,
+            }
+    return pools
+
+
+def free_hugepages(page_kib: int, node: Optional[int] = None) -> int:
+    """
+    Free pages of a given size, on one node or host-wide. The kernel's
+    resv_hugepages are already-promised pages, so they are not free for us.
+    """
+    pool = read_hugepage_pools().get(page_kib)
+    if pool is None:
+        return 0
+    if node is None:
+        return max(pool["free"] - pool["reserved"], 0)
+    node_pool = pool["nodes"].get(node)
+    if node_pool is None:
+        return 0
+    return node_pool["free"]
@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from .sysfs import read_int
+
+KSM_DIR = Path("/sys/kernel/mm/ksm")
+
+# Counters exposed by every kernel with KSM; newer ones add general_profit etc.
+_FIELDS = (
+    "run",
+    "pages_to_scan",
+    "sleep_millisecs",
+    "pages_shared",
+    "pages_sharing",
+    "pages_unshared",
+    "pages_volatile",
+    "full_scans",
+    "merge_across_nodes",
+    "general_profit",
+)
+
+
+def ksm_available() -> bool:
+    return (KSM_DIR / "run").exists()
+
+
+def read_ksm() -> Optional[Dict[str, int]]:
+    """
+    Reads the KSM knobs and counters.
+
+    :return: {field: value} (missing fields omitted), or None without KSM
+    :rtype: Dict[str, int] | None
+    """
+    if not ksm_available():
+        return None
+    out = {}
+    for name in _FIELDS:
+        value = read_int(str(KSM_DIR / name))
+        if value is not None:
+            out[name] = value
+    return out
+
+
+def write_ksm(name: str, value: int) -> bool:
+    """
+    Sets one KSM knob (run, pages_to_scan, sleep_millisecs).
+
+    :return: False if it can't be written (not root, no KSM)
+    :rtype: bool
+    """
+    try:
+        with open(KSM_DIR / name, "w", encoding="utf-8") as f:
+            f.write(str(int(value)))
+        return True
+    except OSError:
+        return False
+
+
+def ksm_savings_bytes(stats: Dict[str, int]) -> int:
+    """
+    Memory KSM saves right now: every page in pages_sharing is a duplicate
+    that no longer needs its own frame.
+    """
+    return stats.get("pages_sharing", 0) * os.sysconf("SC_PAGE_SIZE")
@@ -0,0 +1,23 @@
+from typing import Dict, Optional
+
+from .sysfs import read_text
+
+
+def read_pressure(resource: str = "memory") -> Optional[Dict[str, Dict[str, float]]]:
+    """
+    Pressure stall information (PSI) for cpu, memory or io.
+
+    :param resource: "cpu", "memory" or "io"
+    :type resource: str
+    :return: {"some": {"avg10", "avg60", "avg300", "total"}, "full": {...}},
+             or None when the kernel has no PSI (CONFIG_PSI off, non-Linux)
+    :rtype: dict | None
+    """
+    text = read_text(f"/proc/pressure/{resource}")
+    if not text:
+        return None
+    out: Dict[str, Dict[str, float]] = {}
+    for line in text.splitlines():
+        kind, *fields = line.split()
+        out[kind] = {k: float(v) for k, v in (f.split("=", 1) for f in fields)}
+    return out
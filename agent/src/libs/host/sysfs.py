@@ -0,0 +1,113 @@
+from pathlib import Path
+from typing import List, Optional
+
+
+def read_text(path: str) -> Optional[str]:
+    """
+    Reads a small sysfs/procfs file. Returns None if it can't be read.
+
+    :param path: File path
+    :type path: str
+    :return: Stripped file content or None
+    :rtype: str | None
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except Exception:
+        return None
+
+
+def read_int(path: str) -> Optional[int]:
+    """
+    Reads an integer from a file. Returns None if the file doesn't exist or
+    the content is invalid.
+
+    :param path: File path
+    :type path: str
+    :return: Integer value or None
+    :rtype: int | None
+    """
+    s = read_text(path)
+    if not s or s == "-1":
+        return None
+    try:
+        return int(s)
+    except ValueError:
+        return None
+
+
+def iface_link_speed_mbps(iface: str) -> Optional[int]:
+    """
+    Reads the link speed in Mbps for a given network interface on Linux.
+    Returns None if not available.
+
+    :param iface: Network interface name
+    :type iface: str
+    :return: Link speed in Mbps or None if not available
+    :rtype: int | None
+    """
+    return read_int(f"/sys/class/net/{iface}/speed")
+
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    """
+    Parses a kernel/libvirt cpulist ("0-3,8,10-11") into a sorted list of ids.
+
+    :param cpulist: cpulist string
+    :type cpulist: str
+    :return: Sorted list of CPU (or node) ids
+    :rtype: List[int]
+    """
+    out = set()
+    for part in (cpulist or "").split(","):
+        part = part.strip()
+        if not part or part.startswith("^"):
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            out.update(range(int(lo), int(hi) + 1))
+        else:
+            out.add(int(part))
+    # exclusions ("^3") are applied after the ranges, like libvirt does
+    for part in (cpulist or "").split(","):
+        part = part.strip()
+        if part.startswith("^"):
+            out.discard(int(part[1:]))
+    return sorted(out)
+
+
+def format_cpulist(cpus: List[int]) -> str:
+    """
+    Formats a list of ids into a compact cpulist ("0-3,8").
+
+    :param cpus: CPU (or node) ids
+    :type cpus: List[int]
+    :return: cpulist string
+    :rtype: str
+    """
+    ids = sorted(set(cpus))
+    ranges = []
+    i = 0
+    while i < len(ids):
+        j = i
+        while j + 1 < len(ids) and ids[j + 1] == ids[j] + 1:
+            j += 1
+        ranges.append(str(ids[i]) if i == j else f"{ids[i]}-{ids[j]}")
+        i = j + 1
+    return ",".join(ranges)
+
+
+def list_numa_node_dirs() -> List[Path]:
+    """
+    Returns /sys/devices/system/node/nodeN directories sorted by node id.
+
+    :return: Node directories (empty on non-NUMA / non-Linux hosts)
+    :rtype: List[Path]
+    """
+    base = Path("/sys/devices/system/node")
+    try:
+        nodes = [p for p in base.iterdir() if p.name.startswith("node") and p.name[4:].isdigit()]
+    except Exception:
+        return []
+    return sorted(nodes, key=lambda p: int(p.name[4:]))
@@ -0,0 +1,313 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.libs.store.db import get_db, owner_alive, process_owner
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION_S = int(os.getenv("JOB_RETENTION_S", str(24 * 3600)))
+
+ACTIVE_STATES = ("queued", "running")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    vm_id: Optional[str] = None
+    status: str = "queued"  # queued | running | succeeded | failed | cancelled
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+    # Worker process running the job ("<pid>:<start time>")
+    owner: str = field(default_factory=process_owner)
+    # Set by the running job to abort whatever it is blocked on (e.g. domain.abortJob)
+    on_cancel: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATES
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "vm_id": self.vm_id,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "cancel_requested": self.cancel_requested,
+            "owner": self.owner,
+        }
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Jobs running in this worker. The database has every job, from every worker.
+_JOBS: Dict[str, Job] = {}
+_LOCK = threading.Lock()
+_EXECUTOR = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Persistence                                 #
+# ---------------------------------------------------------------------------- #
+def _from_row(row) -> Job:
+    return Job(
+        id=row["id"],
+        kind=row["kind"],
+        vm_id=row["vm_id"],
+        status=row["status"],
+        progress=json.loads(row["progress"] or "{}"),
+        result=json.loads(row["result"]) if row["result"] else None,
+        error=row["error"],
+        created_at=row["created_at"],
+        started_at=row["started_at"],
+        finished_at=row["finished_at"],
+        cancel_requested=bool(row["cancel_requested"]),
+        owner=row["owner"],
+    )
+
+
+def _save(job: Job) -> None:
+    get_db().execute(
+        """
+        INSERT INTO jobs (id, kind, vm_id, status, progress, result, error, created_at,
+                          started_at, finished_at, cancel_requested, owner)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            status = excluded.status, progress = excluded.progress, result = excluded.result,
+            error = excluded.error, started_at = excluded.started_at, finished_at = excluded.finished_at,
+            cancel_requested = MAX(jobs.cancel_requested, excluded.cancel_requested)
+        """,
+        (
+            job.id, job.kind, job.vm_id, job.status, json.dumps(job.progress, default=str),
+            json.dumps(job.result, default=str) if job.result is not None else None,
+            job.error, job.created_at, job.started_at, job.finished_at,
+            int(job.cancel_requested), job.owner,
+        ),
+    )
+
+
+def _prune() -> None:
+    get_db().execute(
+        "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+        (time.time() - JOB_RETENTION_S,),
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Execution                                  #
+# ---------------------------------------------------------------------------- #
+def _run(job: Job, fn: Callable[[Job], Optional[dict]]) -> None:
+    with _LOCK:
+        if job.cancel_requested:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            _JOBS.pop(job.id, None)
+            _save(job)
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        _save(job)
+    try:
+        result = fn(job)
+        with _LOCK:
+            job.result = result
+            job.status = "cancelled" if job.cancel_requested else "succeeded"
+    except JobCancelled:
+        with _LOCK:
+            job.status = "cancelled"
+    except Exception as e:
+        traceback.print_exc()
+        with _LOCK:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "cancelled" if job.cancel_requested else "failed"
+    finally:
+        with _LOCK:
+            job.finished_at = time.time()
+            job.on_cancel = None
+            _JOBS.pop(job.id, None)
+            _save(job)
+
+
+def submit_job(kind: str, fn: Callable[[Job], Optional[dict]], vm_id: Optional[str] = None) -> Job:
+    """
+    Runs `fn(job)` on the job thread pool. Whatever `fn` returns becomes the
+    job result; exceptions mark the job failed.
+
+    :param kind: Job type ("migrate", ...)
+    :type kind: str
+    :param fn: Work to run; receives the Job so it can report progress
+    :type fn: Callable[[Job], dict | None]
+    :param vm_id: VM the job works on, if any
+    :type vm_id: str | None
+    :return: The queued job
+    :rtype: Job
+    """
+    job = Job(id=str(uuid.uuid4()), kind=kind, vm_id=vm_id)
+    with _LOCK:
+        _prune()
+        _JOBS[job.id] = job
+        _save(job)
+    # carry the caller's context (e.g. the request's trace) into the worker
+    _EXECUTOR.submit(contextvars.copy_context().run, _run, job, fn)
+    return job
+
+
+def update_progress(job: Job, **progress: Any) -> None:
+    with _LOCK:
+        job.progress.update(progress)
+        get_db().execute(
+            "UPDATE jobs SET progress = ? WHERE id = ?",
+            (json.dumps(job.progress, default=str), job.id),
+        )
+
+
+def check_cancelled(job: Job) -> None:
+    """
+    Raises JobCancelled if someone asked to cancel the job. Long-running jobs
+    call this between steps.
+    """
+    if job.cancel_requested:
+        raise JobCancelled()
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Queries                                   #
+# ---------------------------------------------------------------------------- #
+def get_job(job_id: str) -> Optional[Job]:
+    with _LOCK:
+        job = _JOBS.get(job_id)
+    if job is not None:
+        return job
+    row = get_db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _from_row(row) if row else None
+
+
+def list_jobs(kind: Optional[str] = None, vm_id: Optional[str] = None, active_only: bool = False) -> List[Job]:
+    sql = "SELECT * FROM jobs WHERE 1=1"
+    args: List[Any] = []
+    if kind is not None:
+        sql += " AND kind = ?"
+        args.append(kind)
+    if vm_id is not None:
+        sql += " AND vm_id = ?"
+        args.append(vm_id)
+    if active_only:
+        sql += " AND status IN ('queued', 'running')"
+    sql += " ORDER BY created_at DESC"
+    rows = get_db().execute(sql, args).fetchall()
+    with _LOCK:
+        local = dict(_JOBS)
+    # our own running jobs are fresher in memory than in the database
+    return [local.get(r["id"]) or _from_row(r) for r in rows]
+
+
+def active_job_for(vm_id: str) -> Optional[Job]:
+    jobs = list_jobs(vm_id=vm_id, active_only=True)
+    return jobs[0] if jobs else None
+
+
+def request_cancel(job_id: str) -> Optional[Job]:
+    """
+    Flags a job for cancellation and calls its abort hook, if it set one.
+    Jobs owned by another worker are flagged in the database; that worker
+    picks the flag up in `sync_cancellations`.
+    """
+    get_db().execute(
+        "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+        (job_id,),
+    )
+    with _LOCK:
+        job = _JOBS.get(job_id)
+    if job is None:
+        return get_job(job_id)
+    _cancel_local(job)
+    return job
+
+
+def _cancel_local(job: Job) -> None:
+    with _LOCK:
+        if not job.active or job.cancel_requested:
+            return
+        job.cancel_requested = True
+        hook = job.on_cancel
+    if hook is not None:
+        try:
+            hook()
+        except Exception as e:
+            print(f"Cancel hook for job {job.id} failed: {e}")
+
+
+def sync_cancellations() -> None:
+    """
+    Applies cancel requests made through other workers to the jobs running
+    here (background task).
+    """
+    with _LOCK:
+        ids = [j.id for j in _JOBS.values() if j.active and not j.cancel_requested]
+    if not ids:
+        return
+    rows = get_db().execute(
+        f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({','.join('?' * len(ids))})",
+        ids,
+    ).fetchall()
+    for row in rows:
+        with _LOCK:
+            job = _JOBS.get(row["id"])
+        if job is not None:
+            _cancel_local(job)
+
+
+def recover_jobs() -> int:
+    """
+    Marks jobs whose worker died (agent restart, crash) as failed, so they
+    don't block their VM forever. Jobs of live workers are left alone.
+
+    :return: Number of jobs marked failed
+    """
+    db = get_db()
+    rows = db.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+    dead = [r["id"] for r in rows if not owner_alive(r["owner"])]
+    now = time.time()
+    for job_id in dead:
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            ("Interrupted: the agent worker running this job exited", now, job_id),
+        )
+    if dead:
+        print(f"Marked {len(dead)} interrupted job(s) as failed")
+    return len(dead)
+
+
+def queue_depth() -> Dict[str, int]:
+    """
+    Jobs waiting for a worker and jobs running right now (this worker).
+    """
+    with _LOCK:
+        queued = sum(1 for j in _JOBS.values() if j.status == "queued")
+        running = sum(1 for j in _JOBS.values() if j.status == "running")
+    return {"queued": queued, "running": running, "workers": JOB_WORKERS}
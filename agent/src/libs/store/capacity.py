@@ -0,0 +1,88 @@
+import time
+from typing import Dict, List, Optional
+
+from .db import get_db, owner_alive, process_owner, transaction
+
+# state: reserved (create in progress, owner set) | defined (domain exists)
+
+
+def reserve(vm_id: str, vcpus: int, memory_mib: int, hugepage_kib: Optional[int], disk_bytes: int, pool: str) -> None:
+    """
+    Holds resources for a VM being created, before anything is allocated.
+    """
+    get_db().execute(
+        """
+        INSERT INTO capacity (vm_id, state, vcpus, memory_mib, hugepage_kib, disk_bytes, pool, owner, updated_at)
+        VALUES (?, 'reserved', ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            state = excluded.state, vcpus = excluded.vcpus, memory_mib = excluded.memory_mib,
+            hugepage_kib = excluded.hugepage_kib, disk_bytes = excluded.disk_bytes, pool = excluded.pool,
+            owner = excluded.owner, updated_at = excluded.updated_at
+        """,
+        (vm_id, vcpus, memory_mib, hugepage_kib, disk_bytes, pool, process_owner(), time.time()),
+    )
+
+
+def record(vm_id: str, vcpus: int, memory_mib: int, hugepage_kib: Optional[int], disk_bytes: int, pool: Optional[str]) -> None:
+    """
+    Records what a defined domain commits (replaces a reservation).
+    """
+    get_db().execute(
+        """
+        INSERT INTO capacity (vm_id, state, vcpus, memory_mib, hugepage_kib, disk_bytes, pool, owner, updated_at)
+        VALUES (?, 'defined', ?, ?, ?, ?, ?, NULL, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            state = excluded.state, vcpus = excluded.vcpus, memory_mib = excluded.memory_mib,
+            hugepage_kib = excluded.hugepage_kib, disk_bytes = excluded.disk_bytes, pool = excluded.pool,
+            owner = NULL, updated_at = excluded.updated_at
+        """,
+        (vm_id, vcpus, memory_mib, hugepage_kib, disk_bytes, pool, time.time()),
+    )
+
+
+def forget(vm_id: str) -> None:
+    get_db().execute("DELETE FROM capacity WHERE vm_id = ?", (vm_id,))
+
+
+def list_entries() -> List[dict]:
+    """
+    Ledger rows, without reservations whose worker died mid-create.
+    """
+    rows = get_db().execute("SELECT * FROM capacity ORDER BY vm_id").fetchall()
+    return [dict(r) for r in rows if r["state"] != "reserved" or owner_alive(r["owner"])]
+
+
+def replace_defined(entries: Dict[str, dict]) -> int:
+    """
+    Replaces every 'defined' row with `entries` (vm_id -> row) in one
+    transaction and drops reservations of dead workers. Live reservations
+    are kept unless the domain now exists.
+
+    :return: Rows that changed
+    """
+    now = time.time()
+    changed = 0
+    with transaction() as db:
+        current = {r["vm_id"]: dict(r) for r in db.execute("SELECT * FROM capacity").fetchall()}
+        for vm_id, row in current.items():
+            stale_reservation = row["state"] == "reserved" and not owner_alive(row["owner"])
+            if (row["state"] == "defined" and vm_id not in entries) or stale_reservation:
+                db.execute("DELETE FROM capacity WHERE vm_id = ?", (vm_id,))
+                changed += 1
+        for vm_id, e in entries.items():
+            old = current.get(vm_id)
+            fields = (e["vcpus"], e["memory_mib"], e["hugepage_kib"], e["disk_bytes"], e["pool"])
+            if old is not None and old["state"] == "defined" and fields == (
+                old["vcpus"], old["memory_mib"], old["hugepage_kib"], old["disk_bytes"], old["pool"]
+            ):
+                continue
+            db.execute(
+                """
+                INSERT OR REPLACE INTO capacity
+                    (vm_id, state, vcpus, memory_mib, hugepage_kib, disk_bytes, pool, owner, updated_at)
+                VALUES (?, 'defined', ?, ?, ?, ?, ?, NULL, ?)
+                """,
+                (vm_id, *fields, now),
+            )
+            changed += 1
+    return changed
@@ -0,0 +1,275 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import psutil
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_DIR = Path(os.getenv("STATE_DIR", "./.cache/state")).resolve()
+STATE_DB_PATH = Path(os.getenv("STATE_DB_PATH", str(STATE_DIR / "agent.db"))).resolve()
+
+# Bump and append to MIGRATIONS to change the schema; applied in order on open
+MIGRATIONS = [
+    # 1: jobs, provisioning state, image index, warm pool
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        vm_id TEXT,
+        status TEXT NOT NULL,
+        progress TEXT NOT NULL DEFAULT '{}',
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        owner TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_vm_status ON jobs (vm_id, status);
+    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+
+    CREATE TABLE IF NOT EXISTS provisioning (
+        vm_id TEXT PRIMARY KEY,
+        operation TEXT NOT NULL,
+        step TEXT NOT NULL,
+        status TEXT NOT NULL,
+        details TEXT NOT NULL DEFAULT '{}',
+        error TEXT,
+        started_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        owner TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS images (
+        os_name TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        url TEXT,
+        sha256 TEXT,
+        size_bytes INTEGER,
+        downloaded_at REAL,
+        last_used_at REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS warm_pool (
+        vm_id TEXT PRIMARY KEY,
+        os_name TEXT NOT NULL,
+        state TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        claimed_at REAL,
+        claimed_by TEXT
+    );
+    CREATE INDEX IF NOT EXISTS warm_pool_os_state ON warm_pool (os_name, state);
+    """,
+    # 2: guest agent facts (last good facts survive failed collections)
+    """
+    CREATE TABLE IF NOT EXISTS guest_facts (
+        vm_id TEXT PRIMARY KEY,
+        facts TEXT,
+        collected_at REAL,
+        attempted_at REAL NOT NULL,
+        duration_ms REAL,
+        error TEXT
+    );
+    """,
+    # 3: capacity ledger (resources committed to defined VMs and to creates in progress)
+    """
+    CREATE TABLE IF NOT EXISTS capacity (
+        vm_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        vcpus INTEGER NOT NULL,
+        memory_mib INTEGER NOT NULL,
+        hugepage_kib INTEGER,
+        disk_bytes INTEGER NOT NULL,
+        pool TEXT,
+        owner TEXT,
+        updated_at REAL NOT NULL
+    );
+    """,
+    # 4: managed save (hibernate) timings and image sizes, one row per VM
+    """
+    CREATE TABLE IF NOT EXISTS hibernation (
+        vm_id TEXT PRIMARY KEY,
+        reason TEXT,
+        saved_at REAL,
+        save_ms REAL,
+        image_bytes INTEGER,
+        image_format TEXT,
+        bypass_cache INTEGER,
+        restored_at REAL,
+        restore_ms REAL,
+        saves INTEGER NOT NULL DEFAULT 0,
+        restores INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+    """,
+    # 5: template VMs (saved golden VM per OS image) that new VMs are cloned from
+    """
+    CREATE TABLE IF NOT EXISTS vm_templates (
+        os_name TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        disk_path TEXT,
+        save_path TEXT,
+        interface_xml TEXT,
+        vcpus INTEGER,
+        memory_mib INTEGER,
+        disk_bytes INTEGER,
+        image_bytes INTEGER,
+        build_ms REAL,
+        clones INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        built_at REAL,
+        error TEXT,
+        owner TEXT
+    );
+    """,
+    # 6: measured latency of each storage pool, for tier placement
+    """
+    CREATE TABLE IF NOT EXISTS storage_pools (
+        name TEXT PRIMARY KEY,
+        tier TEXT,
+        read_ms REAL,
+        write_ms REAL,
+        latency_ms REAL,
+        samples INTEGER NOT NULL DEFAULT 0,
+        probed_at REAL,
+        error TEXT
+    );
+    """,
+    # 7: space reclamation (guest trims, offline compaction) per VM and per run
+    """
+    CREATE TABLE IF NOT EXISTS reclaim (
+        vm_id TEXT PRIMARY KEY,
+        trimmed_at REAL,
+        trim_bytes INTEGER,
+        compacted_at REAL,
+        compact_method TEXT,
+        compact_bytes INTEGER,
+        compacted_allocation_bytes INTEGER,
+        allocation_bytes INTEGER,
+        reclaimed_bytes INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS reclaim_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        trigger TEXT NOT NULL,
+        started_at REAL NOT NULL,
+        finished_at REAL NOT NULL,
+        trimmed INTEGER NOT NULL,
+        compacted INTEGER NOT NULL,
+        skipped INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        reclaimed_bytes INTEGER NOT NULL
+    );
+    """,
+    # 8: nonces of signed requests and console token ids, shared by every worker (replay protection)
+    """
+    CREATE TABLE IF NOT EXISTS nonces (
+        nonce TEXT PRIMARY KEY,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS nonces_expires ON nonces (expires_at);
+    """,
+    # 9: drop the warm pool table from 1, nothing ever filled it
+    """
+    DROP INDEX IF EXISTS warm_pool_os_state;
+    DROP TABLE IF EXISTS warm_pool;
+    """,
+]
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated_pid: Optional[int] = None
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    global _migrated_pid
+    with _migrate_lock:
+        if _migrated_pid == os.getpid():
+            return
+        # IMMEDIATE: two workers starting together must not both migrate
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in script.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {i}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        _migrated_pid = os.getpid()
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    This thread's connection to the state database (WAL mode, so readers in
+    other workers never block on a writer). Opened and migrated on first use.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        return conn
+
+    STATE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # autocommit; multi-statement writes go through transaction()
+    conn = sqlite3.connect(str(STATE_DB_PATH), timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    # fsync at checkpoints only; a power cut can lose the last commits, not corrupt the db
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    _migrate(conn)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    BEGIN IMMEDIATE ... COMMIT on this thread's connection (ROLLBACK on error).
+    """
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Ownership                                   #
+# ---------------------------------------------------------------------------- #
+_owner: Optional[str] = None
+_owner_pid: Optional[int] = None
+
+
+def process_owner() -> str:
+    """
+    "<pid>:<start time>" of this worker. The start time makes the id unique
+    even after the pid is reused by another process.
+    """
+    global _owner, _owner_pid
+    if _owner_pid != os.getpid():
+        _owner_pid = os.getpid()
+        _owner = f"{_owner_pid}:{int(psutil.Process(_owner_pid).create_time())}"
+    return _owner
+
+
+def owner_alive(owner: str) -> bool:
+    try:
+        pid_s, started_s = owner.split(":", 1)
+        proc = psutil.Process(int(pid_s))
+        return int(proc.create_time()) == int(started_s)
+    except (ValueError, psutil.Error):
+        return False
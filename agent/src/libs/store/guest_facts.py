@@ -0,0 +1,53 @@
+import json
+import time
+from typing import List, Optional
+
+from .db import get_db
+
+
+def save(vm_id: str, facts: dict, duration_ms: float) -> None:
+    now = time.time()
+    get_db().execute(
+        """
+        INSERT INTO guest_facts (vm_id, facts, collected_at, attempted_at, duration_ms, error)
+        VALUES (?, ?, ?, ?, ?, NULL)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            facts = excluded.facts, collected_at = excluded.collected_at,
+            attempted_at = excluded.attempted_at, duration_ms = excluded.duration_ms, error = NULL
+        """,
+        (vm_id, json.dumps(facts, default=str), now, now, duration_ms),
+    )
+
+
+def save_error(vm_id: str, error: str, duration_ms: float) -> None:
+    """
+    Records a failed collection; the last good facts are kept.
+    """
+    get_db().execute(
+        """
+        INSERT INTO guest_facts (vm_id, attempted_at, duration_ms, error) VALUES (?, ?, ?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            attempted_at = excluded.attempted_at, duration_ms = excluded.duration_ms, error = excluded.error
+        """,
+        (vm_id, time.time(), duration_ms, error),
+    )
+
+
+def get(vm_id: str) -> Optional[dict]:
+    row = get_db().execute("SELECT * FROM guest_facts WHERE vm_id = ?", (vm_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def list_facts() -> List[dict]:
+    rows = get_db().execute("SELECT * FROM guest_facts ORDER BY vm_id").fetchall()
+    return [_to_dict(r) for r in rows]
+
+
+def forget(vm_id: str) -> None:
+    get_db().execute("DELETE FROM guest_facts WHERE vm_id = ?", (vm_id,))
+
+
+def _to_dict(row) -> dict:
+    d = dict(row)
+    d["facts"] = json.loads(d["facts"]) if d["facts"] else None
+    return d
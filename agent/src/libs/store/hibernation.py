@@ -0,0 +1,60 @@
+import time
+from typing import List, Optional
+
+from .db import get_db
+
+
+def record_save(
+    vm_id: str,
+    reason: str,
+    save_ms: float,
+    image_bytes: Optional[int],
+    image_format: Optional[str],
+    bypass_cache: bool,
+) -> None:
+    get_db().execute(
+        """
+        INSERT INTO hibernation (vm_id, reason, saved_at, save_ms, image_bytes, image_format, bypass_cache, saves)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            reason = excluded.reason, saved_at = excluded.saved_at, save_ms = excluded.save_ms,
+            image_bytes = excluded.image_bytes, image_format = excluded.image_format,
+            bypass_cache = excluded.bypass_cache, saves = saves + 1, error = NULL
+        """,
+        (vm_id, reason, time.time(), save_ms, image_bytes, image_format, int(bypass_cache)),
+    )
+
+
+def record_restore(vm_id: str, restore_ms: float) -> None:
+    get_db().execute(
+        """
+        INSERT INTO hibernation (vm_id, restored_at, restore_ms, restores) VALUES (?, ?, ?, 1)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            restored_at = excluded.restored_at, restore_ms = excluded.restore_ms,
+            restores = restores + 1, error = NULL
+        """,
+        (vm_id, time.time(), restore_ms),
+    )
+
+
+def record_error(vm_id: str, error: str) -> None:
+    get_db().execute(
+        """
+        INSERT INTO hibernation (vm_id, error) VALUES (?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET error = excluded.error
+        """,
+        (vm_id, error),
+    )
+
+
+def get(vm_id: str) -> Optional[dict]:
+    row = get_db().execute("SELECT * FROM hibernation WHERE vm_id = ?", (vm_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def list_records() -> List[dict]:
+    return [dict(r) for r in get_db().execute("SELECT * FROM hibernation ORDER BY vm_id").fetchall()]
+
+
+def forget(vm_id: str) -> None:
+    get_db().execute("DELETE FROM hibernation WHERE vm_id = ?", (vm_id,))
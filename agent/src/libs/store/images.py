@@ -0,0 +1,41 @@
+import time
+from typing import List, Optional
+
+from .db import get_db
+
+
+def record_download(os_name: str, path: str, url: str, sha256: Optional[str], size_bytes: int) -> None:
+    now = time.time()
+    get_db().execute(
+        """
+        INSERT INTO images (os_name, path, url, sha256, size_bytes, downloaded_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(os_name) DO UPDATE SET
+            path = excluded.path, url = excluded.url, sha256 = excluded.sha256,
+            size_bytes = excluded.size_bytes, downloaded_at = excluded.downloaded_at,
+            last_used_at = excluded.last_used_at
+        """,
+        (os_name, path, url, sha256, size_bytes, now, now),
+    )
+
+
+def touch(os_name: str, path: str) -> None:
+    """
+    Marks a cached image as used (images found on disk but never indexed are added).
+    """
+    now = time.time()
+    get_db().execute(
+        """
+        INSERT INTO images (os_name, path, last_used_at) VALUES (?, ?, ?)
+        ON CONFLICT(os_name) DO UPDATE SET last_used_at = excluded.last_used_at
+        """,
+        (os_name, path, now),
+    )
+
+
+def forget(os_name: str) -> None:
+    get_db().execute("DELETE FROM images WHERE os_name = ?", (os_name,))
+
+
+def list_images() -> List[dict]:
+    return [dict(r) for r in get_db().execute("SELECT * FROM images ORDER BY os_name").fetchall()]
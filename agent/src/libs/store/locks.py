@@ -0,0 +1,82 @@
+import fcntl
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .db import STATE_DIR
+
+LOCK_DIR = STATE_DIR / "locks"
+_SAFE = re.compile(r"[^a-zA-Z0-9._-]")
+
+
+class ProcessLock:
+    """
+    Lock shared by the threads of this worker (threading.RLock) and by all
+    agent workers on the host (flock on a lock file). Reentrant within a
+    thread; the file lock is held while the outermost acquire is.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = LOCK_DIR / f"{_SAFE.sub('_', name)}.lock"
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if not self._thread_lock.acquire(blocking, timeout):
+            return False
+        if self._depth > 0:
+            self._depth += 1
+            return True
+
+        LOCK_DIR.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_CREAT | os.O_RDWR, 0o644)
+        deadline = None if timeout < 0 else time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking and deadline is None else fcntl.LOCK_NB))
+                break
+            except BlockingIOError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    os.close(fd)
+                    self._thread_lock.release()
+                    return False
+                time.sleep(0.05)
+        self._fd = fd
+        self._depth = 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+_LOCKS: Dict[Tuple[int, str], ProcessLock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def process_lock(name: str) -> ProcessLock:
+    """
+    The host-wide lock called `name` (one object per name per worker; keyed by
+    pid so a forked child never inherits its parent's held locks).
+    """
+    key = (os.getpid(), name)
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(key)
+        if lock is None:
+            lock = _LOCKS[key] = ProcessLock(name)
+        return lock
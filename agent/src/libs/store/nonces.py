@@ -0,0 +1,28 @@
+import sqlite3
+import time
+
+from .db import get_db
+
+
+def add(nonce: str, ttl_s: float) -> bool:
+    """
+    Remembers a nonce for ttl_s, in every worker at once.
+
+    :return: False when it was already seen (replay)
+    """
+    try:
+        get_db().execute("INSERT INTO nonces (nonce, expires_at) VALUES (?, ?)", (nonce, time.time() + ttl_s))
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def prune() -> int:
+    """
+    Drops expired nonces; their requests fail the timestamp check anyway.
+    """
+    return get_db().execute("DELETE FROM nonces WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+def count() -> int:
+    return get_db().execute("SELECT COUNT(*) FROM nonces").fetchone()[0]
@@ -0,0 +1,158 @@
+import json
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+import libvirt
+
+from .db import get_db, owner_alive, process_owner
+
+# status: in_progress | done | failed | interrupted
+
+
+def begin(vm_id: str, operation: str, **details: Any) -> None:
+    """
+    Records that `operation` ("create", "format") started on a VM. Replaces
+    any previous record for the VM.
+    """
+    now = time.time()
+    get_db().execute(
+        """
+        INSERT INTO provisioning (vm_id, operation, step, status, details, error, started_at, updated_at, owner)
+        VALUES (?, ?, 'start', 'in_progress', ?, NULL, ?, ?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            operation = excluded.operation, step = excluded.step, status = excluded.status,
+            details = excluded.details, error = NULL, started_at = excluded.started_at,
+            updated_at = excluded.updated_at, owner = excluded.owner
+        """,
+        (vm_id, operation, json.dumps(details, default=str), now, now, process_owner()),
+    )
+
+
+def step(vm_id: str, name: str, **details: Any) -> None:
+    """
+    Moves a VM's provisioning record to step `name`, merging `details`
+    (paths of things created so far, so recovery knows what to undo).
+    """
+    db = get_db()
+    row = db.execute("SELECT details FROM provisioning WHERE vm_id = ?", (vm_id,)).fetchone()
+    merged = json.loads(row["details"]) if row else {}
+    merged.update(details)
+    db.execute(
+        "UPDATE provisioning SET step = ?, details = ?, updated_at = ? WHERE vm_id = ?",
+        (name, json.dumps(merged, default=str), time.time(), vm_id),
+    )
+
+
+def finish(vm_id: str, error: Optional[str] = None) -> None:
+    get_db().execute(
+        "UPDATE provisioning SET status = ?, error = ?, updated_at = ? WHERE vm_id = ?",
+        ("failed" if error else "done", error, time.time(), vm_id),
+    )
+
+
+def get(vm_id: str) -> Optional[dict]:
+    row = get_db().execute("SELECT * FROM provisioning WHERE vm_id = ?", (vm_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def list_records(status: Optional[str] = None) -> List[dict]:
+    if status is None:
+        rows = get_db().execute("SELECT * FROM provisioning ORDER BY updated_at DESC").fetchall()
+    else:
+        rows = get_db().execute(
+            "SELECT * FROM provisioning WHERE status = ? ORDER BY updated_at DESC", (status,)
+        ).fetchall()
+    return [_to_dict(r) for r in rows]
+
+
+def forget(vm_id: str) -> None:
+    get_db().execute("DELETE FROM provisioning WHERE vm_id = ?", (vm_id,))
+
+
+def _to_dict(row) -> dict:
+    d = dict(row)
+    d["details"] = json.loads(d["details"] or "{}")
+    return d
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Recovery                                   #
+# ---------------------------------------------------------------------------- #
+def _rollback(conn: libvirt.virConnect, record: dict) -> List[str]:
+    """
+    Undoes the half-finished parts of one interrupted operation.
+
+    create/clone: a volume allocated for a domain that never got defined is
+    deleted, and so is a clone's half-written restore image.
+    format: the VM is left shut off with its seed ISO removed; the disk is in
+    an unknown state, so the record stays "interrupted" until the next format.
+    """
+    actions = []
+    vm_id = record["vm_id"]
+    details = record["details"]
+
+    try:
+        domain = conn.lookupByName(vm_id)
+    except libvirt.libvirtError:
+        domain = None
+
+    if record["operation"] in ("create", "clone") and domain is None and details.get("volume_path"):
+        try:
+            conn.storageVolLookupByPath(details["volume_path"]).delete(0)
+            actions.append(f"deleted volume {details['volume_path']}")
+        except libvirt.libvirtError:
+            pass
+
+    if record["operation"] == "clone" and details.get("restore_image"):
+        try:
+            Path(details["restore_image"]).unlink()
+            actions.append(f"removed {details['restore_image']}")
+        except FileNotFoundError:
+            pass
+
+    if record["operation"] == "format":
+        if domain is not None and domain.isActive() and record["step"] not in ("boot",):
+            domain.destroy()
+            actions.append("stopped half-formatted VM")
+        seed_iso = details.get("seed_iso")
+        if seed_iso and record["step"] not in ("attach", "boot"):
+            try:
+                Path(seed_iso).unlink()
+                actions.append(f"removed {seed_iso}")
+            except FileNotFoundError:
+                pass
+        tmp = details.get("clone_tmp")
+        if tmp:
+            try:
+                Path(tmp).unlink()
+                actions.append(f"removed {tmp}")
+            except FileNotFoundError:
+                pass
+    return actions
+
+
+def recover_provisioning(conn: libvirt.virConnect) -> List[dict]:
+    """
+    Finds operations whose worker died mid-way, rolls back what can be
+    rolled back and marks them "interrupted". Live workers' work is untouched.
+
+    :return: One entry per recovered VM with the actions taken
+    """
+    recovered = []
+    for record in list_records(status="in_progress"):
+        if owner_alive(record["owner"]):
+            continue
+        try:
+            actions = _rollback(conn, record)
+            error = f"Interrupted at step '{record['step']}'"
+        except Exception as e:
+            actions = []
+            error = f"Interrupted at step '{record['step']}'; rollback failed: {type(e).__name__}: {e}"
+        get_db().execute(
+            "UPDATE provisioning SET status = 'interrupted', error = ?, updated_at = ? WHERE vm_id = ?",
+            (error, time.time(), record["vm_id"]),
+        )
+        print(f"Recovered interrupted {record['operation']} of {record['vm_id']}: {actions or 'nothing to undo'}")
+        recovered.append({"vm_id": record["vm_id"], "operation": record["operation"], "step": record["step"], "actions": actions})
+    return recovered
@@ -0,0 +1,82 @@
+import time
+from typing import Dict, List, Optional
+
+from .db import get_db
+
+# runs kept for GET /storage/reclaim
+_KEEP_RUNS = 100
+
+
+def record_trim(vm_id: str, reclaimed_bytes: int, allocation_bytes: int) -> None:
+    get_db().execute(
+        """
+        INSERT INTO reclaim (vm_id, trimmed_at, trim_bytes, allocation_bytes, reclaimed_bytes)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            trimmed_at = excluded.trimmed_at, trim_bytes = excluded.trim_bytes,
+            allocation_bytes = excluded.allocation_bytes,
+            reclaimed_bytes = reclaim.reclaimed_bytes + excluded.reclaimed_bytes, error = NULL
+        """,
+        (vm_id, time.time(), reclaimed_bytes, allocation_bytes, reclaimed_bytes),
+    )
+
+
+def record_compact(vm_id: str, method: str, reclaimed_bytes: int, allocation_bytes: int) -> None:
+    get_db().execute(
+        """
+        INSERT INTO reclaim (vm_id, compacted_at, compact_method, compact_bytes, compacted_allocation_bytes,
+                             allocation_bytes, reclaimed_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET
+            compacted_at = excluded.compacted_at, compact_method = excluded.compact_method,
+            compact_bytes = excluded.compact_bytes,
+            compacted_allocation_bytes = excluded.compacted_allocation_bytes,
+            allocation_bytes = excluded.allocation_bytes,
+            reclaimed_bytes = reclaim.reclaimed_bytes + excluded.reclaimed_bytes, error = NULL
+        """,
+        (vm_id, time.time(), method, reclaimed_bytes, allocation_bytes, allocation_bytes, reclaimed_bytes),
+    )
+
+
+def record_error(vm_id: str, error: str) -> None:
+    get_db().execute(
+        """
+        INSERT INTO reclaim (vm_id, error) VALUES (?, ?)
+        ON CONFLICT(vm_id) DO UPDATE SET error = excluded.error
+        """,
+        (vm_id, error),
+    )
+
+
+def get(vm_id: str) -> Optional[dict]:
+    row = get_db().execute("SELECT * FROM reclaim WHERE vm_id = ?", (vm_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def list_records() -> Dict[str, dict]:
+    return {r["vm_id"]: dict(r) for r in get_db().execute("SELECT * FROM reclaim").fetchall()}
+
+
+def forget(vm_id: str) -> None:
+    get_db().execute("DELETE FROM reclaim WHERE vm_id = ?", (vm_id,))
+
+
+def record_run(trigger: str, started_at: float, trimmed: int, compacted: int, skipped: int, errors: int,
+               reclaimed_bytes: int) -> None:
+    db = get_db()
+    db.execute(
+        """
+        INSERT INTO reclaim_runs (trigger, started_at, finished_at, trimmed, compacted, skipped, errors, reclaimed_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (trigger, started_at, time.time(), trimmed, compacted, skipped, errors, reclaimed_bytes),
+    )
+    db.execute(
+        "DELETE FROM reclaim_runs WHERE id <= (SELECT MAX(id) FROM reclaim_runs) - ?",
+        (_KEEP_RUNS,),
+    )
+
+
+def list_runs(limit: int = 20) -> List[dict]:
+    rows = get_db().execute("SELECT * FROM reclaim_runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [dict(r) for r in rows]
@@ -0,0 +1,42 @@
+import time
+from typing import Dict, Optional
+
+from .db import get_db, transaction
+
+# latency_ms is smoothed across probes; read_ms/write_ms are the last probe's medians
+_SMOOTHING = 0.3
+
+
+def record_probe(name: str, tier: str, read_ms: Optional[float], write_ms: Optional[float]) -> None:
+    with transaction() as db:
+        row = db.execute("SELECT latency_ms FROM storage_pools WHERE name = ?", (name,)).fetchone()
+        measured = [ms for ms in (read_ms, write_ms) if ms is not None]
+        sample = sum(measured) / len(measured)
+        latency = sample if row is None or row["latency_ms"] is None else (
+            row["latency_ms"] * (1 - _SMOOTHING) + sample * _SMOOTHING
+        )
+        db.execute(
+            """
+            INSERT INTO storage_pools (name, tier, read_ms, write_ms, latency_ms, samples, probed_at, error)
+            VALUES (?, ?, ?, ?, ?, 1, ?, NULL)
+            ON CONFLICT(name) DO UPDATE SET
+                tier = excluded.tier, read_ms = excluded.read_ms, write_ms = excluded.write_ms,
+                latency_ms = excluded.latency_ms, samples = storage_pools.samples + 1,
+                probed_at = excluded.probed_at, error = NULL
+            """,
+            (name, tier, read_ms, write_ms, latency, time.time()),
+        )
+
+
+def record_error(name: str, tier: str, error: str) -> None:
+    get_db().execute(
+        """
+        INSERT INTO storage_pools (name, tier, probed_at, error) VALUES (?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET tier = excluded.tier, probed_at = excluded.probed_at, error = excluded.error
+        """,
+        (name, tier, time.time(), error),
+    )
+
+
+def list_pools() -> Dict[str, dict]:
+    return {r["name"]: dict(r) for r in get_db().execute("SELECT * FROM storage_pools").fetchall()}
@@ -0,0 +1,58 @@
+import time
+from typing import Any, List, Optional
+
+from .db import get_db, owner_alive, process_owner, transaction
+
+# state: building | ready | failed
+
+
+def begin_build(os_name: str) -> bool:
+    """
+    Marks a template as building. Atomic across workers.
+
+    :return: False if another live worker is already building it
+    """
+    with transaction() as db:
+        row = db.execute("SELECT state, owner FROM vm_templates WHERE os_name = ?", (os_name,)).fetchone()
+        if row is not None and row["state"] == "building" and owner_alive(row["owner"]):
+            return False
+        db.execute(
+            """
+            INSERT OR REPLACE INTO vm_templates (os_name, state, created_at, owner)
+            VALUES (?, 'building', ?, ?)
+            """,
+            (os_name, time.time(), process_owner()),
+        )
+        return True
+
+
+def mark_ready(os_name: str, **fields: Any) -> None:
+    """
+    Stores the built template (disk_path, save_path, interface_xml, sizes, build_ms).
+    """
+    columns = ", ".join(f"{k} = ?" for k in fields)
+    get_db().execute(
+        f"UPDATE vm_templates SET state = 'ready', built_at = ?, error = NULL, {columns} WHERE os_name = ?",
+        (time.time(), *fields.values(), os_name),
+    )
+
+
+def mark_failed(os_name: str, error: str) -> None:
+    get_db().execute("UPDATE vm_templates SET state = 'failed', error = ? WHERE os_name = ?", (error, os_name))
+
+
+def count_clone(os_name: str) -> None:
+    get_db().execute("UPDATE vm_templates SET clones = clones + 1 WHERE os_name = ?", (os_name,))
+
+
+def get(os_name: str) -> Optional[dict]:
+    row = get_db().execute("SELECT * FROM vm_templates WHERE os_name = ?", (os_name,)).fetchone()
+    return dict(row) if row else None
+
+
+def list_templates() -> List[dict]:
+    return [dict(r) for r in get_db().execute("SELECT * FROM vm_templates ORDER BY os_name").fetchall()]
+
+
+def forget(os_name: str) -> None:
+    get_db().execute("DELETE FROM vm_templates WHERE os_name = ?", (os_name,))
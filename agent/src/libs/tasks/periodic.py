@@ -0,0 +1,109 @@
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List
+
+from src.libs.store.locks import process_lock
+
+# Held for the life of the worker that wins it; that worker runs singleton tasks
+_LEADER_LOCK = process_lock("task-leader")
+_leader = False
+_leader_guard = threading.Lock()
+
+
+def is_leader() -> bool:
+    """
+    Whether this worker runs the host-wide (singleton) tasks. Non-leaders keep
+    trying, so a new leader takes over when the old one exits.
+    """
+    global _leader
+    with _leader_guard:
+        if not _leader:
+            _leader = _LEADER_LOCK.acquire(blocking=False)
+        return _leader
+
+
+class PeriodicTask:
+    """
+    Runs `fn()` every `interval_s` seconds on a daemon thread. The first run
+    happens right away. Exceptions are printed and the task keeps going.
+    Singleton tasks only run in the leader worker (see is_leader).
+    """
+
+    def __init__(self, name: str, interval_s: float, fn: Callable[[], None], singleton: bool = False):
+        self.name = name
+        self.interval_s = interval_s
+        self.fn = fn
+        self.singleton = singleton
+        self.last_run_at: float | None = None
+        self.last_duration_s: float | None = None
+        self.last_error: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            if self.singleton and not is_leader():
+                self._stop.wait(self.interval_s)
+                continue
+            try:
+                self.fn()
+                self.last_error = None
+            except Exception as e:
+                traceback.print_exc()
+                self.last_error = f"{type(e).__name__}: {e}"
+            self.last_duration_s = time.monotonic() - t0
+            self.last_run_at = time.time()
+            self._stop.wait(max(self.interval_s - self.last_duration_s, 0))
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"task-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_s": self.interval_s,
+            "singleton": self.singleton,
+            "alive": self._thread is not None and self._thread.is_alive(),
+            "last_run_at": self.last_run_at,
+            "last_duration_s": self.last_duration_s,
+            "last_error": self.last_error,
+        }
+
+
+_TASKS: Dict[str, PeriodicTask] = {}
+
+
+def register_task(name: str, interval_s: float, fn: Callable[[], None], singleton: bool = False) -> PeriodicTask:
+    """
+    Registers a background task. Tasks start with the server (see server.lifespan).
+
+    :param singleton: Run in one worker per host only (host-wide work like cleanup)
+    """
+    task = PeriodicTask(name, interval_s, fn, singleton)
+    _TASKS[name] = task
+    return task
+
+
+def start_tasks() -> None:
+    for task in _TASKS.values():
+        task.start()
+
+
+def stop_tasks() -> None:
+    for task in _TASKS.values():
+        task.stop()
+
+
+def list_tasks() -> List[dict]:
+    return [t.to_dict() for t in _TASKS.values()]
@@ -0,0 +1,58 @@
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Optional, Sequence
+
+# Upper bounds in milliseconds; the last bucket is everything above
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram plus a window of recent samples for
+    percentiles. Constant memory, O(log buckets) per observation.
+    """
+
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS, window: int = 1024):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float, error: bool = False) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.sum_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self._recent.append(ms)
+            if error:
+                self.errors += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            counts = list(self.counts)
+            count, errors, sum_ms, max_ms = self.count, self.errors, self.sum_ms, self.max_ms
+
+        def pct(p: float) -> Optional[float]:
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 3)
+
+        labels = [f"le_{b:g}ms" for b in self.buckets_ms] + ["inf"]
+        return {
+            "count": count,
+            "errors": errors,
+            "mean_ms": round(sum_ms / count, 3) if count else None,
+            "max_ms": round(max_ms, 3),
+            "total_ms": round(sum_ms, 3),
+            "p50_ms": pct(0.50),
+            "p90_ms": pct(0.90),
+            "p99_ms": pct(0.99),
+            "buckets": dict(zip(labels, counts)),
+        }
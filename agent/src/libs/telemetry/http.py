@@ -0,0 +1,74 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict
+
+from starlette.routing import Match
+
+from .histogram import LatencyHistogram
+
+_ROUTES: Dict[str, LatencyHistogram] = {}
+_IN_FLIGHT: Dict[str, int] = {}
+_STATUS: Dict[str, Dict[str, int]] = {}
+_LOCK = threading.Lock()
+
+
+def route_key(app, scope) -> str:
+    """
+    "METHOD /route/{template}" for a request, so /vms/a and /vms/b share a
+    histogram. Unknown paths are grouped together to keep the key set bounded.
+    """
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope.get('method', 'WS')} {route.path}"
+    return f"{scope.get('method', 'WS')} <unmatched>"
+
+
+@dataclass
+class _Tracker:
+    status: int = 500
+
+
+@contextmanager
+def track_request(key: str):
+    """
+    Counts the request as in flight while the block runs and records its
+    latency and status class afterwards. Set `.status` on the yielded object.
+    """
+    with _LOCK:
+        _IN_FLIGHT[key] = _IN_FLIGHT.get(key, 0) + 1
+        hist = _ROUTES.get(key)
+        if hist is None:
+            hist = _ROUTES[key] = LatencyHistogram()
+    tracker = _Tracker()
+    t0 = time.perf_counter()
+    try:
+        yield tracker
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        hist.observe(ms, error=tracker.status >= 500)
+        with _LOCK:
+            _IN_FLIGHT[key] -= 1
+            per_status = _STATUS.setdefault(key, {})
+            cls = f"{tracker.status // 100}xx"
+            per_status[cls] = per_status.get(cls, 0) + 1
+
+
+def route_stats() -> dict:
+    with _LOCK:
+        keys = sorted(_ROUTES)
+        in_flight = dict(_IN_FLIGHT)
+        status = {k: dict(v) for k, v in _STATUS.items()}
+    return {
+        "in_flight_total": sum(in_flight.values()),
+        "routes": {
+            k: {
+                "in_flight": in_flight.get(k, 0),
+                "status": status.get(k, {}),
+                **_ROUTES[k].to_dict(),
+            }
+            for k in keys
+        },
+    }
@@ -0,0 +1,161 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from .histogram import LatencyHistogram
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "./.cache/traces/agent.jsonl")
+TRACE_FILE_MAX_MB = int(os.getenv("TRACE_FILE_MAX_MB", "20"))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "5"))
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: Optional[str] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    start: float = field(default_factory=time.time)
+    t0: float = field(default_factory=time.perf_counter)
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "attrs": self.attrs,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+_AGGREGATES: Dict[str, LatencyHistogram] = {}
+_AGGREGATES_LOCK = threading.Lock()
+
+_writer: Optional[logging.Logger] = None
+_writer_lock = threading.Lock()
+
+
+def _trace_writer() -> Optional[logging.Logger]:
+    """
+    JSON-lines trace file, rotated by size. Opened on first span; if the file
+    can't be opened, spans are still aggregated in memory.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                logger = logging.getLogger("agent.traces")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                try:
+                    Path(TRACE_FILE).parent.mkdir(parents=True, exist_ok=True)
+                    handler = RotatingFileHandler(
+                        TRACE_FILE,
+                        maxBytes=TRACE_FILE_MAX_MB * 1024 * 1024,
+                        backupCount=TRACE_FILE_BACKUPS,
+                    )
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger.addHandler(handler)
+                except OSError as e:
+                    print(f"Trace file {TRACE_FILE} unavailable ({e}); keeping span aggregates only")
+                _writer = logger
+    return _writer if _writer.handlers else None
+
+
+def _finish(span: Span) -> None:
+    span.duration_ms = round((time.perf_counter() - span.t0) * 1000, 3)
+    with _AGGREGATES_LOCK:
+        hist = _AGGREGATES.get(span.name)
+        if hist is None:
+            hist = _AGGREGATES[span.name] = LatencyHistogram()
+    hist.observe(span.duration_ms, error=span.error is not None)
+
+    writer = _trace_writer()
+    if writer is not None:
+        writer.info(json.dumps(span.to_dict(), default=str))
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """
+    Times a block as a span, nested under the current span (if any).
+
+        with span("format.clone", vm=vm_id) as s:
+            ...
+            s.set(bytes=n)
+    """
+    if not TRACING_ENABLED:
+        yield Span(name=name, trace_id="")
+        return
+
+    parent = _current.get()
+    s = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        parent_id=parent.span_id if parent else None,
+        attrs=attrs,
+    )
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        _current.reset(token)
+        _finish(s)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator form of `span`, named after the function by default.
+    """
+    def wrap(fn: Callable) -> Callable:
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def current_trace_id() -> Optional[str]:
+    s = _current.get()
+    return s.trace_id if s else None
+
+
+def span_stats() -> dict:
+    with _AGGREGATES_LOCK:
+        items = list(_AGGREGATES.items())
+    return {
+        "trace_file": TRACE_FILE if TRACING_ENABLED else None,
+        "spans": {name: hist.to_dict() for name, hist in sorted(items)},
+    }
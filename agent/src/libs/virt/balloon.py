@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.host.pressure import read_pressure
+from src.libs.jobs.jobs import list_jobs
+from .connection import get_connection
+
+load_dotenv()
+
+BALLOON_ENABLED = os.getenv("BALLOON_ENABLED", "true").lower() == "true"
+BALLOON_INTERVAL_S = float(os.getenv("BALLOON_INTERVAL_S", "10"))
+# Never shrink a guest below max(BALLOON_MIN_MIB, BALLOON_MIN_FRACTION x its assigned memory)
+BALLOON_MIN_MIB = int(os.getenv("BALLOON_MIN_MIB", "512"))
+BALLOON_MIN_FRACTION = float(os.getenv("BALLOON_MIN_FRACTION", "0.5"))
+# Idle guests are shrunk until this share of their memory is still free
+BALLOON_TARGET_FREE_PCT = float(os.getenv("BALLOON_TARGET_FREE_PCT", "25"))
+# ... and under host memory pressure, until this share
+BALLOON_PRESSURE_TARGET_FREE_PCT = float(os.getenv("BALLOON_PRESSURE_TARGET_FREE_PCT", "10"))
+# Largest shrink per guest per pass; growing back is never rate limited
+BALLOON_MAX_STEP_MIB = int(os.getenv("BALLOON_MAX_STEP_MIB", "512"))
+# Guest pressure: less free than this, or more major faults per second than this
+BALLOON_GUEST_MIN_FREE_PCT = float(os.getenv("BALLOON_GUEST_MIN_FREE_PCT", "10"))
+BALLOON_MAX_MAJOR_FAULTS_S = float(os.getenv("BALLOON_MAX_MAJOR_FAULTS_S", "20"))
+# Host pressure: /proc/pressure/memory "some avg10" above this (percent of time stalled)
+BALLOON_HOST_PSI_HIGH = float(os.getenv("BALLOON_HOST_PSI_HIGH", "10"))
+
+# Guest stats refresh interval; matches <stats period> in vm_template.xml
+BALLOON_STATS_PERIOD_S = 10
+# How long the assigned size / hugepage flag read from the config is trusted
+_CONFIG_TTL_S = 60
+
+MIB = 1024  # KiB
+
+
+@dataclass
+class _DomainConfig:
+    assigned_kib: int     # <currentMemory> of the persistent config
+    hugepages: bool
+    read_at: float
+
+
+_CONFIG: Dict[str, _DomainConfig] = {}
+# vm -> (major_fault counter, monotonic time) from the previous pass
+_FAULTS: Dict[str, tuple] = {}
+_ACTIONS: Deque[dict] = deque(maxlen=200)
+_TOTALS = {"passes": 0, "shrunk": 0, "grown": 0, "errors": 0}
+_LOCK = threading.Lock()
+
+
+def _domain_config(domain: libvirt.virDomain, current_kib: int = 0) -> _DomainConfig:
+    name = domain.name()
+    cached = _CONFIG.get(name)
+    # a balloon above the cached size means the VM was grown meanwhile (maybe by another worker)
+    if cached is not None and time.monotonic() - cached.read_at < _CONFIG_TTL_S and current_kib <= cached.assigned_kib:
+        return cached
+    root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+    cfg = _DomainConfig(
+        assigned_kib=int(root.findtext("currentMemory") or root.findtext("memory")),
+        hugepages=root.find("./memoryBacking/hugepages") is not None,
+        read_at=time.monotonic(),
+    )
+    _CONFIG[name] = cfg
+    return cfg
+
+
+def forget_config(name: str) -> None:
+    """
+    Drops the cached config of a VM whose memory was just changed.
+    """
+    _CONFIG.pop(name, None)
+
+
+def _host_pressure() -> Optional[float]:
+    psi = read_pressure("memory")
+    if psi is None or "some" not in psi:
+        return None
+    return psi["some"].get("avg10")
+
+
+def _floor_kib(assigned_kib: int) -> int:
+    return min(assigned_kib, max(BALLOON_MIN_MIB * MIB, int(assigned_kib * BALLOON_MIN_FRACTION)))
+
+
+def _decide(name: str, stats: dict, cfg: _DomainConfig, host_pressure: bool) -> dict:
+    """
+    New balloon target for one guest, from its balloon stats (KiB).
+
+    :return: {"vm", "current_kib", "target_kib", "reason"}; target == current means no change
+    """
+    current = stats.get("balloon.current", 0)
+    entry = {"vm": name, "current_kib": current, "target_kib": current, "reason": None}
+
+    # usable ~ MemAvailable, available ~ MemTotal as the guest sees them
+    usable, available = stats.get("balloon.usable"), stats.get("balloon.available")
+    if not usable or not available:
+        entry["reason"] = "no guest stats"
+        return entry
+
+    now = time.monotonic()
+    faults = stats.get("balloon.major_fault")
+    fault_rate = 0.0
+    prev = _FAULTS.get(name)
+    if faults is not None:
+        if prev is not None and now > prev[1] and faults >= prev[0]:
+            fault_rate = (faults - prev[0]) / (now - prev[1])
+        _FAULTS[name] = (faults, now)
+
+    assigned = cfg.assigned_kib
+    free_pct = usable / available * 100
+
+    # guest under pressure: give everything back at once
+    if free_pct < BALLOON_GUEST_MIN_FREE_PCT or fault_rate > BALLOON_MAX_MAJOR_FAULTS_S:
+        if current < assigned:
+            entry.update(target_kib=assigned, reason=f"guest pressure (free {free_pct:.0f}%, {fault_rate:.0f} major faults/s)")
+        return entry
+
+    # idle: shrink towards a size that leaves target_free of it unused
+    target_free = BALLOON_PRESSURE_TARGET_FREE_PCT if host_pressure else BALLOON_TARGET_FREE_PCT
+    used = available - usable
+    wanted = int(used / (1 - target_free / 100))
+    floor = _floor_kib(assigned)
+    if wanted < current:
+        target = max(floor, wanted, current - BALLOON_MAX_STEP_MIB * MIB)
+        # ignore moves under 64 MiB, they only churn the guest
+        if current - target >= 64 * MIB:
+            entry.update(target_kib=target, reason=f"idle (free {free_pct:.0f}%)")
+    elif wanted > current and current < assigned and not host_pressure:
+        # demand is back: grow, but only up to what the VM was given
+        target = min(assigned, wanted)
+        if target - current >= 64 * MIB:
+            entry.update(target_kib=target, reason=f"demand (free {free_pct:.0f}%)")
+    return entry
+
+
+def balance_memory() -> List[dict]:
+    """
+    One controller pass over all running guests (background task). Reads
+    balloon stats for every domain in one getAllDomainStats call and moves
+    balloon targets live only: the configured memory never changes, so a
+    restart gives the guest its full size back.
+
+    :return: The changes made
+    """
+    if not BALLOON_ENABLED:
+        return []
+
+    psi = _host_pressure()
+    host_pressure = psi is not None and psi > BALLOON_HOST_PSI_HIGH
+    busy = {j.vm_id for j in list_jobs(active_only=True) if j.vm_id}
+
+    conn = get_connection()
+    changes = []
+    try:
+        records = conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_BALLOON, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE
+        )
+        seen = set()
+        for domain, stats in records:
+            name = domain.name()
+            seen.add(name)
+            # migrations, formats, restarts: leave the guest alone
+            if name in busy:
+                continue
+            try:
+                if not stats.get("balloon.last-update"):
+                    # stats were never enabled for this guest (defined before the template had <stats>)
+                    domain.setMemoryStatsPeriod(BALLOON_STATS_PERIOD_S, libvirt.VIR_DOMAIN_AFFECT_LIVE)
+                    continue
+                cfg = _domain_config(domain, stats.get("balloon.current", 0))
+                # hugepage-backed memory isn't returned to the host by the balloon
+                if cfg.hugepages:
+                    continue
+                entry = _decide(name, stats, cfg, host_pressure)
+                if entry["target_kib"] == entry["current_kib"]:
+                    continue
+                domain.setMemoryFlags(entry["target_kib"], libvirt.VIR_DOMAIN_AFFECT_LIVE)
+                entry["at"] = time.time()
+                changes.append(entry)
+            except libvirt.libvirtError as e:
+                with _LOCK:
+                    _TOTALS["errors"] += 1
+                print(f"Balloon: {name}: {e}")
+
+        for name in set(_FAULTS) - seen:
+            _FAULTS.pop(name, None)
+            _CONFIG.pop(name, None)
+    finally:
+        conn.close()
+
+    with _LOCK:
+        _TOTALS["passes"] += 1
+        for entry in changes:
+            _TOTALS["shrunk" if entry["target_kib"] < entry["current_kib"] else "grown"] += 1
+            _ACTIONS.append(entry)
+    return changes
+
+
+def balloon_report() -> dict:
+    """
+    Memory the balloons currently hold back from each running guest, and
+    the host total. Computed from live stats, so any worker can serve it.
+    """
+    conn = get_connection()
+    try:
+        records = conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_BALLOON, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE
+        )
+        vms = []
+        for domain, stats in records:
+            try:
+                cfg = _domain_config(domain, stats.get("balloon.current", 0))
+            except libvirt.libvirtError:
+                continue
+            current = stats.get("balloon.current", 0)
+            vms.append({
+                "vm": domain.name(),
+                "assigned_mib": cfg.assigned_kib // MIB,
+                "balloon_mib": current // MIB,
+                "floor_mib": _floor_kib(cfg.assigned_kib) // MIB,
+                "reclaimed_mib": max(cfg.assigned_kib - current, 0) // MIB,
+                "guest_usable_mib": stats["balloon.usable"] // MIB if "balloon.usable" in stats else None,
+                "hugepages": cfg.hugepages,
+            })
+    finally:
+        conn.close()
+
+    with _LOCK:
+        totals = dict(_TOTALS)
+        recent = list(_ACTIONS)[-20:]
+    return {
+        "enabled": BALLOON_ENABLED,
+        "host_memory_psi_avg10": _host_pressure(),
+        "reclaimed_mib": sum(v["reclaimed_mib"] for v in vms),
+        "vms": vms,
+        "totals": totals,
+        "recent_actions": recent,
+    }
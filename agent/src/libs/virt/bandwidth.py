@@ -0,0 +1,131 @@
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.host.sysfs import iface_link_speed_mbps
+from src.models.network_vm import NetworkBandwidthUpdate
+from .create import __mbps_to_kibps__
+
+load_dotenv()
+
+# Host NIC the VM network goes out through; found from the libvirt network when unset
+VM_UPLINK_IFACE = os.getenv("VM_UPLINK_IFACE")
+
+# NetworkSpec field -> setInterfaceParameters key (KiB/s, burst in KiB)
+_PARAMS = {
+    "in_avg_mbps": "inbound.average",
+    "in_peak_mbps": "inbound.peak",
+    "in_burst_mbps": "inbound.burst",
+    "out_avg_mbps": "outbound.average",
+    "out_peak_mbps": "outbound.peak",
+    "out_burst_mbps": "outbound.burst",
+}
+
+
+def _kibps_to_mbps(kibps: int) -> float:
+    return round(kibps * 1024 * 8 / 1_000_000, 3)
+
+
+def _interface(domain: libvirt.virDomain) -> ET.Element:
+    iface = ET.fromstring(domain.XMLDesc(0)).find("./devices/interface")
+    if iface is None:
+        raise ValueError("VM has no network interface")
+    return iface
+
+
+def _mac(domain: libvirt.virDomain) -> str:
+    # setInterfaceParameters/interfaceParameters identify the NIC by MAC
+    return _interface(domain).find("mac").get("address")
+
+
+def uplink_speed_mbps(conn: libvirt.virConnect, domain: libvirt.virDomain) -> Optional[int]:
+    """
+    Link speed of the host NIC behind the VM's interface: VM_UPLINK_IFACE,
+    else the libvirt network's forward device or the physical ports of its
+    bridge. None when it can't be told (NAT without forward dev, virtual NICs).
+    """
+    if VM_UPLINK_IFACE:
+        return iface_link_speed_mbps(VM_UPLINK_IFACE)
+
+    source = _interface(domain).find("source")
+    if source is None:
+        return None
+    bridge = source.get("bridge")
+    if source.get("network"):
+        try:
+            net = ET.fromstring(conn.networkLookupByName(source.get("network")).XMLDesc(0))
+        except libvirt.libvirtError:
+            return None
+        forward = net.find("forward")
+        if forward is not None and forward.get("dev"):
+            return iface_link_speed_mbps(forward.get("dev"))
+        bridge = net.find("bridge").get("name") if net.find("bridge") is not None else None
+    if not bridge:
+        return None
+
+    speeds = []
+    try:
+        ports = list(Path(f"/sys/class/net/{bridge}/brif").iterdir())
+    except OSError:
+        return None
+    for port in ports:
+        # physical NICs have a device link; vnet taps and veths don't
+        if (Path("/sys/class/net") / port.name / "device").exists():
+            speed = iface_link_speed_mbps(port.name)
+            if speed:
+                speeds.append(speed)
+    return max(speeds) if speeds else None
+
+
+def get_bandwidth(domain: libvirt.virDomain) -> dict:
+    """
+    Limits on the VM's interface as libvirt reports them: live values for a
+    running VM, and the persistent config. 0 = unlimited.
+    """
+    mac = _mac(domain)
+
+    def read(flags: int) -> Dict[str, float]:
+        params = domain.interfaceParameters(mac, flags)
+        return {field: _kibps_to_mbps(params.get(key, 0)) for field, key in _PARAMS.items()}
+
+    return {
+        "mac": mac,
+        "live": read(libvirt.VIR_DOMAIN_AFFECT_LIVE) if domain.isActive() else None,
+        "config": read(libvirt.VIR_DOMAIN_AFFECT_CONFIG),
+    }
+
+
+def set_bandwidth(conn: libvirt.virConnect, domain: libvirt.virDomain, update: NetworkBandwidthUpdate) -> dict:
+    """
+    Reshapes the VM's interface with setInterfaceParameters, live and in the
+    persistent config, no reboot. Only the fields sent change.
+
+    :return: Applied limits read back from libvirt plus the uplink speed checked against
+    :raises ValueError: peak below average, or a rate above the host link speed
+    """
+    changes = {k: v for k, v in update.model_dump(exclude_unset=True).items() if v is not None}
+    current = get_bandwidth(domain)["config"]
+    merged = {**current, **changes}
+
+    link = uplink_speed_mbps(conn, domain)
+    for direction in ("in", "out"):
+        avg, peak = merged[f"{direction}_avg_mbps"], merged[f"{direction}_peak_mbps"]
+        if avg and peak and peak < avg:
+            raise ValueError(f"{direction}_peak_mbps ({peak}) is below {direction}_avg_mbps ({avg})")
+        if link:
+            for field in (f"{direction}_avg_mbps", f"{direction}_peak_mbps"):
+                if field in changes and changes[field] > link:
+                    raise ValueError(f"{field} ({changes[field]}) exceeds the host link speed ({link} Mbps)")
+
+    if changes:
+        params = {_PARAMS[k]: __mbps_to_kibps__(v) for k, v in changes.items()}
+        flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        if domain.isActive():
+            flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+        domain.setInterfaceParameters(_mac(domain), params, flags)
+
+    return {**get_bandwidth(domain), "link_speed_mbps": link}
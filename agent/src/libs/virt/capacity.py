@@ -0,0 +1,355 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import libvirt
+import psutil
+from dotenv import load_dotenv
+
+from src.libs.cloudimgs.check import CLOUDIMG_DIR
+from src.libs.host.hugepages import read_hugepage_pools
+from src.libs.store import capacity as ledger
+from src.libs.store import images as image_index
+from .connection import get_connection
+from .errors import InsufficientResourcesError
+from .get_pool_dir import get_pool_dir
+from .hugepages import domain_hugepages
+from .lvm import thin_pool_usage
+
+load_dotenv()
+
+# Committed vCPUs / memory / virtual disk size allowed per unit the host has
+CPU_OVERCOMMIT_RATIO = float(os.getenv("CPU_OVERCOMMIT_RATIO", "4"))
+MEMORY_OVERCOMMIT_RATIO = float(os.getenv("MEMORY_OVERCOMMIT_RATIO", "1"))
+DISK_OVERCOMMIT_RATIO = float(os.getenv("DISK_OVERCOMMIT_RATIO", "1"))
+# Kept for the host itself (libvirtd, QEMU overhead, page cache) before the ratios apply
+HOST_RESERVED_CPUS = int(os.getenv("HOST_RESERVED_CPUS", "0"))
+HOST_RESERVED_MEMORY_MIB = int(os.getenv("HOST_RESERVED_MEMORY_MIB", "2048"))
+# false = creates are never refused on committed capacity (GET /capacity still reports)
+CAPACITY_ADMISSION = os.getenv("CAPACITY_ADMISSION", "true").lower() == "true"
+# Full re-read of every domain; creates, deletes and resizes update the ledger as they happen
+CAPACITY_SYNC_INTERVAL_S = float(os.getenv("CAPACITY_SYNC_INTERVAL_S", "300"))
+
+GIB = 1024 ** 3
+
+# pool name -> target directory, refreshed by every pass that has a connection
+_POOL_DIRS: Dict[str, str] = {}
+# pool name -> (size, available) of LVM pools, whose target (/dev/<vg>) isn't a filesystem
+_BLOCK_POOLS: Dict[str, Tuple[int, int]] = {}
+_LOCK = threading.Lock()
+
+
+def _refresh_pool_dirs(conn: libvirt.virConnect) -> Dict[str, str]:
+    # storage_pools imports this module
+    from .storage_pools import pool_config
+
+    dirs, block = {}, {}
+    for pool in conn.listAllStoragePools(libvirt.VIR_CONNECT_LIST_STORAGE_POOLS_ACTIVE):
+        try:
+            dirs[pool.name()] = get_pool_dir(pool)
+            if ET.fromstring(pool.XMLDesc(0)).get("type") == "logical":
+                cfg = pool_config(pool.name())
+                if cfg is not None and cfg.thin_pool:
+                    block[pool.name()] = thin_pool_usage(cfg.volume_group, cfg.thin_pool)
+                else:
+                    _, size, _, available = pool.info()
+                    block[pool.name()] = (size, available)
+        except (RuntimeError, subprocess.CalledProcessError, libvirt.libvirtError):
+            continue
+    with _LOCK:
+        _POOL_DIRS.clear()
+        _POOL_DIRS.update(dirs)
+        _BLOCK_POOLS.clear()
+        _BLOCK_POOLS.update(block)
+    return dirs
+
+
+def domain_commitment(domain: libvirt.virDomain, pool_dirs: Dict[str, str]) -> dict:
+    """
+    What a defined domain holds on the host, from its persistent config:
+    configured (not maximum) vCPUs and memory, hugepages, and the virtual
+    size of its disks.
+
+    :param pool_dirs: pool name -> target directory, to attribute disks to pools
+    :return: Row for the capacity ledger
+    """
+    root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+    vcpu = root.find("vcpu")
+    vcpus = int(vcpu.get("current") or vcpu.text)
+
+    hugepages = domain_hugepages(root)
+    if hugepages is not None:
+        # hugepages back the whole <memory>, ballooned or not
+        page_kib, pages, _node = hugepages
+        memory_mib, hugepage_kib = pages * page_kib // 1024, page_kib
+    else:
+        memory_mib, hugepage_kib = int(root.findtext("currentMemory") or root.findtext("memory")) // 1024, None
+
+    by_dir = {path.rstrip("/"): name for name, path in pool_dirs.items()}
+    disk_bytes, pool = 0, None
+    for disk in root.findall("./devices/disk[@device='disk']"):
+        target, source = disk.find("target"), disk.find("source")
+        if target is None or source is None:
+            continue
+        try:
+            disk_bytes += domain.blockInfo(target.get("dev"), 0)[0]
+        except libvirt.libvirtError:
+            continue
+        path = source.get("file") or source.get("dev") or ""
+        pool = pool or by_dir.get(os.path.dirname(path))
+
+    return {
+        "vcpus": vcpus,
+        "memory_mib": memory_mib,
+        "hugepage_kib": hugepage_kib,
+        "disk_bytes": disk_bytes,
+        "pool": pool,
+    }
+
+
+def refresh_vm(conn: libvirt.virConnect, vm_id: str) -> None:
+    """
+    Re-reads one VM into the ledger after something changed it (create,
+    resize, migration), or drops it if the domain is gone.
+    """
+    try:
+        domain = conn.lookupByName(vm_id)
+    except libvirt.libvirtError:
+        ledger.forget(vm_id)
+        return
+    try:
+        with _LOCK:
+            pool_dirs = dict(_POOL_DIRS)
+        if not pool_dirs:
+            pool_dirs = _refresh_pool_dirs(conn)
+        ledger.record(vm_id, **domain_commitment(domain, pool_dirs))
+    except libvirt.libvirtError as e:
+        # the periodic sync picks it up
+        print(f"Capacity: could not read {vm_id}: {e}")
+
+
+def sync_ledger() -> int:
+    """
+    Periodic task: rebuilds the ledger from every defined domain, catching
+    VMs defined, changed or removed behind the agent's back.
+
+    :return: Ledger rows that changed
+    """
+    conn = get_connection()
+    try:
+        pool_dirs = _refresh_pool_dirs(conn)
+        entries = {}
+        for domain in conn.listAllDomains():
+            try:
+                entries[domain.name()] = domain_commitment(domain, pool_dirs)
+            except (libvirt.libvirtError, ET.ParseError) as e:
+                print(f"Capacity: skipping {domain.name()}: {e}")
+    finally:
+        conn.close()
+
+    changed = ledger.replace_defined(entries)
+    if changed:
+        print(f"Capacity: ledger resynced, {changed} rows changed")
+    return changed
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Report                                    #
+# ---------------------------------------------------------------------------- #
+def _pool_dirs() -> Dict[str, str]:
+    with _LOCK:
+        if _POOL_DIRS:
+            return dict(_POOL_DIRS)
+    conn = get_connection()
+    try:
+        return _refresh_pool_dirs(conn)
+    finally:
+        conn.close()
+
+
+def _capacity(entries: List[dict], pool_dirs: Dict[str, str]) -> dict:
+    cpus = psutil.cpu_count() or 1
+    total_mib = psutil.virtual_memory().total // 1024 ** 2
+    pools = read_hugepage_pools()
+    hugepage_mib = sum(size * p["total"] for size, p in pools.items()) // 1024
+
+    cpu_allocatable = int(max(cpus - HOST_RESERVED_CPUS, 0) * CPU_OVERCOMMIT_RATIO)
+    cpu_committed = sum(e["vcpus"] for e in entries)
+    # hugepages are carved out of RAM up front; regular guests share the rest
+    memory_allocatable = int(max(total_mib - hugepage_mib - HOST_RESERVED_MEMORY_MIB, 0) * MEMORY_OVERCOMMIT_RATIO)
+    memory_committed = sum(e["memory_mib"] for e in entries if not e["hugepage_kib"])
+
+    hugepages = {}
+    for size, pool in pools.items():
+        committed = sum(-(-e["memory_mib"] * 1024 // size) for e in entries if e["hugepage_kib"] == size)
+        hugepages[f"{size}kB"] = {
+            "total": pool["total"],
+            "committed": committed,
+            "free": pool["total"] - committed,
+        }
+
+    with _LOCK:
+        block_pools = dict(_BLOCK_POOLS)
+    storage = {}
+    for name, path in pool_dirs.items():
+        if name in block_pools:
+            total, free = block_pools[name]
+            used = total - free
+        else:
+            try:
+                total, used, free = shutil.disk_usage(path)
+            except OSError:
+                continue
+        allocatable = int(total * DISK_OVERCOMMIT_RATIO)
+        committed = sum(e["disk_bytes"] for e in entries if e["pool"] == name)
+        storage[name] = {
+            "path": path,
+            "size_bytes": total,
+            "used_bytes": used,
+            "available_bytes": free,
+            "allocatable_bytes": allocatable,
+            "committed_bytes": committed,
+            "free_bytes": allocatable - committed,
+        }
+
+    return {
+        "cpu": {
+            "host": cpus,
+            "reserved": HOST_RESERVED_CPUS,
+            "allocatable": cpu_allocatable,
+            "committed": cpu_committed,
+            "free": cpu_allocatable - cpu_committed,
+        },
+        "memory_mib": {
+            "host": total_mib,
+            "hugepages": hugepage_mib,
+            "reserved": HOST_RESERVED_MEMORY_MIB,
+            "allocatable": memory_allocatable,
+            "committed": memory_committed,
+            "free": memory_allocatable - memory_committed,
+        },
+        "hugepages": hugepages,
+        "pools": storage,
+    }
+
+
+def _image_cache() -> dict:
+    indexed = image_index.list_images()
+    cached = sum(i["size_bytes"] or 0 for i in indexed)
+    try:
+        usage = shutil.disk_usage(CLOUDIMG_DIR)
+    except OSError:
+        return {"path": str(CLOUDIMG_DIR), "images": len(indexed), "cached_bytes": cached}
+    return {
+        "path": str(CLOUDIMG_DIR),
+        "images": len(indexed),
+        "cached_bytes": cached,
+        "size_bytes": usage.total,
+        "available_bytes": usage.free,
+    }
+
+
+def capacity_report() -> dict:
+    """
+    Allocatable and committed CPU, memory, hugepages, pool disk and image
+    cache space. Reads the ledger and the host counters only, no domain
+    XML, so it stays cheap with many VMs.
+    """
+    entries = ledger.list_entries()
+    return {
+        "ratios": {"cpu": CPU_OVERCOMMIT_RATIO, "memory": MEMORY_OVERCOMMIT_RATIO, "disk": DISK_OVERCOMMIT_RATIO},
+        "admission": CAPACITY_ADMISSION,
+        **_capacity(entries, _pool_dirs()),
+        "image_cache": _image_cache(),
+        "vms": {
+            "defined": sum(1 for e in entries if e["state"] == "defined"),
+            "creating": sum(1 for e in entries if e["state"] == "reserved"),
+        },
+        "ledger_updated_at": max((e["updated_at"] for e in entries), default=None),
+        "at": time.time(),
+    }
+
+
+def pool_usage(conn: libvirt.virConnect, exclude: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Per-pool disk sizes and committed bytes (the "pools" part of the report).
+
+    :param exclude: VM whose own ledger row is not counted
+    """
+    entries = [e for e in ledger.list_entries() if e["vm_id"] != exclude]
+    return _capacity(entries, _refresh_pool_dirs(conn))["pools"]
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Admission                                  #
+# ---------------------------------------------------------------------------- #
+def check_fit(
+    vcpus: int,
+    memory_mib: int,
+    hugepage_kib: Optional[int],
+    disk_gb: int,
+    pool: Optional[str],
+    exclude: Optional[str] = None,
+    pool_dirs: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """
+    Whether a VM of this size still fits under the overcommit ratios.
+
+    :param pool: Pool the disk goes to; None = don't check disk
+    :param exclude: VM whose own ledger row is not counted (re-creates)
+    :return: One message per resource that doesn't fit; empty if it fits
+    """
+    entries = [e for e in ledger.list_entries() if e["vm_id"] != exclude]
+    cap = _capacity(entries, pool_dirs if pool_dirs is not None else _pool_dirs())
+    problems = []
+
+    if vcpus > cap["cpu"]["free"]:
+        problems.append(f"vCPUs: need {vcpus}, {max(cap['cpu']['free'], 0)} of {cap['cpu']['allocatable']} left")
+    if hugepage_kib is None:
+        if memory_mib > cap["memory_mib"]["free"]:
+            problems.append(
+                f"memory: need {memory_mib} MiB, {max(cap['memory_mib']['free'], 0)} of "
+                f"{cap['memory_mib']['allocatable']} MiB left"
+            )
+    else:
+        pages = cap["hugepages"].get(f"{hugepage_kib}kB", {"free": 0})
+        needed = -(-memory_mib * 1024 // hugepage_kib)
+        if needed > pages["free"]:
+            problems.append(f"hugepages: need {needed} x {hugepage_kib} KiB, {max(pages['free'], 0)} uncommitted")
+
+    if pool is not None:
+        storage = cap["pools"].get(pool)
+        if storage is None:
+            problems.append(f"disk: pool '{pool}' not found")
+        elif disk_gb * GIB > storage["free_bytes"]:
+            problems.append(
+                f"disk: need {disk_gb} GiB in pool '{pool}', {max(storage['free_bytes'], 0) // GIB} GiB left"
+            )
+    return problems
+
+
+def admit(
+    conn: libvirt.virConnect,
+    vm_id: str,
+    vcpus: int,
+    memory_mib: int,
+    hugepage_kib: Optional[int],
+    disk_gb: int,
+    pool: str,
+) -> None:
+    """
+    Refuses a create that would exceed the ratios, otherwise reserves its
+    resources in the ledger so concurrent creates see them. Runs before
+    the volume is allocated; callers hold PLACEMENT_LOCK.
+
+    :raises InsufficientResourcesError: The VM doesn't fit
+    """
+    if CAPACITY_ADMISSION:
+        problems = check_fit(vcpus, memory_mib, hugepage_kib, disk_gb, pool, exclude=vm_id, pool_dirs=_refresh_pool_dirs(conn))
+        if problems:
+            raise InsufficientResourcesError("Host is out of capacity: " + "; ".join(problems))
+    ledger.reserve(vm_id, vcpus, memory_mib, hugepage_kib, disk_gb * GIB, pool)
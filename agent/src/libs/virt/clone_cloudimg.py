@@ -3,6 +3,8 @@ import shutil
 import subprocess
 from pathlib import Path
 
+from src.libs.telemetry.tracing import traced
+
 def clone_cloudimg(pool_dir: str, vm_name: str, base_image_path: str, disk_gb: int) -> str:
     qemu_img = shutil.which("qemu-img")
     if not qemu_img:
@@ -28,6 +30,7 @@ def clone_cloudimg(pool_dir: str, vm_name: str, base_image_path: str, disk_gb: i
 
     return str(vm_disk_path)
 
+@traced("clone.full_clone_cloud_image_into_volume")
 def full_clone_cloud_image_into_volume(base_image_path: str, vol_path: str, disk_gb: int) -> None:
     qemu_img = shutil.which("qemu-img")
     if not qemu_img:
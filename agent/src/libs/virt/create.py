@@ -4,9 +4,19 @@ import os
 from pydantic import BaseModel
 
 from .connection import get_connection
+from .placement import PLACEMENT_LOCK, place_new_vm, render_cputune, render_numatune
+from .hugepages import plan_hugepages, render_memory_backing
+from .guest_agent import render_guest_agent_channel
+from .iotune import render_iotune
+from .resources import plan_maximums
+from .storage_pools import pool_config, select_pool
+from .volumes import create_volume, render_disk_params, volume_xml
+from . import capacity
 from pathlib import Path
 from dotenv import load_dotenv
 from src.models.create_vm import VMCreateRequest
+from src.libs.telemetry.tracing import span
+from src.libs.store import provisioning
 
 load_dotenv()  # Load environment variables from .env file
 
@@ -36,68 +46,114 @@ def create_virtual_machine(req: VMCreateRequest) -> Optional[libvirt.virDomain]:
     :param os_path: Path to the OS image (if any)
     :type os_path: Optional[str]
     :return: The created VM domain object or None if creation failed
+    :raises InsufficientResourcesError: If the host can't satisfy the request (hugepages, committed capacity, no pool with room)
+    :raises ValueError: Unknown storage tier or pool
     """
     conn = get_connection() # Establish read-only connection
     try:
         template_dir = Path(__file__).resolve().parent / 'templates' # Path to templates directory
-        try: 
-            pool = conn.storagePoolLookupByName('default')
-            if not pool.isActive():
-                pool.create(0)
-        except libvirt.libvirtError:
-            # Create Pool if it does not exist
-            disk_pool_xml = template_dir / 'storage_pool_template.xml' # Load Pool XML template
-            print(f"Defining storage pool from {disk_pool_xml}")
-            with open(disk_pool_xml, 'r') as file:
-                pool_xml = file.read() # Read template
-            pool = conn.storagePoolDefineXML(pool_xml, 0) # Define the storage pool
-            pool.build(0) # Build the storage pool
-            pool.create(0) # Create the storage pool
-            pool.setAutostart(True) # Set autostart            
-        
-        # Create storage volume for the VM
-        vm_template_disk_xml = template_dir / 'vm_disk_template.xml' # Load Disk XML template
-        with vm_template_disk_xml.open('r') as file:
-            disk_xml = file.read() # Read template
-
-        disk_xml = disk_xml.format(name=req.vm_id, disk_gb=req.vm.disk_size) # Fill in template values
-
-        # Save this XML for tests purposes
-        with open(f"/tmp/{req.vm_id}_disk.xml", 'w') as file:
-            file.write(disk_xml)
-        
-        pool = conn.storagePoolLookupByName('default') # Get default storage pool
-        vol = pool.createXML(disk_xml, 0) # Create storage volume
-
-        if os.getenv("SYSTEM", "linux").lower() == "macos":
-            vm_template_xml = template_dir / 'macos' / 'vm_template.xml' # Load VM XML template
-        else:
-            vm_template_xml = template_dir / 'vm_template.xml' # Load VM XML template
-
-        with open(vm_template_xml, 'r') as file:
-            vm_xml = file.read() # Read template
-
-        network_params = {
-            'net_in_kbps': __mbps_to_kibps__(req.vm.network.in_avg_mbps),
-            'net_in_peak_kbps': __mbps_to_kibps__(req.vm.network.in_peak_mbps),
-            'net_in_burst_kb': __mbps_to_kibps__(req.vm.network.in_burst_mbps),
-            'net_out_kbps': __mbps_to_kibps__(req.vm.network.out_avg_mbps),
-            'net_out_peak_kbps': __mbps_to_kibps__(req.vm.network.out_peak_mbps),
-            'net_out_burst_kb': __mbps_to_kibps__(req.vm.network.out_burst_mbps)
-        }
-        vm_xml = vm_xml.format(name=req.vm_id, vcpus=req.vm.vcpus, memory_mib=req.vm.memory, disk_path=vol.path(), mac=req.vm.mac, **network_params) # Fill in template values
-        
-        # Save this XML for tests purposes
-        with open(f"/tmp/{req.vm_id}_vm.xml", 'w') as file:
-            file.write(vm_xml)
-
-        domain = conn.defineXML(vm_xml) # Define the VM
-
-        domain.create() # Start the VM
-        
+
+        # Keep the placement lock until the domain is defined so concurrent creates
+        # see each other's pinned cores and hugepage reservations. Everything that
+        # can refuse the VM runs before the volume is allocated.
+        provisioning.begin(req.vm_id, "create")
+        with PLACEMENT_LOCK:
+            placement = None
+            if req.vm.numa_pinning and os.getenv("SYSTEM", "linux").lower() != "macos":
+                with span("create.placement", vm=req.vm_id):
+                    placement = place_new_vm(conn, req.vm.vcpus, req.vm.memory)
+                if placement is None:
+                    print(f"No single NUMA node fits {req.vm_id}; leaving it unpinned")
+
+            hugepage_kib = plan_hugepages(
+                conn,
+                req.vm.hugepages.value if req.vm.hugepages else None,
+                req.vm.memory,
+                placement.node if placement else None,
+                req.vm.hugepages_fallback,
+            )
+
+            max_vcpus, max_memory_mib = plan_maximums(conn, req.vm, hugepages=bool(hugepage_kib))
+
+            with span("create.admission", vm=req.vm_id):
+                # configured pool of the requested tier with room, fastest first
+                pool_name = select_pool(
+                    conn, req.vm.disk_size, tier=req.storage_tier, pool=req.storage_pool,
+                    exclude=req.vm_id, disk_format=req.vm.disk_format.value,
+                )
+                capacity.admit(
+                    conn, req.vm_id, req.vm.vcpus, req.vm.memory, hugepage_kib, req.vm.disk_size, pool_name
+                )
+
+            # Create storage volume for the VM (qcow2/raw file, or raw LV in a logical pool)
+            pool_cfg = pool_config(pool_name)
+            disk_format = req.vm.disk_format.value
+            disk_xml = volume_xml(req.vm_id, req.vm.disk_size, disk_format, pool_cfg)
+
+            # Save this XML for tests purposes
+            with open(f"/tmp/{req.vm_id}_disk.xml", 'w') as file:
+                file.write(disk_xml)
+
+            with span("libvirt.volume_create", vm=req.vm_id, disk_gb=req.vm.disk_size, pool=pool_name, format=disk_format):
+                volume_path = create_volume(conn, pool_cfg, req.vm_id, req.vm.disk_size, disk_xml)
+            provisioning.step(req.vm_id, "volume_created", volume_path=volume_path)
+
+            if os.getenv("SYSTEM", "linux").lower() == "macos":
+                vm_template_xml = template_dir / 'macos' / 'vm_template.xml' # Load VM XML template
+            else:
+                vm_template_xml = template_dir / 'vm_template.xml' # Load VM XML template
+
+            with open(vm_template_xml, 'r') as file:
+                vm_xml = file.read() # Read template
+
+            network_params = {
+                'net_in_kbps': __mbps_to_kibps__(req.vm.network.in_avg_mbps),
+                'net_in_peak_kbps': __mbps_to_kibps__(req.vm.network.in_peak_mbps),
+                'net_in_burst_kb': __mbps_to_kibps__(req.vm.network.in_burst_mbps),
+                'net_out_kbps': __mbps_to_kibps__(req.vm.network.out_avg_mbps),
+                'net_out_peak_kbps': __mbps_to_kibps__(req.vm.network.out_peak_mbps),
+                'net_out_burst_kb': __mbps_to_kibps__(req.vm.network.out_burst_mbps)
+            }
+            vm_xml = vm_xml.format(
+                domain_type=os.getenv("VM_DOMAIN_TYPE", "kvm"),
+                name=req.vm_id,
+                vcpus=req.vm.vcpus,
+                max_vcpus=max_vcpus,
+                memory_mib=req.vm.memory,
+                max_memory_mib=max_memory_mib,
+                disk_iotune=render_iotune(req.vm.disk),
+                mac=req.vm.mac,
+                cputune=render_cputune(placement),
+                numatune=render_numatune(placement),
+                memory_backing=render_memory_backing(hugepage_kib, share_pages=req.vm.ksm),
+                guest_agent_channel=render_guest_agent_channel(req.vm.guest_agent),
+                **render_disk_params(volume_path, disk_format, pool_cfg.block),
+                **network_params
+            ) # Fill in template values
+
+            # Save this XML for tests purposes
+            with open(f"/tmp/{req.vm_id}_vm.xml", 'w') as file:
+                file.write(vm_xml)
+
+            with span("libvirt.define", vm=req.vm_id):
+                domain = conn.defineXML(vm_xml) # Define the VM
+            provisioning.step(req.vm_id, "defined")
+            capacity.refresh_vm(conn, req.vm_id)
+
+        with span("libvirt.domain_create", vm=req.vm_id):
+            domain.create() # Start the VM
+        provisioning.finish(req.vm_id)
+
         return domain
     except libvirt.libvirtError as e:
         print(f"Libvirt error: {e}")
+        provisioning.finish(req.vm_id, error=str(e))
+        capacity.refresh_vm(conn, req.vm_id)
         return None
+    except Exception as e:
+        provisioning.finish(req.vm_id, error=f"{type(e).__name__}: {e}")
+        # drops the reservation unless the domain got defined
+        capacity.refresh_vm(conn, req.vm_id)
+        raise
     finally:
         conn.close() # Ensure connection is closed
\ No newline at end of file
@@ -0,0 +1,82 @@
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Optional
+
+import libvirt
+
+from .errors import InsufficientResourcesError
+from .format import get_vda_path, vda_is_block
+from .lvm import thin_pool_usage
+from .qemu_img import resize
+from .storage_pools import pool_config
+from .volumes import grow_block_volume
+
+
+def vda_block_info(domain: libvirt.virDomain) -> dict:
+    """
+    Virtual size and allocation of vda straight from libvirt (works for running
+    and stopped VMs, no storage volume lookup needed).
+    """
+    capacity, allocation, physical = domain.blockInfo("vda", 0)
+    return {
+        "capacity_bytes": capacity,
+        "allocation_bytes": allocation,
+        "physical_bytes": physical,
+        "capacity_gb": round(capacity / 1024 ** 3, 2),
+    }
+
+
+def pool_for_path(conn: libvirt.virConnect, path: str) -> Optional[libvirt.virStoragePool]:
+    """
+    Active storage pool whose target directory holds `path`.
+    """
+    parent = str(Path(path).parent)
+    for pool in conn.listAllStoragePools(libvirt.VIR_CONNECT_LIST_STORAGE_POOLS_ACTIVE):
+        target = ET.fromstring(pool.XMLDesc(0)).findtext("./target/path")
+        if target and target.rstrip("/") == parent:
+            return pool
+    return None
+
+
+def resize_vda(conn: libvirt.virConnect, domain: libvirt.virDomain, size_gb: int) -> dict:
+    """
+    Grows vda to `size_gb` GiB. Running VMs are resized live with blockResize;
+    stopped ones with qemu-img on the active layer. LVs are extended with
+    lvextend first, then the guest is told with blockResize.
+
+    :raises ValueError: shrinking was requested
+    :raises InsufficientResourcesError: the pool can't back the extra space
+    """
+    before = vda_block_info(domain)
+    new_bytes = size_gb * 1024 ** 3
+    if new_bytes < before["capacity_bytes"]:
+        raise ValueError("Disks can only grow; shrinking would destroy guest data")
+    if new_bytes == before["capacity_bytes"]:
+        return {"changed": False, "before": before, "after": before}
+
+    # thin qcow2: the new space isn't allocated yet, but the pool must be able to hold it
+    growth = new_bytes - before["capacity_bytes"]
+    path = get_vda_path(domain)
+    pool = pool_for_path(conn, path)
+    if pool is not None:
+        pool.refresh(0)
+        cfg = pool_config(pool.name())
+        if cfg is not None and cfg.thin_pool:
+            _size, available = thin_pool_usage(cfg.volume_group, cfg.thin_pool)
+        else:
+            _state, _capacity, _allocation, available = pool.info()
+        if growth > available:
+            raise InsufficientResourcesError(
+                f"Pool '{pool.name()}' has {available} bytes free, resize needs {growth}"
+            )
+
+    if vda_is_block(domain):
+        grow_block_volume(path, new_bytes)
+        if domain.isActive():
+            domain.blockResize("vda", new_bytes, libvirt.VIR_DOMAIN_BLOCK_RESIZE_BYTES)
+    elif domain.isActive():
+        domain.blockResize("vda", new_bytes, libvirt.VIR_DOMAIN_BLOCK_RESIZE_BYTES)
+    else:
+        resize(path, new_bytes)
+
+    return {"changed": True, "before": before, "after": vda_block_info(domain)}
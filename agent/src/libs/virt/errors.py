@@ -0,0 +1,12 @@
+class InsufficientResourcesError(RuntimeError):
+    """
+    The host can't give a VM what it asked for (hugepages, capacity, ...).
+    Routes turn this into a 409 so the caller can try another host.
+    """
+
+
+class VMBusyError(RuntimeError):
+    """
+    Another operation holds the VM (its vm_lock or an active job).
+    Routes turn this into a 409.
+    """
@@ -3,20 +3,50 @@ import libvirt
 import os
 from typing import List, Dict, Optional
 
-def get_vda_path(domain) -> str:
+def _vda_element(domain):
     root = ET.fromstring(domain.XMLDesc(0))
     for disk in root.findall("./devices/disk"):
         if disk.get("device") != "disk":
             continue
         target = disk.find("target")
-        source = disk.find("source")
-        if target is not None and target.get("dev") == "vda" and source is not None:
-            p = source.get("file")
-            if p:
-                return p
+        if target is not None and target.get("dev") == "vda" and disk.find("source") is not None:
+            return disk
+    return None
+
+
+def get_vda_path(domain) -> str:
+    disk = _vda_element(domain)
+    if disk is not None:
+        # file-backed (qcow2/raw file) or block-backed (LVM volume)
+        p = disk.find("source").get("file") or disk.find("source").get("dev")
+        if p:
+            return p
     raise RuntimeError("Could not find vda disk path in domain XML")
 
 
+def get_vda_format(domain) -> str:
+    """
+    Image format of vda's active layer ("qcow2", "raw").
+    """
+    disk = _vda_element(domain)
+    driver = disk.find("driver") if disk is not None else None
+    return driver.get("type", "raw") if driver is not None else "raw"
+
+
+def vda_is_block(domain) -> bool:
+    disk = _vda_element(domain)
+    return disk is not None and disk.get("type") == "block"
+
+
+def vda_discard(domain) -> bool:
+    """
+    Whether guest TRIM/discard on vda reaches the image (discard='unmap').
+    """
+    disk = _vda_element(domain)
+    driver = disk.find("driver") if disk is not None else None
+    return driver is not None and driver.get("discard") == "unmap"
+
+
 def detach_seed_iso(domain, seed_iso_path: str | None = None, target_dev: str | None = None):
     """
     Detach the seed ISO CDROM. If seed_iso_path is provided, detach only that one.
@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+import time
+from typing import List, Optional
+
+import libvirt
+import libvirt_qemu
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds libvirt waits for the guest agent to answer a single command
+AGENT_COMMAND_TIMEOUT_S = int(os.getenv("GUEST_AGENT_TIMEOUT_S", "5"))
+
+GUEST_AGENT_CHANNEL = "org.qemu.guest_agent.0"
+
+
+class GuestAgentError(RuntimeError):
+    pass
+
+
+def agent_command(domain: libvirt.virDomain, command: str, arguments: Optional[dict] = None,
+                  timeout_s: int = AGENT_COMMAND_TIMEOUT_S) -> dict:
+    """
+    Runs one QEMU guest agent command and returns its "return" payload.
+
+    :raises GuestAgentError: agent missing, not running or command failed
+    """
+    payload = {"execute": command}
+    if arguments:
+        payload["arguments"] = arguments
+    try:
+        out = libvirt_qemu.qemuAgentCommand(domain, json.dumps(payload), timeout_s, 0)
+    except libvirt.libvirtError as e:
+        raise GuestAgentError(str(e)) from e
+    return json.loads(out).get("return", {})
+
+
+def render_guest_agent_channel(enabled: bool) -> str:
+    """
+    virtio-serial channel qemu-ga talks over; libvirt picks the socket path.
+    """
+    if not enabled:
+        return ""
+    return (
+        "        <channel type='unix'>\n"
+        f"            <target type='virtio' name='{GUEST_AGENT_CHANNEL}' />\n"
+        "        </channel>"
+    )
+
+
+def guest_exec(domain: libvirt.virDomain, path: str, args: List[str], timeout_s: int = 60) -> dict:
+    """
+    Runs a program inside the guest through guest-exec and waits for it.
+
+    :return: {"exitcode", "stdout", "stderr"}
+    :rtype: dict
+    :raises GuestAgentError: agent unavailable or the program didn't finish in time
+    """
+    started = agent_command(domain, "guest-exec", {"path": path, "arg": args, "capture-output": True})
+    pid = started["pid"]
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        status = agent_command(domain, "guest-exec-status", {"pid": pid})
+        if status.get("exited"):
+            return {
+                "exitcode": status.get("exitcode"),
+                "stdout": base64.b64decode(status.get("out-data", "")).decode("utf-8", "replace"),
+                "stderr": base64.b64decode(status.get("err-data", "")).decode("utf-8", "replace"),
+            }
+        time.sleep(0.25)
+    raise GuestAgentError(f"{path} did not finish within {timeout_s}s")
+
+
+# Grows the root partition and filesystem to fill the disk, whatever the fs type
+_GROW_ROOT_FS = r"""
+set -e
+src=$(findmnt -no SOURCE /)
+part=$(basename "$src")
+if [ -e "/sys/class/block/$part/partition" ]; then
+    disk=/dev/$(lsblk -no PKNAME "$src")
+    growpart "$disk" "$(cat /sys/class/block/$part/partition)" || true
+fi
+case "$(findmnt -no FSTYPE /)" in
+    xfs) xfs_growfs / ;;
+    btrfs) btrfs filesystem resize max / ;;
+    *) resize2fs "$src" ;;
+esac
+"""
+
+
+def grow_root_filesystem(domain: libvirt.virDomain) -> dict:
+    """
+    Asks the guest to grow its root partition/filesystem after a disk resize.
+    """
+    return guest_exec(domain, "/bin/sh", ["-c", _GROW_ROOT_FS])
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.store import guest_facts as facts_store
+from src.libs.telemetry.histogram import LatencyHistogram
+from src.libs.telemetry.tracing import span
+from .connection import get_connection
+from .guest_agent import (
+    AGENT_COMMAND_TIMEOUT_S,
+    GUEST_AGENT_CHANNEL,
+    GuestAgentError,
+    agent_command,
+    guest_exec,
+)
+
+load_dotenv()
+
+GUEST_FACTS_INTERVAL_S = float(os.getenv("GUEST_FACTS_INTERVAL_S", "60"))
+# Parallel collections; a hung guest only ever ties up one of them
+GUEST_FACTS_WORKERS = int(os.getenv("GUEST_FACTS_WORKERS", "4"))
+# How long GET /vms/{id}/guest?refresh=true waits before answering from cache
+GUEST_FACTS_REFRESH_WAIT_S = float(os.getenv("GUEST_FACTS_REFRESH_WAIT_S", "10"))
+
+# cloud-init states that no longer change until the next first boot
+_CLOUD_INIT_FINAL = ("done", "error", "disabled")
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=GUEST_FACTS_WORKERS, thread_name_prefix="guest-facts")
+# vm_id -> running collection; a VM is never collected twice at once
+_IN_FLIGHT: Dict[str, Future] = {}
+_LOCK = threading.Lock()
+
+_TOTALS = {"collections": 0, "failures": 0, "not_connected": 0, "skipped_in_flight": 0}
+_LATENCY = LatencyHistogram()
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Collection                                 #
+# ---------------------------------------------------------------------------- #
+def agent_channel_state(domain: libvirt.virDomain) -> Optional[str]:
+    """
+    State of the guest agent channel in the live XML.
+
+    :return: "connected" / "disconnected", or None if the VM has no channel
+    """
+    root = ET.fromstring(domain.XMLDesc(0))
+    for target in root.findall("./devices/channel/target"):
+        if target.get("name") == GUEST_AGENT_CHANNEL:
+            return target.get("state", "connected")
+    return None
+
+
+def _interfaces(domain: libvirt.virDomain) -> list:
+    # same data as interfaceAddresses(VIR_DOMAIN_INTERFACE_ADDRESSES_SRC_AGENT), but
+    # that call blocks for as long as libvirt's per-domain agent timeout (forever by
+    # default); qemuAgentCommand takes our own timeout
+    interfaces = []
+    for iface in agent_command(domain, "guest-network-get-interfaces"):
+        if iface.get("name") == "lo":
+            continue
+        interfaces.append({
+            "name": iface.get("name"),
+            "mac": iface.get("hardware-address"),
+            "addresses": [
+                {"type": a.get("ip-address-type"), "address": a.get("ip-address"), "prefix": a.get("prefix")}
+                for a in iface.get("ip-addresses", [])
+            ],
+        })
+    return interfaces
+
+
+def _filesystems(domain: libvirt.virDomain) -> list:
+    filesystems = []
+    for fs in agent_command(domain, "guest-get-fsinfo"):
+        used, total = fs.get("used-bytes"), fs.get("total-bytes")
+        filesystems.append({
+            "mountpoint": fs.get("mountpoint"),
+            "type": fs.get("type"),
+            "used_bytes": used,
+            "total_bytes": total,
+            "used_pct": round(used / total * 100, 1) if used is not None and total else None,
+        })
+    return filesystems
+
+
+def _os_info(domain: libvirt.virDomain) -> dict:
+    info = agent_command(domain, "guest-get-osinfo")
+    return {
+        "id": info.get("id"),
+        "name": info.get("pretty-name") or info.get("name"),
+        "version": info.get("version-id"),
+        "kernel": info.get("kernel-release"),
+        "arch": info.get("machine"),
+        "hostname": agent_command(domain, "guest-get-host-name").get("host-name"),
+    }
+
+
+def _cloud_init_status(domain: libvirt.virDomain) -> Optional[str]:
+    out = guest_exec(domain, "cloud-init", ["status"], timeout_s=AGENT_COMMAND_TIMEOUT_S * 2)
+    for line in out["stdout"].splitlines():
+        if line.startswith("status:"):
+            return line.split(":", 1)[1].strip()
+    return None
+
+
+def collect_guest_facts(domain: libvirt.virDomain, previous: Optional[dict] = None) -> dict:
+    """
+    Asks the guest agent for addresses, filesystem usage, OS info and
+    cloud-init status. Every command is bounded by GUEST_AGENT_TIMEOUT_S.
+    A section the guest can't answer (old qemu-ga, guest-exec blocked) is
+    reported under "errors" instead of failing the whole collection.
+
+    :param previous: Last facts; a finished cloud-init is not asked again
+    :raises GuestAgentError: The agent does not answer at all
+    """
+    # fail fast on a dead agent instead of timing out once per section
+    agent_command(domain, "guest-ping")
+
+    facts: dict = {"errors": {}}
+    sections = (
+        ("interfaces", _interfaces),
+        ("filesystems", _filesystems),
+        ("os", _os_info),
+    )
+    for name, fn in sections:
+        try:
+            facts[name] = fn(domain)
+        except GuestAgentError as e:
+            facts[name] = None
+            facts["errors"][name] = str(e)
+
+    last_cloud_init = (previous or {}).get("cloud_init")
+    if last_cloud_init in _CLOUD_INIT_FINAL:
+        facts["cloud_init"] = last_cloud_init
+    else:
+        try:
+            facts["cloud_init"] = _cloud_init_status(domain)
+        except (GuestAgentError, KeyError) as e:
+            facts["cloud_init"] = None
+            facts["errors"]["cloud_init"] = str(e)
+    return facts
+
+
+def _collect(vm_id: str) -> Optional[dict]:
+    t0 = time.perf_counter()
+    conn = None
+    try:
+        conn = get_connection()
+        domain = conn.lookupByName(vm_id)
+        if not domain.isActive():
+            return None
+        state = agent_channel_state(domain)
+        if state is None:
+            return None
+        if state != "connected":
+            _TOTALS["not_connected"] += 1
+            facts_store.save_error(vm_id, "guest agent not connected", (time.perf_counter() - t0) * 1000)
+            return None
+
+        previous = facts_store.get(vm_id)
+        with span("guest.collect_facts", vm=vm_id):
+            facts = collect_guest_facts(domain, previous["facts"] if previous else None)
+        ms = (time.perf_counter() - t0) * 1000
+        _LATENCY.observe(ms)
+        _TOTALS["collections"] += 1
+        facts_store.save(vm_id, facts, ms)
+        return facts
+    except Exception as e:
+        ms = (time.perf_counter() - t0) * 1000
+        _LATENCY.observe(ms, error=True)
+        _TOTALS["failures"] += 1
+        error = str(e) if isinstance(e, (GuestAgentError, libvirt.libvirtError)) else f"{type(e).__name__}: {e}"
+        facts_store.save_error(vm_id, error, ms)
+        return None
+    finally:
+        if conn is not None:
+            conn.close()
+        with _LOCK:
+            _IN_FLIGHT.pop(vm_id, None)
+
+
+def submit_collection(vm_id: str) -> Future:
+    """
+    Collects a VM's facts on the guest-facts pool. If a collection for the VM
+    is already running, returns that one instead of queueing another.
+    """
+    with _LOCK:
+        running = _IN_FLIGHT.get(vm_id)
+        if running is not None:
+            _TOTALS["skipped_in_flight"] += 1
+            return running
+        future = _EXECUTOR.submit(_collect, vm_id)
+        _IN_FLIGHT[vm_id] = future
+        return future
+
+
+async def refresh_guest_facts(vm_id: str) -> bool:
+    """
+    Collects now, waiting at most GUEST_FACTS_REFRESH_WAIT_S.
+
+    :return: False if the guest did not answer in time (collection keeps running)
+    """
+    future = asyncio.wrap_future(submit_collection(vm_id))
+    try:
+        # shield: giving up on the wait must not cancel the collection
+        await asyncio.wait_for(asyncio.shield(future), GUEST_FACTS_REFRESH_WAIT_S)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def collect_all_guest_facts() -> None:
+    """
+    Periodic task: queues a collection for every running VM with a guest
+    agent channel, and drops facts of VMs that no longer exist. Returns
+    without waiting for the guests.
+    """
+    conn = get_connection()
+    try:
+        domains = conn.listAllDomains()
+        defined = {d.name() for d in domains}
+        running = [d.name() for d in domains if d.isActive()]
+    finally:
+        conn.close()
+
+    for vm_id in running:
+        submit_collection(vm_id)
+    for record in facts_store.list_facts():
+        if record["vm_id"] not in defined:
+            facts_store.forget(record["vm_id"])
+
+
+def guest_facts_stats() -> dict:
+    with _LOCK:
+        in_flight = sorted(_IN_FLIGHT)
+    return {
+        "totals": dict(_TOTALS),
+        "in_flight": in_flight,
+        "workers": GUEST_FACTS_WORKERS,
+        "latency": _LATENCY.to_dict(),
+    }
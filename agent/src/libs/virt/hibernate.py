@@ -0,0 +1,269 @@
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.jobs.jobs import Job, list_jobs, update_progress
+from src.libs.store import hibernation as hibernation_store
+from src.libs.telemetry.histogram import LatencyHistogram
+from src.libs.telemetry.tracing import span
+from .connection import get_connection
+from .metadata import get_metadata, set_metadata
+from .snapshots import vm_lock
+
+load_dotenv()
+
+# Save image format (raw, gzip, zstd, ...) when the request doesn't pick one;
+# empty = whatever save_image_format in qemu.conf says
+HIBERNATE_IMAGE_FORMAT = os.getenv("HIBERNATE_IMAGE_FORMAT", "")
+HIBERNATE_BYPASS_CACHE = os.getenv("HIBERNATE_BYPASS_CACHE", "true").lower() == "true"
+# Where libvirtd keeps managed save images (only read for their size)
+MANAGED_SAVE_DIR = Path(os.getenv("MANAGED_SAVE_DIR", "/var/lib/libvirt/qemu/save"))
+
+# Idle policy: hibernate VMs that used less than both thresholds for HIBERNATE_IDLE_AFTER_S
+HIBERNATE_IDLE_ENABLED = os.getenv("HIBERNATE_IDLE_ENABLED", "false").lower() == "true"
+HIBERNATE_IDLE_INTERVAL_S = float(os.getenv("HIBERNATE_IDLE_INTERVAL_S", "60"))
+HIBERNATE_IDLE_AFTER_S = float(os.getenv("HIBERNATE_IDLE_AFTER_S", "3600"))
+HIBERNATE_IDLE_CPU_PCT = float(os.getenv("HIBERNATE_IDLE_CPU_PCT", "2"))  # of one core
+HIBERNATE_IDLE_NET_KBPS = float(os.getenv("HIBERNATE_IDLE_NET_KBPS", "16"))  # rx + tx
+
+_SAVE_LATENCY = LatencyHistogram()
+_RESTORE_LATENCY = LatencyHistogram()
+
+
+@dataclass
+class _Sample:
+    cpu_ns: int
+    net_bytes: int
+    at: float
+    idle_since: Optional[float]
+
+
+# vm -> previous counters; only the worker running the idle task fills it
+_SAMPLES: Dict[str, _Sample] = {}
+_LOCK = threading.Lock()
+
+
+def _image_bytes(vm_id: str) -> Optional[int]:
+    try:
+        return (MANAGED_SAVE_DIR / f"{vm_id}.save").stat().st_size
+    except OSError:
+        # not readable by the agent user, or libvirt keeps it elsewhere
+        return None
+
+
+def hibernate(
+    domain: libvirt.virDomain,
+    image_format: Optional[str] = None,
+    bypass_cache: Optional[bool] = None,
+    reason: str = "manual",
+) -> dict:
+    """
+    Saves a running VM's RAM and device state to its managed save image and
+    stops it. The next start (POST /status/start or /hibernate/resume)
+    restores it where it left off.
+
+    :param image_format: Save image compression; needs libvirt with per-save image format
+    :raises ValueError: The VM is not running, or the format can't be chosen per save
+    """
+    if not domain.isActive():
+        raise ValueError("VM is not running")
+    image_format = image_format or HIBERNATE_IMAGE_FORMAT or None
+    bypass_cache = HIBERNATE_BYPASS_CACHE if bypass_cache is None else bypass_cache
+    flags = libvirt.VIR_DOMAIN_SAVE_BYPASS_CACHE if bypass_cache else 0
+    name = domain.name()
+
+    t0 = time.perf_counter()
+    try:
+        with span("libvirt.managed_save", vm=name, format=image_format or "default"):
+            if image_format:
+                if not hasattr(libvirt, "VIR_DOMAIN_SAVE_PARAM_IMAGE_FORMAT"):
+                    raise ValueError(
+                        "This libvirt can't choose the save image format per VM; "
+                        "set save_image_format in qemu.conf instead"
+                    )
+                # saveParams without a file parameter is a managed save
+                domain.saveParams({libvirt.VIR_DOMAIN_SAVE_PARAM_IMAGE_FORMAT: image_format}, flags)
+            else:
+                domain.managedSave(flags)
+    except libvirt.libvirtError as e:
+        _SAVE_LATENCY.observe((time.perf_counter() - t0) * 1000, error=True)
+        hibernation_store.record_error(name, f"save: {e}")
+        raise
+    ms = (time.perf_counter() - t0) * 1000
+    _SAVE_LATENCY.observe(ms)
+
+    image_bytes = _image_bytes(name)
+    hibernation_store.record_save(name, reason, ms, image_bytes, image_format, bypass_cache)
+    with _LOCK:
+        _SAMPLES.pop(name, None)
+    print(f"Hibernated {name} ({reason}) in {ms:.0f} ms, image {image_bytes} bytes")
+    return {
+        "vm_id": name,
+        "reason": reason,
+        "save_ms": round(ms, 1),
+        "image_bytes": image_bytes,
+        "image_format": image_format,
+        "bypass_cache": bypass_cache,
+    }
+
+
+def start_or_resume(domain: libvirt.virDomain, bypass_cache: Optional[bool] = None) -> dict:
+    """
+    Starts a VM. If it was hibernated, libvirt restores the managed save
+    image instead of booting, and the restore is timed and recorded.
+
+    :return: {"restored": bool, "restore_ms": float | None}
+    """
+    name = domain.name()
+    saved = bool(domain.hasManagedSaveImage(0))
+    bypass_cache = HIBERNATE_BYPASS_CACHE if bypass_cache is None else bypass_cache
+    flags = libvirt.VIR_DOMAIN_START_BYPASS_CACHE if saved and bypass_cache else 0
+
+    t0 = time.perf_counter()
+    try:
+        with span("libvirt.domain_create", vm=name, restore=saved):
+            domain.createWithFlags(flags)
+    except libvirt.libvirtError as e:
+        if saved:
+            _RESTORE_LATENCY.observe((time.perf_counter() - t0) * 1000, error=True)
+            hibernation_store.record_error(name, f"restore: {e}")
+        raise
+    ms = (time.perf_counter() - t0) * 1000
+    if not saved:
+        return {"restored": False, "restore_ms": None}
+
+    _RESTORE_LATENCY.observe(ms)
+    hibernation_store.record_restore(name, ms)
+    return {"restored": True, "restore_ms": round(ms, 1)}
+
+
+def hibernate_job(job: Job, vm_id: str, image_format: Optional[str], bypass_cache: Optional[bool]) -> dict:
+    """
+    Job wrapper around hibernate(): saving a large guest takes a while.
+    """
+    conn = get_connection()
+    try:
+        domain = conn.lookupByName(vm_id)
+        with vm_lock(vm_id):
+            update_progress(job, stage="saving")
+            return hibernate(domain, image_format, bypass_cache)
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Idle policy                                 #
+# ---------------------------------------------------------------------------- #
+def idle_policy_allowed(domain: libvirt.virDomain) -> bool:
+    """
+    False when the VM opted out of idle hibernation (<hibernate idle='false'/> metadata).
+    """
+    el = get_metadata(domain, "hibernate", inactive=True)
+    return el is None or el.get("idle", "true") != "false"
+
+
+def set_idle_policy(domain: libvirt.virDomain, allowed: bool) -> None:
+    # absent = allowed, so only the opt-out is stored
+    set_metadata(domain, "hibernate", None if allowed else ET.Element("hibernate", idle="false"))
+
+
+def _net_bytes(stats: dict) -> int:
+    return sum(
+        stats.get(f"net.{i}.rx.bytes", 0) + stats.get(f"net.{i}.tx.bytes", 0)
+        for i in range(stats.get("net.count", 0))
+    )
+
+
+def hibernate_idle_vms() -> List[dict]:
+    """
+    Idle policy pass (background task): samples CPU time and network bytes
+    of every running VM and hibernates the ones below HIBERNATE_IDLE_CPU_PCT
+    and HIBERNATE_IDLE_NET_KBPS for HIBERNATE_IDLE_AFTER_S. VMs with an
+    active job or that opted out are left alone.
+
+    :return: The hibernations done
+    """
+    if not HIBERNATE_IDLE_ENABLED:
+        return []
+    busy = {j.vm_id for j in list_jobs(active_only=True) if j.vm_id}
+    done = []
+
+    conn = get_connection()
+    try:
+        records = conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_CPU_TOTAL | libvirt.VIR_DOMAIN_STATS_INTERFACE,
+            libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE,
+        )
+        now = time.monotonic()
+        candidates = []
+        with _LOCK:
+            seen = set()
+            for domain, stats in records:
+                name = domain.name()
+                seen.add(name)
+                cpu_ns, net = stats.get("cpu.time", 0), _net_bytes(stats)
+                prev = _SAMPLES.get(name)
+                idle_since = None
+                if prev is not None and now > prev.at and cpu_ns >= prev.cpu_ns and net >= prev.net_bytes:
+                    dt = now - prev.at
+                    cpu_pct = (cpu_ns - prev.cpu_ns) / (dt * 1e9) * 100
+                    net_kbps = (net - prev.net_bytes) * 8 / 1000 / dt
+                    if cpu_pct <= HIBERNATE_IDLE_CPU_PCT and net_kbps <= HIBERNATE_IDLE_NET_KBPS:
+                        idle_since = prev.idle_since or prev.at
+                _SAMPLES[name] = _Sample(cpu_ns, net, now, idle_since)
+                if idle_since is not None and now - idle_since >= HIBERNATE_IDLE_AFTER_S and name not in busy:
+                    candidates.append((domain, round(now - idle_since)))
+            for name in set(_SAMPLES) - seen:
+                _SAMPLES.pop(name, None)
+
+        for domain, idle_s in candidates:
+            name = domain.name()
+            try:
+                if not idle_policy_allowed(domain):
+                    continue
+                with vm_lock(name):
+                    done.append({**hibernate(domain, reason="idle"), "idle_s": idle_s})
+            except (libvirt.libvirtError, ValueError) as e:
+                print(f"Idle hibernation of {name} failed: {e}")
+    finally:
+        conn.close()
+    return done
+
+
+def idle_seconds(vm_id: str) -> Optional[float]:
+    """
+    How long the VM has been idle by the policy's thresholds (None = not
+    idle, or not sampled by this worker).
+    """
+    with _LOCK:
+        sample = _SAMPLES.get(vm_id)
+    if sample is None or sample.idle_since is None:
+        return None
+    return round(time.monotonic() - sample.idle_since, 1)
+
+
+def hibernation_stats() -> dict:
+    records = hibernation_store.list_records()
+    saved = [r for r in records if r["saved_at"] and (r["restored_at"] or 0) < r["saved_at"]]
+    return {
+        "idle_policy": {
+            "enabled": HIBERNATE_IDLE_ENABLED,
+            "after_s": HIBERNATE_IDLE_AFTER_S,
+            "cpu_pct": HIBERNATE_IDLE_CPU_PCT,
+            "net_kbps": HIBERNATE_IDLE_NET_KBPS,
+        },
+        "hibernated_vms": len(saved),
+        "image_bytes": sum(r["image_bytes"] or 0 for r in saved),
+        "saves": sum(r["saves"] for r in records),
+        "restores": sum(r["restores"] for r in records),
+        "save_latency": _SAVE_LATENCY.to_dict(),
+        "restore_latency": _RESTORE_LATENCY.to_dict(),
+        "vms": records,
+    }
@@ -0,0 +1,156 @@
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional, Tuple
+
+import libvirt
+
+from src.libs.host.hugepages import free_hugepages, read_hugepage_pools
+from src.libs.host.sysfs import parse_cpulist
+from .errors import InsufficientResourcesError
+
+# "2M" / "1G" as accepted on CreateVMParams.hugepages
+PAGE_SIZES_KIB = {"2M": 2048, "1G": 1024 * 1024}
+
+
+def domain_hugepages(root: ET.Element) -> Optional[Tuple[int, int, Optional[int]]]:
+    """
+    Hugepage usage of a domain from its XML.
+
+    :return: (page_kib, pages, host_node or None) or None if not hugepage-backed
+    :rtype: Tuple[int, int, int | None] | None
+    """
+    page = root.find("./memoryBacking/hugepages/page")
+    hp = root.find("./memoryBacking/hugepages")
+    if hp is None:
+        return None
+
+    page_kib = 2048
+    if page is not None and page.get("size"):
+        unit = (page.get("unit") or "KiB").lower()
+        size = int(page.get("size"))
+        page_kib = size * {"kib": 1, "k": 1, "mib": 1024, "m": 1024, "gib": 1024 ** 2, "g": 1024 ** 2}.get(unit, 1)
+
+    mem_el = root.find("memory")
+    memory_kib = int(mem_el.text) if mem_el is not None and mem_el.text else 0
+    pages = -(-memory_kib // page_kib)
+
+    node = None
+    mem_tune = root.find("./numatune/memory")
+    if mem_tune is not None and mem_tune.get("nodeset"):
+        nodes = parse_cpulist(mem_tune.get("nodeset"))
+        if len(nodes) == 1:
+            node = nodes[0]
+    return page_kib, pages, node
+
+
+def committed_hugepages(conn: libvirt.virConnect) -> Dict[Tuple[int, Optional[int]], dict]:
+    """
+    Hugepages used by running domains and reserved for defined-but-stopped
+    ones, keyed by (page_kib, host_node).
+    """
+    out: Dict[Tuple[int, Optional[int]], dict] = {}
+    for domain in conn.listAllDomains():
+        try:
+            usage = domain_hugepages(ET.fromstring(domain.XMLDesc(0)))
+            active = domain.isActive()
+        except (libvirt.libvirtError, ET.ParseError):
+            continue
+        if usage is None:
+            continue
+        page_kib, pages, node = usage
+        entry = out.setdefault((page_kib, node), {"in_use": 0, "reserved": 0})
+        entry["in_use" if active else "reserved"] += pages
+    return out
+
+
+def available_hugepages(conn: libvirt.virConnect, page_kib: int, node: Optional[int]) -> int:
+    """
+    Pages a new VM can still claim: free pages on the node (or host) minus the
+    ones stopped hugepage VMs will need when they boot.
+    """
+    committed = committed_hugepages(conn)
+    reserved = sum(
+        v["reserved"] for (size, n), v in committed.items()
+        if size == page_kib and (node is None or n is None or n == node)
+    )
+    return free_hugepages(page_kib, node) - reserved
+
+
+def hugepages_report(conn: Optional[libvirt.virConnect]) -> dict:
+    """
+    Kernel hugepage pools plus what our domains use/reserve, for /info.
+    """
+    pools = read_hugepage_pools()
+    committed = {}
+    if conn is not None:
+        try:
+            committed = committed_hugepages(conn)
+        except libvirt.libvirtError:
+            committed = {}
+
+    report = {}
+    for size, pool in pools.items():
+        agent = [
+            {"node": n, **v} for (s, n), v in committed.items() if s == size
+        ]
+        report[f"{size}kB"] = {
+            "page_kib": size,
+            "total": pool["total"],
+            "free": pool["free"],
+            "kernel_reserved": pool["reserved"],
+            "surplus": pool["surplus"],
+            "nodes": {str(k): v for k, v in pool["nodes"].items()},
+            "vms_in_use": sum(a["in_use"] for a in agent),
+            "vms_reserved": sum(a["reserved"] for a in agent),
+            "vms_by_node": agent,
+        }
+    return report
+
+
+def plan_hugepages(
+    conn: libvirt.virConnect,
+    size: Optional[str],
+    memory_mib: int,
+    node: Optional[int],
+    fallback: bool,
+) -> Optional[int]:
+    """
+    Decides whether a new VM gets hugepages. Callers hold PLACEMENT_LOCK so the
+    check and the define are atomic with respect to other creates.
+
+    :return: Page size in KiB, or None for regular memory
+    :raises InsufficientResourcesError: not enough pages and fallback disabled
+    """
+    if size is None:
+        return None
+
+    page_kib = PAGE_SIZES_KIB[size]
+    needed = -(-memory_mib * 1024 // page_kib)
+    available = available_hugepages(conn, page_kib, node)
+    if needed <= available:
+        return page_kib
+
+    where = f"NUMA node {node}" if node is not None else "host"
+    msg = f"Not enough {size} hugepages on {where}: need {needed}, available {max(available, 0)}"
+    if fallback:
+        print(f"{msg}; falling back to regular pages")
+        return None
+    raise InsufficientResourcesError(msg)
+
+
+def render_memory_backing(page_kib: Optional[int], share_pages: bool = True) -> str:
+    """
+    <memoryBacking> element for the domain template (empty string when unused).
+    share_pages=False adds <nosharepages/>, keeping KSM away from the guest.
+    """
+    lines = []
+    if page_kib is not None:
+        lines += [
+            "        <hugepages>",
+            f"            <page size='{page_kib}' unit='KiB' />",
+            "        </hugepages>",
+        ]
+    if not share_pages:
+        lines.append("        <nosharepages />")
+    if not lines:
+        return ""
+    return "    <memoryBacking>\n" + "\n".join(lines) + "\n    </memoryBacking>"
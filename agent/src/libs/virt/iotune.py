@@ -0,0 +1,63 @@
+from typing import Optional
+
+import libvirt
+
+from src.models.create_vm import DiskSpec
+
+IOTUNE_FIELDS = tuple(DiskSpec.model_fields)
+
+
+def render_iotune(spec: Optional[DiskSpec]) -> str:
+    """
+    <iotune> block for the vda <disk> of the domain template.
+    """
+    if spec is None:
+        return ""
+    limits = {k: v for k, v in spec.model_dump().items() if v}
+    if not limits:
+        return ""
+    lines = [f"                <{k}>{v}</{k}>" for k, v in limits.items()]
+    return "            <iotune>\n" + "\n".join(lines) + "\n            </iotune>"
+
+
+def get_iotune(domain: libvirt.virDomain, disk: str = "vda") -> dict:
+    """
+    Effective limits: live values for a running VM, and the persistent
+    config (applied on next boot). 0 = unlimited.
+    """
+    def read(flags: int) -> dict:
+        params = domain.blockIoTune(disk, flags)
+        return {k: params.get(k, 0) for k in IOTUNE_FIELDS}
+
+    return {
+        "live": read(libvirt.VIR_DOMAIN_AFFECT_LIVE) if domain.isActive() else None,
+        "config": read(libvirt.VIR_DOMAIN_AFFECT_CONFIG),
+    }
+
+
+def set_iotune(domain: libvirt.virDomain, spec: DiskSpec, disk: str = "vda") -> dict:
+    """
+    Applies the limits set in `spec` (unset fields keep their value, 0 clears)
+    to the running VM and its persistent config in one call, no reboot.
+    Setting total_* clears read_*/write_* of the same kind and vice versa,
+    since QEMU refuses both at once.
+
+    :return: Effective limits after the change (see get_iotune)
+    :raises libvirt.libvirtError: QEMU/libvirt rejected the combination
+    """
+    params = {k: v for k, v in spec.model_dump(exclude_unset=True).items() if v is not None}
+    for kind in ("bytes", "iops"):
+        for suffix in ("", "_max"):
+            total, read, write = (f"{op}_{kind}_sec{suffix}" for op in ("total", "read", "write"))
+            if params.get(total):
+                params.setdefault(read, 0)
+                params.setdefault(write, 0)
+            elif params.get(read) or params.get(write):
+                params.setdefault(total, 0)
+
+    if params:
+        flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        if domain.isActive():
+            flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+        domain.setBlockIoTune(disk, params, flags)
+    return get_iotune(domain, disk)
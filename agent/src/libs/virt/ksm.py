@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import List, Optional
+
+import libvirt
+import psutil
+from dotenv import load_dotenv
+
+from src.libs.host.ksm import ksm_available, ksm_savings_bytes, read_ksm, write_ksm
+from src.libs.host.pressure import read_pressure
+
+load_dotenv()
+
+# auto = adaptive policy below; manual = the agent only reports
+KSM_POLICY = os.getenv("KSM_POLICY", "auto").lower()
+KSM_INTERVAL_S = float(os.getenv("KSM_INTERVAL_S", "30"))
+# Start merging when available memory drops below this, stop above the second
+KSM_START_FREE_PCT = float(os.getenv("KSM_START_FREE_PCT", "20"))
+KSM_STOP_FREE_PCT = float(os.getenv("KSM_STOP_FREE_PCT", "40"))
+# Host memory PSI "some avg10" (%) that counts as pressure regardless of free memory
+KSM_PSI_HIGH = float(os.getenv("KSM_PSI_HIGH", "5"))
+KSM_PAGES_MIN = int(os.getenv("KSM_PAGES_MIN", "64"))
+KSM_PAGES_MAX = int(os.getenv("KSM_PAGES_MAX", "1250"))
+KSM_PAGES_BOOST = int(os.getenv("KSM_PAGES_BOOST", "300"))
+KSM_PAGES_DECAY = int(os.getenv("KSM_PAGES_DECAY", "50"))
+# ksmd CPU (% of one core) above which scanning is slowed down
+KSM_MAX_CPU_PCT = float(os.getenv("KSM_MAX_CPU_PCT", "15"))
+
+_state = {"decision": None}
+_ksmd = {"proc": None, "cpu_s": None, "at": None}
+_LOCK = threading.Lock()
+
+
+def _ksmd_cpu_pct() -> Optional[float]:
+    """
+    CPU used by the ksmd kernel thread since the last call, in % of one core.
+    """
+    proc = _ksmd["proc"]
+    try:
+        if proc is None or not proc.is_running():
+            proc = next((p for p in psutil.process_iter(["name"]) if p.info["name"] == "ksmd"), None)
+            _ksmd.update(proc=proc, cpu_s=None, at=None)
+            if proc is None:
+                return None
+        t = proc.cpu_times()
+        cpu_s, now = t.user + t.system, time.monotonic()
+    except psutil.Error:
+        _ksmd["proc"] = None
+        return None
+
+    prev_cpu, prev_at = _ksmd["cpu_s"], _ksmd["at"]
+    _ksmd.update(cpu_s=cpu_s, at=now)
+    if prev_cpu is None or now <= prev_at:
+        return None
+    return round((cpu_s - prev_cpu) / (now - prev_at) * 100, 2)
+
+
+def _sleep_ms(total_bytes: int) -> int:
+    # ksmtuned's rule: 10 ms per 16 GiB-equivalent, shorter on big hosts
+    return max(10, int(10 * 16 * 1024 ** 3 / max(total_bytes, 1)))
+
+
+def tune_ksm() -> Optional[dict]:
+    """
+    One pass of the adaptive KSM policy (background task). Scans harder
+    while the host is short on memory, slows down when ksmd burns too much
+    CPU, and stops scanning once memory is plentiful again. Stopping
+    (run=0) keeps already merged pages merged.
+
+    :return: The decision, or None when KSM is unavailable or the policy is manual
+    """
+    if KSM_POLICY != "auto" or not ksm_available():
+        return None
+    stats = read_ksm() or {}
+    mem = psutil.virtual_memory()
+    free_pct = mem.available / mem.total * 100
+    psi = (read_pressure("memory") or {}).get("some", {}).get("avg10")
+    cpu = _ksmd_cpu_pct()
+
+    run = stats.get("run", 0)
+    pages = stats.get("pages_to_scan", KSM_PAGES_MIN)
+    pressure = free_pct < KSM_START_FREE_PCT or (psi is not None and psi > KSM_PSI_HIGH)
+
+    if pressure:
+        run, pages, reason = 1, min(KSM_PAGES_MAX, pages + KSM_PAGES_BOOST), "memory pressure"
+    elif free_pct > KSM_STOP_FREE_PCT:
+        run, reason = 0, "memory plentiful"
+    else:
+        pages, reason = max(KSM_PAGES_MIN, pages - KSM_PAGES_DECAY), "between thresholds"
+
+    if cpu is not None and cpu > KSM_MAX_CPU_PCT and run == 1:
+        pages = max(KSM_PAGES_MIN, min(pages, stats.get("pages_to_scan", pages)) - KSM_PAGES_DECAY)
+        reason += f", ksmd at {cpu}% CPU"
+
+    wanted = {"pages_to_scan": pages, "sleep_millisecs": _sleep_ms(mem.total), "run": run}
+    written = {}
+    for name, value in wanted.items():
+        if stats.get(name) != value:
+            written[name] = value if write_ksm(name, value) else "not writable"
+
+    decision = {
+        "at": time.time(),
+        "free_pct": round(free_pct, 1),
+        "psi_some_avg10": psi,
+        "ksmd_cpu_pct": cpu,
+        "reason": reason,
+        "wanted": wanted,
+        "written": written,
+    }
+    with _LOCK:
+        _state["decision"] = decision
+    applied = {k: v for k, v in written.items() if v != "not writable"}
+    if applied:
+        print(f"KSM: {reason}; set {applied}")
+    return decision
+
+
+def domains_without_ksm(conn: libvirt.virConnect) -> List[str]:
+    """
+    Domains that opted out of merging (<memoryBacking><nosharepages/>).
+    """
+    out = []
+    for domain in conn.listAllDomains():
+        try:
+            root = ET.fromstring(domain.XMLDesc(0))
+        except libvirt.libvirtError:
+            continue
+        if root.find("./memoryBacking/nosharepages") is not None:
+            out.append(domain.name())
+    return sorted(out)
+
+
+def ksm_report(conn: Optional[libvirt.virConnect]) -> dict:
+    """
+    KSM knobs, page counters and estimated savings, for /info.
+    """
+    stats = read_ksm()
+    if stats is None:
+        return {"available": False}
+    savings = ksm_savings_bytes(stats)
+    shared = stats.get("pages_shared", 0)
+    with _LOCK:
+        decision = _state["decision"]
+    report = {
+        "available": True,
+        "policy": KSM_POLICY,
+        "running": stats.get("run") == 1,
+        **stats,
+        "savings_bytes": savings,
+        # how many guest pages map onto each merged page, on average
+        "sharing_ratio": round(stats.get("pages_sharing", 0) / shared, 2) if shared else None,
+        # only set in the worker running the policy task
+        "last_decision": decision,
+        "opted_out_vms": None,
+    }
+    if conn is not None:
+        try:
+            report["opted_out_vms"] = domains_without_ksm(conn)
+        except libvirt.libvirtError:
+            pass
+    return report
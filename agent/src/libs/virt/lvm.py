@@ -0,0 +1,42 @@
+import shutil
+import subprocess
+from typing import Tuple
+
+
+def lvm_command(cmd: str) -> str:
+    path = shutil.which(cmd)
+    if not path:
+        raise RuntimeError(f"{cmd} not found on PATH (lvm2 package)")
+    return path
+
+
+def thin_pool_usage(volume_group: str, thin_pool: str) -> Tuple[int, int]:
+    """
+    Size and free bytes of an LVM thin pool. libvirt's logical pools only
+    report the volume group, whose free space the thin pool already took.
+
+    :return: (size_bytes, free_bytes)
+    """
+    out = subprocess.run(
+        [lvm_command("lvs"), "--noheadings", "--nosuffix", "--units", "b",
+         "-o", "lv_size,data_percent", f"{volume_group}/{thin_pool}"],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    size = int(out[0])
+    used_pct = float(out[1]) if len(out) > 1 else 0.0
+    return size, int(size * (100 - used_pct) / 100)
+
+
+def lv_allocated_bytes(path: str) -> int:
+    """
+    Bytes an LV holds in its volume group: used chunks of a thin LV, the
+    full size of a thick one.
+    """
+    out = subprocess.run(
+        [lvm_command("lvs"), "--noheadings", "--nosuffix", "--units", "b", "-o", "lv_size,data_percent", path],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    size = int(out[0])
+    if len(out) < 2:
+        return size
+    return int(size * float(out[1]) / 100)
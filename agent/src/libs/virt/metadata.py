@@ -0,0 +1,46 @@
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+import libvirt
+
+# Agent-owned <metadata> elements live under this namespace, one URI per feature
+METADATA_URI_BASE = "https://github.com/diogocastrodev/OSS-KVM-Manager/agent"
+
+
+def _uri(key: str) -> str:
+    return f"{METADATA_URI_BASE}/{key}"
+
+
+def get_metadata(domain: libvirt.virDomain, key: str, inactive: bool = False) -> Optional[ET.Element]:
+    """
+    Reads an agent metadata element from the domain XML.
+
+    :param domain: Domain
+    :type domain: libvirt.virDomain
+    :param key: Feature key ("snapshots", ...)
+    :type key: str
+    :param inactive: Read the persistent config instead of the live definition
+    :type inactive: bool
+    :return: The element, or None if the domain doesn't have it
+    :rtype: ET.Element | None
+    """
+    flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG if inactive else libvirt.VIR_DOMAIN_AFFECT_CURRENT
+    try:
+        xml = domain.metadata(libvirt.VIR_DOMAIN_METADATA_ELEMENT, _uri(key), flags)
+    except libvirt.libvirtError as e:
+        if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN_METADATA:
+            return None
+        raise
+    return ET.fromstring(xml)
+
+
+def set_metadata(domain: libvirt.virDomain, key: str, element: Optional[ET.Element]) -> None:
+    """
+    Writes (or removes, when element is None) an agent metadata element in
+    the persistent config and, if the domain runs, in the live definition.
+    """
+    flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+    if domain.isActive():
+        flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+    xml = ET.tostring(element, encoding="unicode") if element is not None else None
+    domain.setMetadata(libvirt.VIR_DOMAIN_METADATA_ELEMENT, xml, "agent", _uri(key), flags)
@@ -0,0 +1,203 @@
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+import libvirt
+
+from src.libs.jobs.jobs import Job, JobCancelled, update_progress
+from src.models.migrate_vm import MigrateRequest
+from src.libs.telemetry.tracing import traced
+from .capacity import refresh_vm
+from .connection import get_connection
+
+# jobStats keys worth streaming to the caller
+_PROGRESS_KEYS = (
+    "time_elapsed",
+    "time_remaining",
+    "data_total",
+    "data_processed",
+    "data_remaining",
+    "memory_total",
+    "memory_processed",
+    "memory_remaining",
+    "memory_dirty_rate",
+    "memory_iteration",
+    "memory_bps",
+    "memory_postcopy_requests",
+    "disk_total",
+    "disk_processed",
+    "disk_remaining",
+    "disk_bps",
+    "compression_bytes",
+    "compression_overflow",
+    "auto_converge_throttle",
+    "downtime",
+    "setup_time",
+)
+
+
+def _strip_pinning(xml: str) -> str:
+    """
+    Removes host-specific placement so the destination agent can place the VM.
+    """
+    root = ET.fromstring(xml)
+    for tag in ("cputune", "numatune"):
+        el = root.find(tag)
+        if el is not None:
+            root.remove(el)
+    vcpu = root.find("vcpu")
+    if vcpu is not None and "cpuset" in vcpu.attrib:
+        del vcpu.attrib["cpuset"]
+    return ET.tostring(root, encoding="unicode")
+
+
+def _flags(opts: MigrateRequest) -> int:
+    flags = (
+        libvirt.VIR_MIGRATE_LIVE
+        | libvirt.VIR_MIGRATE_PEER2PEER
+        | libvirt.VIR_MIGRATE_PERSIST_DEST
+        | libvirt.VIR_MIGRATE_ABORT_ON_ERROR
+    )
+    if opts.undefine_source:
+        flags |= libvirt.VIR_MIGRATE_UNDEFINE_SOURCE
+    if opts.compression:
+        flags |= libvirt.VIR_MIGRATE_COMPRESSED
+    if opts.auto_converge:
+        flags |= libvirt.VIR_MIGRATE_AUTO_CONVERGE
+    if opts.postcopy:
+        flags |= libvirt.VIR_MIGRATE_POSTCOPY
+    if opts.copy_storage:
+        flags |= libvirt.VIR_MIGRATE_NON_SHARED_DISK
+    if opts.parallel_connections:
+        flags |= libvirt.VIR_MIGRATE_PARALLEL
+    return flags
+
+
+def _params(domain: libvirt.virDomain, opts: MigrateRequest) -> dict:
+    params = {}
+    if opts.bandwidth_mibps:
+        params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH] = opts.bandwidth_mibps
+    if opts.postcopy and opts.postcopy_bandwidth_mibps:
+        params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH_POSTCOPY] = opts.postcopy_bandwidth_mibps
+    if opts.compression:
+        # repeated string parameter: the binding accepts a list
+        params[libvirt.VIR_MIGRATE_PARAM_COMPRESSION] = [c.value for c in opts.compression]
+    if opts.parallel_connections:
+        params[libvirt.VIR_MIGRATE_PARAM_PARALLEL_CONNECTIONS] = opts.parallel_connections
+    if opts.copy_storage:
+        params[libvirt.VIR_MIGRATE_PARAM_MIGRATE_DISKS] = ["vda"]
+    if opts.strip_pinning:
+        params[libvirt.VIR_MIGRATE_PARAM_DEST_XML] = _strip_pinning(
+            domain.XMLDesc(libvirt.VIR_DOMAIN_XML_MIGRATABLE)
+        )
+        params[libvirt.VIR_MIGRATE_PARAM_PERSIST_XML] = _strip_pinning(
+            domain.XMLDesc(libvirt.VIR_DOMAIN_XML_MIGRATABLE | libvirt.VIR_DOMAIN_XML_INACTIVE)
+        )
+    return params
+
+
+def _stats(domain: libvirt.virDomain, flags: int = 0) -> Optional[dict]:
+    try:
+        stats = domain.jobStats(flags)
+    except libvirt.libvirtError:
+        return None
+    return {k: stats[k] for k in _PROGRESS_KEYS if k in stats}
+
+
+@traced("migrate.migrate_domain")
+def migrate_domain(job: Job, vm_id: str, opts: MigrateRequest) -> dict:
+    """
+    Live-migrates `vm_id` to `opts.dest_uri` (peer-to-peer, so the source
+    libvirtd talks to the destination directly). The migration itself blocks a
+    worker thread while this one polls jobStats into the job's progress and
+    switches to post-copy when asked to.
+
+    :param job: Job tracking this migration
+    :type job: Job
+    :param vm_id: Domain name
+    :type vm_id: str
+    :param opts: Migration options
+    :type opts: MigrateRequest
+    :return: Final migration statistics
+    :rtype: dict
+    """
+    conn = get_connection()
+    try:
+        domain = conn.lookupByName(vm_id)
+        if not domain.isActive():
+            raise RuntimeError("Only running VMs can be live-migrated")
+
+        flags = _flags(opts)
+        params = _params(domain, opts)
+
+        outcome: dict = {}
+
+        def _worker():
+            try:
+                domain.migrateToURI3(opts.dest_uri, params, flags)
+                outcome["ok"] = True
+            except libvirt.libvirtError as e:
+                outcome["error"] = e
+
+        job.on_cancel = domain.abortJob
+        update_progress(job, phase="precopy", dest_uri=opts.dest_uri)
+        started = time.monotonic()
+        worker = threading.Thread(target=_worker, name=f"migrate-{vm_id}", daemon=True)
+        worker.start()
+
+        downtime_set = False
+        postcopy_started = False
+        last: Optional[dict] = None
+        while worker.is_alive():
+            worker.join(timeout=1.0)
+            if not worker.is_alive():
+                break
+
+            stats = _stats(domain)
+            if stats:
+                last = stats
+                update_progress(job, **stats)
+
+                # downtime can only be tuned once the migration job exists
+                if opts.max_downtime_ms and not downtime_set:
+                    try:
+                        domain.migrateSetMaxDowntime(opts.max_downtime_ms, 0)
+                        downtime_set = True
+                    except libvirt.libvirtError:
+                        pass
+
+            if (
+                opts.postcopy
+                and not postcopy_started
+                and time.monotonic() - started >= opts.postcopy_after_s
+            ):
+                try:
+                    domain.migrateStartPostCopy(0)
+                    postcopy_started = True
+                    update_progress(job, phase="postcopy")
+                except libvirt.libvirtError as e:
+                    print(f"Post-copy switch for {vm_id} failed: {e}")
+
+        if "error" in outcome:
+            if job.cancel_requested:
+                raise JobCancelled()
+            raise outcome["error"]
+
+        final = None
+        if not opts.undefine_source:
+            final = _stats(domain, libvirt.VIR_DOMAIN_JOB_STATS_COMPLETED)
+        final = final or last or {}
+        # the VM's resources are no longer committed here if the source was undefined
+        refresh_vm(conn, vm_id)
+        update_progress(job, phase="completed", **final)
+        return {
+            "vm_id": vm_id,
+            "dest_uri": opts.dest_uri,
+            "postcopy": postcopy_started,
+            "duration_s": round(time.monotonic() - started, 3),
+            "stats": final,
+        }
+    finally:
+        job.on_cancel = None
+        conn.close()
@@ -0,0 +1,332 @@
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import libvirt
+
+from src.libs.host.sysfs import format_cpulist, parse_cpulist
+from src.libs.store.locks import process_lock
+from .topology import HostTopology, NumaNode, get_host_topology
+
+# Held from "choose cores" until the domain is defined, so two concurrent
+# creates never see the same free cores. Host-wide: all agent workers share it.
+PLACEMENT_LOCK = process_lock("placement")
+
+
+@dataclass
+class DomainPinning:
+    name: str
+    vcpus: int
+    memory_kib: int
+    vcpu_cpus: Dict[int, List[int]] = field(default_factory=dict)
+    nodeset: Optional[List[int]] = None
+
+    @property
+    def pinned(self) -> bool:
+        return bool(self.vcpu_cpus)
+
+
+@dataclass
+class Placement:
+    node: int
+    vcpu_cpus: List[int]       # host CPU for each guest vCPU (index = vcpu id)
+    emulator_cpus: List[int]   # host CPUs for the emulator/IO threads
+
+    def to_dict(self) -> dict:
+        return {
+            "node": self.node,
+            "vcpu_cpus": self.vcpu_cpus,
+            "emulator_cpus": format_cpulist(self.emulator_cpus),
+        }
+
+
+def read_domain_pinning(domain: libvirt.virDomain) -> DomainPinning:
+    """
+    Reads vCPU pinning and NUMA memory binding from the domain XML.
+
+    :param domain: Domain to inspect
+    :type domain: libvirt.virDomain
+    :return: Pinning information (vcpu_cpus empty if the domain floats)
+    :rtype: DomainPinning
+    """
+    root = ET.fromstring(domain.XMLDesc(0))
+
+    vcpu_el = root.find("vcpu")
+    vcpus = int(vcpu_el.text) if vcpu_el is not None and vcpu_el.text else 1
+    if vcpu_el is not None and vcpu_el.get("current"):
+        vcpus = int(vcpu_el.get("current"))
+
+    mem_el = root.find("currentMemory")
+    if mem_el is None:
+        mem_el = root.find("memory")
+    memory_kib = int(mem_el.text) if mem_el is not None and mem_el.text else 0
+
+    pinning = DomainPinning(name=root.findtext("name") or domain.name(), vcpus=vcpus, memory_kib=memory_kib)
+
+    for pin in root.findall("./cputune/vcpupin"):
+        pinning.vcpu_cpus[int(pin.get("vcpu"))] = parse_cpulist(pin.get("cpuset", ""))
+
+    mem_tune = root.find("./numatune/memory")
+    if mem_tune is not None and mem_tune.get("nodeset"):
+        pinning.nodeset = parse_cpulist(mem_tune.get("nodeset"))
+
+    return pinning
+
+
+def collect_pinnings(conn: libvirt.virConnect, exclude: Optional[str] = None) -> List[DomainPinning]:
+    """
+    Pinning of every defined domain (running or not: a stopped VM keeps its
+    cores reserved for when it boots again).
+    """
+    out = []
+    for domain in conn.listAllDomains():
+        if exclude is not None and domain.name() == exclude:
+            continue
+        try:
+            out.append(read_domain_pinning(domain))
+        except (libvirt.libvirtError, ET.ParseError):
+            continue
+    return out
+
+
+def _cpu_loads(topo: HostTopology, pinnings: List[DomainPinning]) -> Dict[int, float]:
+    """
+    Number of guest vCPUs sitting on each host CPU. Unpinned domains are
+    spread evenly over every CPU they could run on.
+    """
+    all_cpus = [c.id for n in topo.nodes for c in n.cpus]
+    loads = {cpu: 0.0 for cpu in all_cpus}
+    for p in pinnings:
+        if p.pinned:
+            for cpus in p.vcpu_cpus.values():
+                for cpu in cpus:
+                    if cpu in loads:
+                        loads[cpu] += 1.0 / max(len(cpus), 1)
+        elif all_cpus:
+            share = p.vcpus / len(all_cpus)
+            for cpu in all_cpus:
+                loads[cpu] += share
+    return loads
+
+
+def _node_committed_memory_kib(topo: HostTopology, pinnings: List[DomainPinning]) -> Dict[int, int]:
+    committed = {n.id: 0 for n in topo.nodes}
+    for p in pinnings:
+        nodes = [n for n in (p.nodeset or []) if n in committed]
+        if not nodes:
+            continue
+        for n in nodes:
+            committed[n] += p.memory_kib // len(nodes)
+    return committed
+
+
+def node_loads(conn: libvirt.virConnect) -> List[dict]:
+    """
+    Per-node view of how many vCPUs and how much strictly-bound memory is placed
+    on each NUMA node.
+    """
+    topo = get_host_topology(conn)
+    pinnings = collect_pinnings(conn)
+    loads = _cpu_loads(topo, pinnings)
+    committed = _node_committed_memory_kib(topo, pinnings)
+    out = []
+    for n in topo.nodes:
+        vcpus = sum(loads[c] for c in n.cpu_ids)
+        out.append({
+            "node": n.id,
+            "cpus": len(n.cpus),
+            "vcpus_placed": round(vcpus, 2),
+            "load": round(vcpus / max(len(n.cpus), 1), 3),
+            "memory_kib": n.memory_kib,
+            "memory_committed_kib": committed[n.id],
+            "cpu_vcpus": {c: round(loads[c], 2) for c in n.cpu_ids},
+        })
+    return out
+
+
+def _pick_cpus(node: NumaNode, loads: Dict[int, float], count: int) -> List[int]:
+    """
+    Greedily picks `count` host CPUs of a node, always taking the CPU whose
+    own load and whose SMT siblings' load is the lowest. That spreads vCPUs
+    over physical cores before stacking them on hyperthreads.
+    """
+    local = {c.id: loads.get(c.id, 0.0) for c in node.cpus}
+    siblings = {c.id: c.siblings for c in node.cpus}
+    picked: List[int] = []
+    for _ in range(count):
+        cpu = min(
+            local,
+            key=lambda c: (local[c], sum(local.get(s, 0.0) for s in siblings[c]), c),
+        )
+        picked.append(cpu)
+        local[cpu] += 1.0
+    return picked
+
+
+def choose_placement(
+    topo: HostTopology,
+    pinnings: List[DomainPinning],
+    vcpus: int,
+    memory_kib: int,
+) -> Optional[Placement]:
+    """
+    Chooses the least-loaded NUMA node able to hold the whole VM (vCPUs and
+    memory) and the host CPUs each vCPU should be pinned to.
+
+    :return: Placement, or None if no single node can hold the VM
+    :rtype: Placement | None
+    """
+    loads = _cpu_loads(topo, pinnings)
+    committed = _node_committed_memory_kib(topo, pinnings)
+
+    candidates = []
+    for n in topo.nodes:
+        if not n.cpus or vcpus > len(n.cpus):
+            continue
+        free_kib = n.memory_kib - committed[n.id]
+        if n.memory_kib and memory_kib > free_kib:
+            continue
+        load = sum(loads[c] for c in n.cpu_ids) / len(n.cpus)
+        candidates.append((load, -free_kib, n.id, n))
+
+    if not candidates:
+        return None
+
+    _load, _free, _id, node = min(candidates, key=lambda t: t[:3])
+    return Placement(
+        node=node.id,
+        vcpu_cpus=_pick_cpus(node, loads, vcpus),
+        emulator_cpus=node.cpu_ids,
+    )
+
+
+def render_cputune(placement: Optional[Placement]) -> str:
+    """
+    <cputune> element for the domain template (empty string when not pinned).
+    """
+    if placement is None:
+        return ""
+    lines = ["    <cputune>"]
+    for vcpu, cpu in enumerate(placement.vcpu_cpus):
+        lines.append(f"        <vcpupin vcpu='{vcpu}' cpuset='{cpu}' />")
+    lines.append(f"        <emulatorpin cpuset='{format_cpulist(placement.emulator_cpus)}' />")
+    lines.append("    </cputune>")
+    return "\n".join(lines)
+
+
+def render_numatune(placement: Optional[Placement]) -> str:
+    """
+    <numatune> element for the domain template (empty string when not pinned).
+    """
+    if placement is None:
+        return ""
+    return (
+        "    <numatune>\n"
+        f"        <memory mode='strict' nodeset='{placement.node}' />\n"
+        "    </numatune>"
+    )
+
+
+def place_new_vm(conn: libvirt.virConnect, vcpus: int, memory_mib: int) -> Optional[Placement]:
+    """
+    Placement for a VM that is about to be defined. Callers should hold
+    PLACEMENT_LOCK until the domain is defined.
+    """
+    topo = get_host_topology(conn)
+    return choose_placement(topo, collect_pinnings(conn), vcpus, memory_mib * 1024)
+
+
+def _cpumap(conn: libvirt.virConnect, cpus: List[int]) -> tuple:
+    host_cpus = conn.getCPUMap()[0]
+    wanted = set(cpus)
+    return tuple(i in wanted for i in range(host_cpus))
+
+
+def apply_placement(conn: libvirt.virConnect, domain: libvirt.virDomain, placement: Placement) -> dict:
+    """
+    Pins an existing domain to `placement`. Running domains are changed live
+    and in their persistent config; stopped ones only in config.
+
+    :return: What was applied (memory migration may be config-only)
+    :rtype: dict
+    """
+    flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+    if domain.isActive():
+        flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+
+    for vcpu, cpu in enumerate(placement.vcpu_cpus):
+        domain.pinVcpuFlags(vcpu, _cpumap(conn, [cpu]), flags)
+    domain.pinEmulator(_cpumap(conn, placement.emulator_cpus), flags)
+
+    memory_live = bool(flags & libvirt.VIR_DOMAIN_AFFECT_LIVE)
+    numa_params = {libvirt.VIR_DOMAIN_NUMA_NODESET: str(placement.node)}
+    try:
+        domain.setNumaParameters(numa_params, flags)
+    except libvirt.libvirtError as e:
+        # e.g. memory mode isn't "strict" on the running domain; the new
+        # nodeset will apply on next boot
+        print(f"Live NUMA memory move failed for {domain.name()}: {e}")
+        domain.setNumaParameters(numa_params, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        memory_live = False
+
+    return {**placement.to_dict(), "memory_moved_live": memory_live}
+
+
+def repin_domain(conn: libvirt.virConnect, domain: libvirt.virDomain) -> Optional[dict]:
+    """
+    Re-places a single domain on the least-loaded node, ignoring its own
+    current pinning.
+    """
+    with PLACEMENT_LOCK:
+        topo = get_host_topology(conn)
+        me = read_domain_pinning(domain)
+        others = collect_pinnings(conn, exclude=domain.name())
+        placement = choose_placement(topo, others, me.vcpus, me.memory_kib)
+        if placement is None:
+            return None
+        return apply_placement(conn, domain, placement)
+
+
+def rebalance(conn: libvirt.virConnect) -> List[dict]:
+    """
+    Recomputes placement for every running domain from scratch (largest
+    first) and repins the ones whose placement changed.
+
+    :return: One entry per running domain
+    :rtype: List[dict]
+    """
+    with PLACEMENT_LOCK:
+        topo = get_host_topology(conn)
+        domains = {d.name(): d for d in conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)}
+        current = {name: read_domain_pinning(d) for name, d in domains.items()}
+        # stopped domains keep their reservations while we shuffle running ones
+        placed: List[DomainPinning] = collect_pinnings(conn)
+        placed = [p for p in placed if p.name not in domains]
+
+        results = []
+        for name in sorted(current, key=lambda n: (-current[n].vcpus, n)):
+            me = current[name]
+            placement = choose_placement(topo, placed, me.vcpus, me.memory_kib)
+            if placement is None:
+                placed.append(me)
+                results.append({"vm": name, "changed": False, "reason": "no single node fits"})
+                continue
+
+            new_pins = {i: [cpu] for i, cpu in enumerate(placement.vcpu_cpus)}
+            changed = new_pins != me.vcpu_cpus or me.nodeset != [placement.node]
+            entry = {"vm": name, "changed": changed, **placement.to_dict()}
+            if changed:
+                try:
+                    entry.update(apply_placement(conn, domains[name], placement))
+                except libvirt.libvirtError as e:
+                    entry.update({"changed": False, "error": str(e)})
+                    placed.append(me)
+                    results.append(entry)
+                    continue
+
+            placed.append(DomainPinning(
+                name=name, vcpus=me.vcpus, memory_kib=me.memory_kib,
+                vcpu_cpus=new_pins, nodeset=[placement.node],
+            ))
+            results.append(entry)
+        return results
@@ -0,0 +1,88 @@
+import json
+import shutil
+import subprocess
+from typing import List
+
+from src.libs.telemetry.tracing import traced
+
+
+def _qemu_img() -> str:
+    qemu_img = shutil.which("qemu-img")
+    if not qemu_img:
+        raise RuntimeError("qemu-img not found on PATH")
+    return qemu_img
+
+
+@traced("qemu_img.image_info")
+def image_info(path: str) -> dict:
+    """
+    `qemu-img info` of a single image. -U lets us read images a running VM holds.
+    """
+    out = subprocess.run(
+        [_qemu_img(), "info", "-U", "--output=json", path],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout)
+
+
+@traced("qemu_img.backing_chain")
+def backing_chain(path: str) -> List[str]:
+    """
+    Files of an image's backing chain, top (the image itself) first.
+    """
+    out = subprocess.run(
+        [_qemu_img(), "info", "-U", "--backing-chain", "--output=json", path],
+        check=True, capture_output=True, text=True,
+    )
+    infos = json.loads(out.stdout)
+    if isinstance(infos, dict):
+        infos = [infos]
+    return [i["filename"] for i in infos]
+
+
+@traced("qemu_img.create_overlay")
+def create_overlay(backing_path: str, overlay_path: str, backing_format: str = "qcow2") -> None:
+    """
+    Creates an empty qcow2 overlay on top of `backing_path`. O(1): no data is copied.
+    """
+    subprocess.run(
+        [_qemu_img(), "create", "-q", "-f", "qcow2", "-F", backing_format, "-b", backing_path, overlay_path],
+        check=True,
+    )
+
+
+@traced("qemu_img.commit")
+def commit(top_path: str) -> None:
+    """
+    Commits `top_path` into its direct backing file (offline).
+    """
+    subprocess.run([_qemu_img(), "commit", "-q", "-d", top_path], check=True)
+
+
+@traced("qemu_img.rebase_unsafe")
+def rebase_unsafe(path: str, new_backing: str, backing_format: str = "qcow2") -> None:
+    """
+    Re-points `path` at `new_backing` without copying data. Only valid when
+    the new backing presents the same content as the old one.
+    """
+    subprocess.run(
+        [_qemu_img(), "rebase", "-u", "-F", backing_format, "-b", new_backing, path],
+        check=True,
+    )
+
+
+@traced("qemu_img.convert")
+def convert(src_path: str, dst_path: str, fmt: str = "qcow2") -> None:
+    """
+    Copies an image into a new standalone file. Unallocated and zero
+    clusters are not written, so the copy only holds live data.
+    """
+    subprocess.run([_qemu_img(), "convert", "-q", "-O", fmt, src_path, dst_path], check=True)
+
+
+@traced("qemu_img.resize")
+def resize(path: str, size_bytes: int) -> None:
+    """
+    Sets an image's virtual size. The VM using it must be off.
+    """
+    subprocess.run([_qemu_img(), "resize", "-q", path, str(size_bytes)], check=True)
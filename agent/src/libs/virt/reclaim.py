@@ -0,0 +1,337 @@
+import os
+import shutil
+import subprocess
+import time
+from typing import List, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.jobs.jobs import Job, check_cancelled, list_jobs, update_progress
+from src.libs.store import capacity as ledger
+from src.libs.store import reclaim as reclaim_store
+from src.libs.store.locks import process_lock
+from src.libs.telemetry.tracing import span
+from .connection import get_connection
+from .format import get_vda_format, get_vda_path, vda_discard, vda_is_block
+from .guest_agent import GuestAgentError, agent_command
+from .guest_facts import agent_channel_state
+from .qemu_img import backing_chain, convert
+from .snapshots import vm_lock
+from .volumes import allocated_bytes
+
+load_dotenv()
+
+RECLAIM_ENABLED = os.getenv("RECLAIM_ENABLED", "true").lower() == "true"
+RECLAIM_INTERVAL_S = float(os.getenv("RECLAIM_INTERVAL_S", "86400"))
+# Rewrite stopped VMs' disks offline; running ones are only trimmed
+RECLAIM_COMPACT_STOPPED = os.getenv("RECLAIM_COMPACT_STOPPED", "true").lower() == "true"
+# A stopped VM is compacted again only once its disk grew this much since the last compaction
+RECLAIM_COMPACT_MIN_GROWTH_GB = float(os.getenv("RECLAIM_COMPACT_MIN_GROWTH_GB", "1"))
+# How long a pass waits for the guest's fstrim before moving on to the next VM
+RECLAIM_TRIM_TIMEOUT_S = int(os.getenv("RECLAIM_TRIM_TIMEOUT_S", "300"))
+
+_RECLAIM_LOCK = process_lock("reclaim")
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Running VMs                                 #
+# ---------------------------------------------------------------------------- #
+def trim_vm(domain: libvirt.virDomain) -> dict:
+    """
+    Runs fstrim on the guest's filesystems through the guest agent. With
+    discard='unmap' the freed blocks reach the image: qcow2 clusters are
+    punched out of the file, thin LVs hand chunks back to the pool.
+
+    :return: Bytes reclaimed (host allocation before - after)
+    :raises ValueError: Not running, no discard passthrough, no guest agent
+        or the trim did not finish within RECLAIM_TRIM_TIMEOUT_S
+    """
+    name = domain.name()
+    if not domain.isActive():
+        raise ValueError("VM is not running")
+    if not vda_discard(domain):
+        raise ValueError("vda has no discard='unmap'; guest trims stop at QEMU")
+    if agent_channel_state(domain) != "connected":
+        raise ValueError("Guest agent is not connected")
+
+    path = get_vda_path(domain)
+    before = allocated_bytes(path)
+    t0 = time.perf_counter()
+    try:
+        with span("libvirt.fstrim", vm=name):
+            # domain.fSTrim waits on the agent without a timeout
+            agent_command(domain, "guest-fstrim", timeout_s=RECLAIM_TRIM_TIMEOUT_S)
+    except GuestAgentError as e:
+        cause = e.__cause__
+        if isinstance(cause, libvirt.libvirtError) and cause.get_error_code() == libvirt.VIR_ERR_AGENT_UNRESPONSIVE:
+            # the guest keeps trimming; the next pass sees what it freed
+            raise ValueError(f"Guest fstrim did not finish within {RECLAIM_TRIM_TIMEOUT_S}s") from e
+        reclaim_store.record_error(name, f"trim: {e}")
+        raise
+    after = allocated_bytes(path)
+    # the guest keeps writing meanwhile; growth is not reclamation
+    reclaimed = max(0, before - after)
+    reclaim_store.record_trim(name, reclaimed, after)
+    return {
+        "vm_id": name,
+        "action": "trim",
+        "reclaimed_bytes": reclaimed,
+        "allocation_bytes": after,
+        "seconds": round(time.perf_counter() - t0, 1),
+    }
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Stopped VMs                                 #
+# ---------------------------------------------------------------------------- #
+def _rewrite_qcow2(domain: libvirt.virDomain, path: str, allocated: int) -> None:
+    """
+    Replaces a qcow2 file with a compacted copy. The scratch file is
+    "<disk>.tmp", which reconcile removes if we die halfway.
+    """
+    free = shutil.disk_usage(os.path.dirname(path)).free
+    if free < allocated:
+        raise ValueError(f"Rewriting needs {allocated} bytes free next to the disk, {free} left")
+    st = os.stat(path)
+    tmp = f"{path}.tmp"
+    try:
+        # qemu-img holds the image lock while it reads, so QEMU can't open the disk for writing meanwhile
+        convert(path, tmp)
+        if domain.isActive():
+            raise ValueError("VM was started during compaction; kept the original disk")
+        try:
+            os.chown(tmp, st.st_uid, st.st_gid)
+            os.chmod(tmp, st.st_mode)
+        except PermissionError:
+            pass
+        os.replace(tmp, path)
+    finally:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+
+
+def _compact(domain: libvirt.virDomain, path: str, disk_format: str, block: bool, allocated: int) -> str:
+    """
+    :return: The method used
+    """
+    sparsify = shutil.which("virt-sparsify")
+    if sparsify:
+        # trims the guest filesystems offline: also frees data deleted while discard was off
+        subprocess.run(
+            [sparsify, "--in-place", "--quiet", "--format", disk_format, path],
+            check=True, capture_output=True,
+        )
+        return "virt-sparsify"
+    if block:
+        raise ValueError("Compacting block volumes needs virt-sparsify (libguestfs-tools)")
+    if disk_format == "raw":
+        fallocate = shutil.which("fallocate")
+        if not fallocate:
+            raise RuntimeError("fallocate not found on PATH")
+        # only zeroed blocks become holes; the guest's free space stays allocated
+        subprocess.run([fallocate, "--dig-holes", path], check=True, capture_output=True)
+        return "dig-holes"
+    _rewrite_qcow2(domain, path, allocated)
+    return "qemu-img-convert"
+
+
+def compact_vm(domain: libvirt.virDomain) -> dict:
+    """
+    Gives a stopped VM's unused disk space back to the pool: virt-sparsify
+    in place when libguestfs is installed, otherwise a qcow2 rewrite
+    (zero/discarded clusters are dropped) or hole punching of raw files.
+    Hold vm_lock around it.
+
+    :return: Bytes reclaimed and the method used
+    :raises ValueError: Running, hibernated, or vda has a backing chain
+    """
+    name = domain.name()
+    if domain.isActive():
+        raise ValueError("VM is running; it can only be trimmed")
+    if domain.hasManagedSaveImage(0):
+        raise ValueError("VM is hibernated; its saved RAM expects the disk as it is")
+    path = get_vda_path(domain)
+    disk_format = get_vda_format(domain)
+    block = vda_is_block(domain)
+    if disk_format == "qcow2" and len(backing_chain(path)) > 1:
+        raise ValueError("vda has snapshots or a backing image; only standalone disks are compacted")
+
+    before = allocated_bytes(path)
+    t0 = time.perf_counter()
+    try:
+        with span("reclaim.compact", vm=name, format=disk_format):
+            method = _compact(domain, path, disk_format, block, before)
+    except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+        reclaim_store.record_error(name, f"compact: {e}")
+        raise
+    after = allocated_bytes(path)
+    reclaimed = max(0, before - after)
+    reclaim_store.record_compact(name, method, reclaimed, after)
+    return {
+        "vm_id": name,
+        "action": "compact",
+        "method": method,
+        "reclaimed_bytes": reclaimed,
+        "allocation_bytes": after,
+        "seconds": round(time.perf_counter() - t0, 1),
+    }
+
+
+def reclaim_vm(job: Job, vm_id: str) -> dict:
+    """
+    Job body of POST /vms/{vm_id}/disk/reclaim: trim if running, compact if stopped.
+    """
+    conn = get_connection()
+    try:
+        domain = conn.lookupByName(vm_id)
+        if domain.isActive():
+            update_progress(job, stage="trimming")
+            return trim_vm(domain)
+        with vm_lock(vm_id):
+            update_progress(job, stage="compacting")
+            return compact_vm(domain)
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Host passes                                 #
+# ---------------------------------------------------------------------------- #
+def _grown_since_compaction(domain: libvirt.virDomain, record: Optional[dict]) -> bool:
+    if record is None or record["compacted_at"] is None or record["compacted_allocation_bytes"] is None:
+        return True
+    growth = allocated_bytes(get_vda_path(domain)) - record["compacted_allocation_bytes"]
+    return growth >= RECLAIM_COMPACT_MIN_GROWTH_GB * 1024 ** 3
+
+
+def run_reclaim(job: Optional[Job] = None, trigger: str = "manual") -> dict:
+    """
+    One reclamation pass over every VM: running ones are trimmed, stopped
+    ones compacted (RECLAIM_COMPACT_STOPPED) when their disk grew since the
+    last compaction. VMs with an active job, or whose lock is held, are skipped.
+
+    :return: Per-VM results and the bytes reclaimed by the pass
+    :raises RuntimeError: Another pass is running
+    """
+    if not _RECLAIM_LOCK.acquire(blocking=False):
+        raise RuntimeError("A reclaim pass is already running")
+    started = time.time()
+    results: List[dict] = []
+    try:
+        busy = {j.vm_id for j in list_jobs(active_only=True) if j.vm_id}
+        records = reclaim_store.list_records()
+        conn = get_connection()
+        try:
+            domains = conn.listAllDomains()
+            for i, domain in enumerate(domains):
+                name = domain.name()
+                if job is not None:
+                    check_cancelled(job)
+                    update_progress(job, stage="reclaiming", vm=name, done=i, total=len(domains))
+                if name in busy:
+                    results.append({"vm_id": name, "skipped": "VM has an active job"})
+                    continue
+                try:
+                    if domain.isActive():
+                        results.append(trim_vm(domain))
+                        continue
+                    if not RECLAIM_COMPACT_STOPPED:
+                        continue
+                    if not _grown_since_compaction(domain, records.get(name)):
+                        results.append({"vm_id": name, "skipped": "disk barely grew since the last compaction"})
+                        continue
+                    lock = vm_lock(name)
+                    if not lock.acquire(blocking=False):
+                        results.append({"vm_id": name, "skipped": "VM is locked by another operation"})
+                        continue
+                    try:
+                        results.append(compact_vm(domain))
+                    finally:
+                        lock.release()
+                except ValueError as e:
+                    results.append({"vm_id": name, "skipped": str(e)})
+                except (libvirt.libvirtError, subprocess.CalledProcessError, OSError, RuntimeError) as e:
+                    results.append({"vm_id": name, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            conn.close()
+
+        done = [r for r in results if "action" in r]
+        reclaimed = sum(r["reclaimed_bytes"] for r in done)
+        reclaim_store.record_run(
+            trigger,
+            started,
+            trimmed=sum(1 for r in done if r["action"] == "trim"),
+            compacted=sum(1 for r in done if r["action"] == "compact"),
+            skipped=sum(1 for r in results if "skipped" in r),
+            errors=sum(1 for r in results if "error" in r),
+            reclaimed_bytes=reclaimed,
+        )
+    finally:
+        _RECLAIM_LOCK.release()
+    if done:
+        print(f"Reclaim ({trigger}) freed {reclaimed} bytes from {len(done)} VM(s)")
+    return {"trigger": trigger, "reclaimed_bytes": reclaimed, "seconds": round(time.time() - started, 1), "vms": results}
+
+
+def run_periodic_reclaim() -> None:
+    """
+    Periodic task: one reclaim pass when RECLAIM_ENABLED.
+    """
+    if not RECLAIM_ENABLED:
+        return
+    try:
+        run_reclaim(trigger="periodic")
+    except RuntimeError as e:
+        print(f"Skipping reclaim: {e}")
+
+
+def reclaim_report(conn: libvirt.virConnect) -> dict:
+    """
+    Host allocation against virtual size of every VM's disk (vda's active
+    layer), with what trims and compactions reclaimed so far, plus the
+    latest passes.
+    """
+    records = reclaim_store.list_records()
+    pools = {e["vm_id"]: e["pool"] for e in ledger.list_entries()}
+    vms = []
+    for domain in conn.listAllDomains():
+        name = domain.name()
+        try:
+            path = get_vda_path(domain)
+            capacity_bytes = domain.blockInfo("vda", 0)[0]
+            allocation = allocated_bytes(path)
+        except (libvirt.libvirtError, subprocess.CalledProcessError, OSError, RuntimeError) as e:
+            vms.append({"vm_id": name, "error": f"{type(e).__name__}: {e}"})
+            continue
+        record = records.get(name) or {}
+        vms.append({
+            "vm_id": name,
+            "running": bool(domain.isActive()),
+            "pool": pools.get(name),
+            "format": get_vda_format(domain),
+            "discard": vda_discard(domain),
+            "capacity_bytes": capacity_bytes,
+            "allocation_bytes": allocation,
+            "allocation_pct": round(allocation / capacity_bytes * 100, 1) if capacity_bytes else None,
+            "trimmed_at": record.get("trimmed_at"),
+            "compacted_at": record.get("compacted_at"),
+            "reclaimed_bytes": record.get("reclaimed_bytes", 0),
+            "error": record.get("error"),
+        })
+    ok = [v for v in vms if "capacity_bytes" in v]
+    return {
+        "policy": {
+            "enabled": RECLAIM_ENABLED,
+            "interval_s": RECLAIM_INTERVAL_S,
+            "compact_stopped": RECLAIM_COMPACT_STOPPED,
+            "compact_min_growth_gb": RECLAIM_COMPACT_MIN_GROWTH_GB,
+        },
+        "capacity_bytes": sum(v["capacity_bytes"] for v in ok),
+        "allocation_bytes": sum(v["allocation_bytes"] for v in ok),
+        "reclaimed_bytes": sum(v["reclaimed_bytes"] for v in ok),
+        "vms": vms,
+        "runs": reclaim_store.list_runs(),
+    }
@@ -0,0 +1,363 @@
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.cloudimgs.check import CLOUDIMG_DIR, download_lock, lock_is_stale
+from src.libs.jobs.jobs import list_jobs
+from src.libs.store import capacity as capacity_store
+from src.libs.store import provisioning
+from src.libs.store.db import owner_alive
+from src.libs.store.locks import process_lock
+from src.libs.virt.connection import get_connection
+from src.libs.virt.storage_pools import PROBE_FILENAME, STORAGE_POOLS
+from src.libs.virt.template_vms import TEMPLATE_DIRNAME
+
+load_dotenv()
+
+# Debris younger than this may belong to an operation that is still running
+RECONCILE_MIN_AGE_S = int(os.getenv("RECONCILE_MIN_AGE_S", "900"))
+RECONCILE_INTERVAL_S = int(os.getenv("RECONCILE_INTERVAL_S", "3600"))
+# Orphan volumes are moved aside first and only deleted after this long
+RECONCILE_QUARANTINE_DAYS = float(os.getenv("RECONCILE_QUARANTINE_DAYS", "7"))
+# "false" = report only (quarantine nothing, delete nothing)
+RECONCILE_APPLY = os.getenv("RECONCILE_APPLY", "false").lower() == "true"
+
+QUARANTINE_DIRNAME = ".quarantine"
+# Agent bookkeeping inside a pool; libvirt lists it like any other volume
+_POOL_RESERVED = {QUARANTINE_DIRNAME, TEMPLATE_DIRNAME, PROBE_FILENAME}
+TMP_DIR = Path("/tmp")
+_SEED_ISO = re.compile(r"^(?P<vm>.+)-seed\.iso$")
+_DEBUG_XML = re.compile(r"^(?P<vm>.+)_(vm|disk)\.xml$")
+
+
+@dataclass
+class ReconcileReport:
+    dry_run: bool
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    deleted: List[dict] = field(default_factory=list)
+    quarantined: List[dict] = field(default_factory=list)
+    skipped: List[dict] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "dry_run": self.dry_run,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "reclaimed_bytes": sum(d["bytes"] for d in self.deleted),
+            "quarantined_bytes": sum(d["bytes"] for d in self.quarantined),
+            "deleted": self.deleted,
+            "quarantined": self.quarantined,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+_last_report: Optional[ReconcileReport] = None
+# One pass at a time per host (periodic task vs. POST /reconcile, other workers)
+_RECONCILE_LOCK = process_lock("reconcile")
+
+
+def last_report() -> Optional[dict]:
+    return _last_report.to_dict() if _last_report else None
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Helpers                                   #
+# ---------------------------------------------------------------------------- #
+def _allocated(path: Path) -> int:
+    try:
+        return path.stat().st_blocks * 512
+    except FileNotFoundError:
+        return 0
+
+
+def _age_s(path: Path) -> float:
+    try:
+        return time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def _domain_files(conn: libvirt.virConnect) -> Dict[str, Set[str]]:
+    """
+    Every file each defined domain points at (disks, cdroms, live and
+    persistent definitions), by domain name.
+    """
+    files: Dict[str, Set[str]] = {}
+    for dom in conn.listAllDomains():
+        paths: Set[str] = set()
+        xmls = [dom.XMLDesc(0)]
+        if dom.isActive() and dom.isPersistent():
+            xmls.append(dom.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        for xml in xmls:
+            root = ET.fromstring(xml)
+            # source of every disk plus backingStore entries of running ones
+            for src in root.iter("source"):
+                p = src.get("file") or src.get("dev")
+                if p:
+                    paths.add(p)
+        files[dom.name()] = paths
+    return files
+
+
+def _busy_vms() -> Set[str]:
+    """
+    VMs with an active job or an in-progress provisioning of a live worker.
+    """
+    busy = {j.vm_id for j in list_jobs(active_only=True) if j.vm_id}
+    for record in provisioning.list_records(status="in_progress"):
+        if owner_alive(record["owner"]):
+            busy.add(record["vm_id"])
+    return busy
+
+
+def _owner_vm(name: str, domains: Set[str]) -> Optional[str]:
+    """
+    The defined domain a pool file is named after ("<vm>.qcow2", "<vm>.snap-N.qcow2").
+    """
+    for vm in domains:
+        if name.startswith(f"{vm}."):
+            return vm
+    return None
+
+
+def _known_vms() -> Set[str]:
+    """
+    VMs this agent created or accounted for. Only their files are ever
+    quarantined; anything else in a pool belongs to someone else.
+    """
+    vms = {r["vm_id"] for r in provisioning.list_records()}
+    vms.update(e["vm_id"] for e in capacity_store.list_entries())
+    return vms
+
+
+def _delete(report: ReconcileReport, path: Path, reason: str) -> None:
+    size = _allocated(path)
+    entry = {"path": str(path), "bytes": size, "reason": reason}
+    if not report.dry_run:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            report.errors.append(f"{path}: {e}")
+            return
+    report.deleted.append(entry)
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Passes                                    #
+# ---------------------------------------------------------------------------- #
+def _reconcile_pools(
+    conn: libvirt.virConnect, report: ReconcileReport, files: Dict[str, Set[str]], busy: Set[str], known: Set[str]
+) -> None:
+    referenced = set().union(*files.values()) if files else set()
+    domains = set(files)
+    managed = {p.name for p in STORAGE_POOLS}
+    cache_dir = str(CLOUDIMG_DIR)
+
+    for pool in conn.listAllStoragePools(libvirt.VIR_CONNECT_LIST_STORAGE_POOLS_ACTIVE):
+        if pool.name() not in managed:
+            continue
+        pool_xml = ET.fromstring(pool.XMLDesc(0))
+        target = pool_xml.findtext("./target/path")
+        if not target or target.rstrip("/") == cache_dir:
+            continue
+        pool_dir = Path(target)
+        try:
+            pool.refresh(0)
+            volumes = pool.listAllVolumes(0)
+        except libvirt.libvirtError as e:
+            report.errors.append(f"pool {pool.name()}: {e}")
+            continue
+
+        if pool_xml.get("type") != "dir":
+            # LVs can't be moved aside and have no usable mtime: report only
+            for vol in volumes:
+                name, path = vol.name(), vol.path()
+                if path in referenced or _owner_vm(name, domains) is not None or name.split(".", 1)[0] in busy:
+                    continue
+                if _owner_vm(name, known) is None:
+                    continue
+                report.skipped.append({"path": path, "reason": "orphan block volume, delete it by hand"})
+            continue
+
+        # scratch files of clone_cloudimg / full_clone ("[.]<vm>.qcow2.tmp")
+        for path in pool_dir.glob("*.tmp"):
+            vm = path.name.lstrip(".").split(".", 1)[0]
+            if vm not in known or not path.is_file():
+                continue
+            if vm in busy or _age_s(path) < RECONCILE_MIN_AGE_S:
+                report.skipped.append({"path": str(path), "reason": "in use or too recent"})
+                continue
+            _delete(report, path, "leftover temp file")
+
+        for vol in volumes:
+            name = vol.name()
+            path = Path(vol.path())
+            if name in _POOL_RESERVED or name.startswith("."):
+                continue
+            if name.endswith(".tmp") or path.parent != pool_dir or str(path) in referenced:
+                continue
+            if _owner_vm(name, domains) is not None:
+                # e.g. a snapshot layer of a defined VM
+                continue
+            if _owner_vm(name, known) is None:
+                # not named after a VM this agent made: someone else's file
+                continue
+            try:
+                if vol.info()[0] != libvirt.VIR_STORAGE_VOL_FILE or not path.is_file():
+                    continue
+            except libvirt.libvirtError:
+                continue
+            if name.split(".", 1)[0] in busy or _age_s(path) < RECONCILE_MIN_AGE_S:
+                # may be a create that has not defined its domain yet
+                continue
+            _quarantine(report, pool_dir, path, vol)
+
+        _purge_quarantine(report, pool_dir)
+        if not report.dry_run:
+            try:
+                pool.refresh(0)
+            except libvirt.libvirtError:
+                pass
+
+
+def _quarantine(report: ReconcileReport, pool_dir: Path, path: Path, vol: libvirt.virStorageVol) -> None:
+    """
+    Moves an orphan volume aside instead of deleting it: a VM that was
+    undefined by hand may still be wanted back.
+    """
+    try:
+        size = vol.info()[2]
+    except libvirt.libvirtError:
+        size = _allocated(path)
+    entry = {"path": str(path), "bytes": size, "reason": "no domain uses this volume"}
+    if not report.dry_run:
+        qdir = pool_dir / QUARANTINE_DIRNAME
+        qdir.mkdir(exist_ok=True)
+        dest = qdir / path.name
+        try:
+            os.replace(path, dest)
+            os.utime(dest)  # quarantine clock starts now
+        except OSError as e:
+            report.errors.append(f"{path}: {e}")
+            return
+        entry["moved_to"] = str(dest)
+    report.quarantined.append(entry)
+
+
+def _purge_quarantine(report: ReconcileReport, pool_dir: Path) -> None:
+    qdir = pool_dir / QUARANTINE_DIRNAME
+    if not qdir.is_dir():
+        return
+    max_age = RECONCILE_QUARANTINE_DAYS * 86400
+    for p in qdir.iterdir():
+        if p.is_file() and _age_s(p) > max_age:
+            _delete(report, p, f"quarantined more than {RECONCILE_QUARANTINE_DAYS:g} days")
+
+
+def _reconcile_image_cache(report: ReconcileReport) -> None:
+    if not CLOUDIMG_DIR.is_dir():
+        return
+    for lock in CLOUDIMG_DIR.glob("*.lock"):
+        if lock_is_stale(lock):
+            _delete(report, lock, "stale download lock")
+    for part in CLOUDIMG_DIR.glob("*.qcow2.part"):
+        # an older agent may still be downloading under "<os>.qcow2.lock"
+        legacy = part.with_suffix(".lock")
+        if legacy.exists() and not lock_is_stale(legacy):
+            continue
+        try:
+            lock = download_lock(Path(part.stem).stem)
+        except ValueError:
+            continue
+        # held = download in progress; free = the .part outlived its download
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            _delete(report, part, "interrupted download")
+        finally:
+            lock.release()
+
+
+def _reconcile_tmp(report: ReconcileReport, files: Dict[str, Set[str]], busy: Set[str], known: Set[str]) -> None:
+    # /tmp is shared with everything else on the host: only names of VMs this agent made
+    referenced = set().union(*files.values()) if files else set()
+    for p in TMP_DIR.glob("*-seed.iso"):
+        m = _SEED_ISO.match(p.name)
+        vm = m.group("vm") if m else None
+        if vm not in known or str(p) in referenced or vm in busy or _age_s(p) < RECONCILE_MIN_AGE_S:
+            continue
+        _delete(report, p, "seed ISO not attached to any VM")
+    for p in TMP_DIR.glob("*.xml"):
+        m = _DEBUG_XML.match(p.name)
+        if m is None or m.group("vm") not in known or m.group("vm") in busy or _age_s(p) < RECONCILE_MIN_AGE_S:
+            continue
+        _delete(report, p, "debug copy of generated XML")
+
+
+def reconcile(conn: libvirt.virConnect, dry_run: bool = not RECONCILE_APPLY) -> dict:
+    """
+    Cleans up what crashed or interrupted operations left behind:
+    temp clones and orphan volumes in the pools, stale locks and partial
+    downloads in CLOUDIMG_DIR, unattached seed ISOs and XML dumps in /tmp.
+    Anything a live job or provisioning step may still use is skipped.
+
+    :param dry_run: Only report what would be reclaimed
+    :return: Report with reclaimed_bytes / quarantined_bytes and every action
+    :raises RuntimeError: Another pass is running
+    """
+    global _last_report
+    if not _RECONCILE_LOCK.acquire(blocking=False):
+        raise RuntimeError("A reconcile pass is already running")
+    try:
+        report = ReconcileReport(dry_run=dry_run)
+        files = _domain_files(conn)
+        busy = _busy_vms()
+        known = _known_vms()
+
+        for name, fn in (
+            ("pools", lambda: _reconcile_pools(conn, report, files, busy, known)),
+            ("image cache", lambda: _reconcile_image_cache(report)),
+            ("tmp", lambda: _reconcile_tmp(report, files, busy, known)),
+        ):
+            try:
+                fn()
+            except Exception as e:
+                report.errors.append(f"{name}: {type(e).__name__}: {e}")
+
+        report.finished_at = time.time()
+        _last_report = report
+    finally:
+        _RECONCILE_LOCK.release()
+    d = report.to_dict()
+    if d["deleted"] or d["quarantined"]:
+        verb = "would reclaim" if dry_run else "reclaimed"
+        print(
+            f"Reconcile {verb} {d['reclaimed_bytes']} bytes in {len(d['deleted'])} file(s), "
+            f"quarantined {len(d['quarantined'])} volume(s) ({d['quarantined_bytes']} bytes)"
+        )
+    return d
+
+
+def run_reconcile() -> None:
+    """
+    Periodic task: one reconcile pass with its own connection.
+    """
+    conn = get_connection()
+    try:
+        reconcile(conn)
+    except RuntimeError as e:
+        print(f"Skipping reconcile: {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,224 @@
+import os
+import time
+import xml.etree.ElementTree as ET
+from contextlib import nullcontext
+from typing import Tuple
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.jobs.jobs import Job, check_cancelled, update_progress
+from src.models.create_vm import CreateVMParams
+from src.models.resources_vm import ResourcesUpdate
+from . import capacity
+from .balloon import forget_config
+from .connection import get_connection
+from .errors import InsufficientResourcesError
+from .helpers import ensure_shutoff
+from .hugepages import PAGE_SIZES_KIB, domain_hugepages, plan_hugepages
+from .placement import PLACEMENT_LOCK, read_domain_pinning, repin_domain
+from .snapshots import vm_lock
+
+load_dotenv()
+
+# Hotplug headroom reserved at create when the request doesn't set max_vcpus/max_memory
+VM_MAX_VCPUS_FACTOR = float(os.getenv("VM_MAX_VCPUS_FACTOR", "2"))
+VM_MAX_MEMORY_FACTOR = float(os.getenv("VM_MAX_MEMORY_FACTOR", "2"))
+# Graceful shutdown budget of a restart that applies config-only changes
+RESIZE_SHUTDOWN_TIMEOUT_S = int(os.getenv("RESIZE_SHUTDOWN_TIMEOUT_S", "120"))
+
+
+def plan_maximums(conn: libvirt.virConnect, vm: CreateVMParams, hugepages: bool) -> Tuple[int, int]:
+    """
+    vCPU and memory ceilings written into a new domain, so it can be
+    scaled up live later. Capped at what the host has. Hugepage-backed
+    guests get no memory headroom: QEMU backs the whole maximum with pages.
+
+    :return: (max_vcpus, max_memory_mib)
+    """
+    _model, host_memory_mib, host_cpus, *_ = conn.getInfo()
+
+    max_vcpus = vm.max_vcpus or max(vm.vcpus, min(int(vm.vcpus * VM_MAX_VCPUS_FACTOR), host_cpus))
+    if hugepages:
+        max_memory = vm.memory
+    else:
+        max_memory = vm.max_memory or max(vm.memory, min(int(vm.memory * VM_MAX_MEMORY_FACTOR), host_memory_mib))
+    return max_vcpus, max_memory
+
+
+def get_resources(domain: libvirt.virDomain) -> dict:
+    """
+    vCPUs and memory (MiB): running values, persistent config and the
+    ceilings up to which they can change live.
+    """
+    active = domain.isActive()
+    config = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+    current_kib = int(config.findtext("currentMemory") or config.findtext("memory"))
+
+    live_memory = None
+    if active:
+        # balloon size the guest has actually reached, not just the target
+        live_kib = domain.memoryStats().get("actual") or domain.info()[2]
+        live_memory = live_kib // 1024
+
+    return {
+        "vcpus": {
+            "live": domain.vcpusFlags(libvirt.VIR_DOMAIN_AFFECT_LIVE) if active else None,
+            "config": domain.vcpusFlags(libvirt.VIR_DOMAIN_AFFECT_CONFIG),
+            "max": domain.vcpusFlags(libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_VCPU_MAXIMUM),
+        },
+        "memory_mib": {
+            "live": live_memory,
+            "config": current_kib // 1024,
+            "max": int(config.findtext("memory")) // 1024,
+        },
+    }
+
+
+def _set_vcpus(domain: libvirt.virDomain, vcpus: int, active: bool) -> dict:
+    maximum = domain.vcpusFlags(libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_VCPU_MAXIMUM)
+    if vcpus > maximum:
+        domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_VCPU_MAXIMUM)
+        domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        return {"requested": vcpus, "applied": "config", "reason": f"above the hotplug maximum of {maximum}"}
+    if not active:
+        domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        return {"requested": vcpus, "applied": "config"}
+
+    try:
+        domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+    except libvirt.libvirtError as e:
+        # e.g. the guest refused to release a vCPU
+        domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        return {"requested": vcpus, "applied": "config", "reason": str(e)}
+
+    # hotplugged vCPUs start offline in guests without an auto-online udev rule
+    try:
+        domain.setVcpusFlags(vcpus, libvirt.VIR_DOMAIN_VCPU_GUEST)
+        onlined = True
+    except libvirt.libvirtError:
+        onlined = False
+    return {"requested": vcpus, "applied": "live", "guest_onlined": onlined}
+
+
+def _set_memory(domain: libvirt.virDomain, memory_mib: int, active: bool) -> dict:
+    kib = memory_mib * 1024
+    maximum = domain.maxMemory()
+    if kib > maximum:
+        domain.setMemoryFlags(kib, libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_MEM_MAXIMUM)
+        domain.setMemoryFlags(kib, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        return {
+            "requested": memory_mib,
+            "applied": "config",
+            "reason": f"above the balloon maximum of {maximum // 1024} MiB",
+        }
+    if not active:
+        domain.setMemoryFlags(kib, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        return {"requested": memory_mib, "applied": "config"}
+
+    try:
+        # balloon target; the guest gives memory back / takes it over the next seconds
+        domain.setMemoryFlags(kib, libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+    except libvirt.libvirtError as e:
+        domain.setMemoryFlags(kib, libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+        return {"requested": memory_mib, "applied": "config", "reason": str(e)}
+    return {"requested": memory_mib, "applied": "live"}
+
+
+def _beyond_maximums(domain: libvirt.virDomain, update: ResourcesUpdate) -> bool:
+    if update.vcpus is not None and update.vcpus > domain.vcpusFlags(
+        libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_VCPU_MAXIMUM
+    ):
+        return True
+    return update.memory is not None and update.memory * 1024 > domain.maxMemory()
+
+
+def _admit_growth(conn: libvirt.virConnect, domain: libvirt.virDomain, update: ResourcesUpdate) -> None:
+    """
+    Admission for a resize past the maximums set at create, which nothing
+    reserved. Only the growth over the current config is checked: the
+    ledger already counts the rest. Callers hold PLACEMENT_LOCK.
+
+    :raises InsufficientResourcesError: The host can't take the extra vCPUs, memory or hugepages
+    """
+    held = capacity.domain_commitment(domain, {})
+    extra_vcpus = max((update.vcpus or 0) - held["vcpus"], 0)
+    extra_mib = max((update.memory or 0) - held["memory_mib"], 0)
+
+    hugepages = domain_hugepages(ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE)))
+    if hugepages is not None and extra_mib:
+        page_kib, _pages, node = hugepages
+        size = next((name for name, kib in PAGE_SIZES_KIB.items() if kib == page_kib), None)
+        plan_hugepages(conn, size, extra_mib, node, fallback=False)
+
+    if capacity.CAPACITY_ADMISSION and (extra_vcpus or extra_mib):
+        problems = capacity.check_fit(extra_vcpus, extra_mib, held["hugepage_kib"], 0, None)
+        if problems:
+            raise InsufficientResourcesError("Host is out of capacity: " + "; ".join(problems))
+
+
+def resize_resources(conn: libvirt.virConnect, domain: libvirt.virDomain, update: ResourcesUpdate) -> dict:
+    """
+    Changes vCPUs and memory of a VM. Running VMs are changed live (vCPU
+    hotplug, balloon) up to the maximums set at create; anything beyond
+    that, or that the guest refuses, is written to the config only and
+    needs a restart.
+
+    :return: What was applied per resource, restart_required and the resources after
+    :raises InsufficientResourcesError: Growth past the maximums doesn't fit on the host
+    """
+    active = domain.isActive()
+    result: dict = {"vcpus": None, "memory": None}
+    beyond = _beyond_maximums(domain, update)
+    # growth past the maximums was never admitted: check it like a create would
+    with PLACEMENT_LOCK if beyond else nullcontext():
+        if beyond:
+            _admit_growth(conn, domain, update)
+        if update.vcpus is not None:
+            result["vcpus"] = _set_vcpus(domain, update.vcpus, active)
+        if update.memory is not None:
+            result["memory"] = _set_memory(domain, update.memory, active)
+            forget_config(domain.name())
+        if beyond:
+            # concurrent creates must see the growth before the lock drops
+            capacity.refresh_vm(conn, domain.name())
+
+    result["restart_required"] = active and any(
+        r is not None and r["applied"] == "config" for r in (result["vcpus"], result["memory"])
+    )
+
+    # new vCPUs of a pinned VM float until placement covers them
+    if result["vcpus"] and result["vcpus"]["applied"] == "live" and read_domain_pinning(domain).pinned:
+        result["placement"] = repin_domain(conn, domain)
+
+    result["resources"] = get_resources(domain)
+    return result
+
+
+def restart_to_apply(job: Job, vm_id: str, delay_s: int) -> dict:
+    """
+    Job: waits `delay_s`, then shuts the VM down (forced after
+    RESIZE_SHUTDOWN_TIMEOUT_S) and boots it with its new config.
+    Cancellable until the shutdown starts.
+    """
+    deadline = time.monotonic() + delay_s
+    update_progress(job, stage="waiting", restart_in_s=delay_s)
+    while time.monotonic() < deadline:
+        check_cancelled(job)
+        time.sleep(min(1.0, max(deadline - time.monotonic(), 0)))
+    check_cancelled(job)
+
+    conn = get_connection()
+    try:
+        domain = conn.lookupByName(vm_id)
+        with vm_lock(vm_id):
+            update_progress(job, stage="shutdown")
+            ensure_shutoff(domain, wait_s=RESIZE_SHUTDOWN_TIMEOUT_S)
+            update_progress(job, stage="start")
+            domain.create()
+            forget_config(vm_id)
+            if read_domain_pinning(domain).pinned:
+                repin_domain(conn, domain)
+        return {"resources": get_resources(domain)}
+    finally:
+        conn.close()
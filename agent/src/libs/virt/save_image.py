@@ -0,0 +1,110 @@
+import os
+import shutil
+import struct
+from typing import BinaryIO, Tuple
+
+# libvirt QEMU driver save image (src/qemu/qemu_saveimage.h):
+#   magic[16] version data_len was_running compressed cookieOffset unused[15]
+# followed by data_len bytes (domain XML, NUL, cookie XML, NUL, zero padding)
+# and then the QEMU migration stream. libvirt pads the data area so the XML
+# can be edited in place; we rely on the same room.
+QEMU_SAVE_MAGIC = b"LibvirtQemudSave"
+QEMU_SAVE_PARTIAL = b"LibvirtQemudPart"
+_QEMU_HEADER = struct.Struct("=16s5I15I")
+
+# test:///default driver: magic (with its NUL), int length, XML
+TEST_SAVE_MAGIC = b"TestGuestMagic\0"
+_TEST_LEN = struct.Struct("=i")
+
+
+class SaveImageError(RuntimeError):
+    pass
+
+
+def _read_qemu(f: BinaryIO) -> Tuple[tuple, str, bytes]:
+    f.seek(0)
+    fields = _QEMU_HEADER.unpack(f.read(_QEMU_HEADER.size))
+    magic, version, data_len, _running, _compressed, cookie_offset = fields[:6]
+    if magic == QEMU_SAVE_PARTIAL:
+        raise SaveImageError("Save image is incomplete (the save was interrupted)")
+    if version not in (1, 2):
+        raise SaveImageError(f"Unsupported save image version {version}")
+    data = f.read(data_len)
+    xml = data.split(b"\0", 1)[0].decode()
+    cookie = b""
+    if version == 2 and cookie_offset:
+        cookie = data[cookie_offset:].split(b"\0", 1)[0]
+    return fields, xml, cookie
+
+
+def read_save_xml(path: str) -> str:
+    """
+    The domain XML embedded in a save image (QEMU or test driver format).
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(QEMU_SAVE_MAGIC))
+        if magic in (QEMU_SAVE_MAGIC, QEMU_SAVE_PARTIAL):
+            return _read_qemu(f)[1]
+        f.seek(0)
+        if f.read(len(TEST_SAVE_MAGIC)) == TEST_SAVE_MAGIC:
+            (length,) = _TEST_LEN.unpack(f.read(_TEST_LEN.size))
+            return f.read(length).decode()
+    raise SaveImageError(f"{path} is not a libvirt save image")
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, offset: int) -> None:
+    """
+    Copies src[offset:] to dst at the same offset. copy_file_range lets the
+    filesystem share extents (XFS/btrfs reflinks) instead of copying RAM-sized data.
+    """
+    remaining = os.fstat(src.fileno()).st_size - offset
+    src_off = dst_off = offset
+    try:
+        while remaining > 0:
+            n = os.copy_file_range(src.fileno(), dst.fileno(), remaining, src_off, dst_off)
+            if n == 0:
+                break
+            remaining -= n
+            src_off += n
+            dst_off += n
+        return
+    except (AttributeError, OSError):
+        # other filesystem, old kernel: plain copy of what's left
+        pass
+    src.seek(src_off)
+    dst.seek(dst_off)
+    shutil.copyfileobj(src, dst, 8 * 1024 * 1024)
+
+
+def write_image_with_xml(src_path: str, dst_path: str, xml: str) -> None:
+    """
+    Writes a copy of a save image whose embedded domain XML is `xml`. The
+    memory stream is copied unchanged at the same offset.
+
+    :raises SaveImageError: Unknown format, or the XML doesn't fit the image's padding
+    """
+    new_xml = xml.encode()
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        magic = src.read(len(QEMU_SAVE_MAGIC))
+        if magic in (QEMU_SAVE_MAGIC, QEMU_SAVE_PARTIAL):
+            fields, _xml, cookie = _read_qemu(src)
+            version, data_len = fields[1], fields[2]
+            data = new_xml + b"\0"
+            cookie_offset = 0
+            if version == 2 and cookie:
+                cookie_offset = len(data)
+                data += cookie + b"\0"
+            if len(data) > data_len:
+                raise SaveImageError(f"Domain XML needs {len(data)} bytes, the save image has room for {data_len}")
+            header = _QEMU_HEADER.pack(*fields[:5], cookie_offset, *fields[6:])
+            dst.write(header + data + b"\0" * (data_len - len(data)))
+            dst.flush()
+            _copy_range(src, dst, _QEMU_HEADER.size + data_len)
+            return
+
+        src.seek(0)
+        if src.read(len(TEST_SAVE_MAGIC)) == TEST_SAVE_MAGIC:
+            dst.write(TEST_SAVE_MAGIC + _TEST_LEN.pack(len(new_xml)) + new_xml)
+            return
+    os.unlink(dst_path)
+    raise SaveImageError(f"{src_path} is not a libvirt save image")
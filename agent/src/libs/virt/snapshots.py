@@ -0,0 +1,470 @@
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.jobs.jobs import Job, list_jobs, submit_job, update_progress
+from src.libs.telemetry.tracing import traced
+from src.libs.store.locks import ProcessLock, process_lock
+from .connection import get_connection
+from .errors import VMBusyError
+from .format import get_vda_format, get_vda_path
+from .metadata import get_metadata, set_metadata
+from .qemu_img import backing_chain, commit, create_overlay, rebase_unsafe
+
+load_dotenv()
+
+# Max number of files in a VM's vda backing chain (base + snapshot layers + active overlay)
+SNAPSHOT_MAX_CHAIN = int(os.getenv("SNAPSHOT_MAX_CHAIN", "8"))
+# Retry of compactions a snapshot delete couldn't start (VM busy, worker restarted)
+SNAPSHOT_COMPACT_INTERVAL_S = float(os.getenv("SNAPSHOT_COMPACT_INTERVAL_S", "60"))
+# How long a request waits for a VM another operation holds before answering 409
+VM_LOCK_TIMEOUT_S = float(os.getenv("VM_LOCK_TIMEOUT_S", "10"))
+PRISTINE_SNAPSHOT = "pristine"
+
+_SAFE_NAME = re.compile(r"^[a-zA-Z0-9._-]{1,64}$")
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+@dataclass
+class SnapshotRecord:
+    name: str
+    file: str        # frozen layer holding the disk state at snapshot time
+    created_at: float
+    pristine: bool = False
+    os_name: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        size = None
+        try:
+            size = os.stat(self.file).st_blocks * 512
+        except OSError:
+            pass
+        return {
+            "name": self.name,
+            "file": self.file,
+            "created_at": self.created_at,
+            "pristine": self.pristine,
+            "os_name": self.os_name,
+            "allocated_bytes": size,
+        }
+
+
+def vm_lock(vm_id: str) -> ProcessLock:
+    """
+    Serializes chain changes (create/revert/delete/compact) per VM, across
+    all agent workers.
+    """
+    return process_lock(f"vm-{vm_id}")
+
+
+@contextmanager
+def vm_lock_within(vm_id: str, timeout_s: float = VM_LOCK_TIMEOUT_S) -> Iterator[None]:
+    """
+    vm_lock for request handlers: compactions, reclaim and hibernation hold
+    it for minutes, so give up instead of waiting them out. Blocks the
+    calling thread; run it off the event loop.
+
+    :raises VMBusyError: The lock stayed held for timeout_s
+    """
+    lock = vm_lock(vm_id)
+    if not lock.acquire(timeout=timeout_s):
+        raise VMBusyError(f"VM {vm_id} is locked by another operation (e.g. disk compaction); retry later")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Metadata                                   #
+# ---------------------------------------------------------------------------- #
+def read_snapshots(domain: libvirt.virDomain) -> List[SnapshotRecord]:
+    """
+    Snapshot records stored in the domain metadata, oldest first.
+    """
+    root = get_metadata(domain, "snapshots", inactive=True)
+    if root is None:
+        return []
+    out = []
+    for el in root.findall("snapshot"):
+        out.append(SnapshotRecord(
+            name=el.get("name"),
+            file=el.get("file"),
+            created_at=float(el.get("created", "0")),
+            pristine=el.get("pristine") == "yes",
+            os_name=el.get("os"),
+        ))
+    return out
+
+
+def write_snapshots(domain: libvirt.virDomain, records: List[SnapshotRecord]) -> None:
+    root = ET.Element("snapshots")
+    for r in records:
+        attrs = {"name": r.name, "file": r.file, "created": f"{r.created_at:.3f}"}
+        if r.pristine:
+            attrs["pristine"] = "yes"
+        if r.os_name:
+            attrs["os"] = r.os_name
+        ET.SubElement(root, "snapshot", attrs)
+    set_metadata(domain, "snapshots", root if records else None)
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Helpers                                   #
+# ---------------------------------------------------------------------------- #
+def _overlay_path(vm_id: str, top_path: str) -> str:
+    return str(Path(top_path).parent / f"{vm_id}.snap-{time.time_ns()}.qcow2")
+
+
+def _owned_by_vm(vm_id: str, path: str, base_dir: str) -> bool:
+    """
+    Only files the agent created for this VM may ever be deleted.
+    """
+    p = Path(path)
+    return str(p.parent) == base_dir and p.name.startswith(f"{vm_id}.")
+
+
+def _unlink(path: str) -> int:
+    try:
+        freed = os.stat(path).st_blocks * 512
+        os.unlink(path)
+        return freed
+    except FileNotFoundError:
+        return 0
+
+
+def set_vda_source(conn: libvirt.virConnect, domain: libvirt.virDomain, path: str) -> libvirt.virDomain:
+    """
+    Points the persistent definition's vda at another file (VM must be off).
+    """
+    root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE | libvirt.VIR_DOMAIN_XML_SECURE))
+    for disk in root.findall("./devices/disk"):
+        target = disk.find("target")
+        if disk.get("device") != "disk" or target is None or target.get("dev") != "vda":
+            continue
+        source = disk.find("source")
+        source.set("file", path)
+        backing = disk.find("backingStore")
+        if backing is not None:
+            disk.remove(backing)
+        driver = disk.find("driver")
+        if driver is not None:
+            driver.set("type", "qcow2")
+    return conn.defineXML(ET.tostring(root, encoding="unicode"))
+
+
+def chain_info(domain: libvirt.virDomain) -> dict:
+    """
+    The vda chain (top first) and which snapshot, if any, holds each layer.
+    """
+    top = get_vda_path(domain)
+    chain = backing_chain(top)
+    by_file = {r.file: r.name for r in read_snapshots(domain)}
+    return {
+        "length": len(chain),
+        "max_length": SNAPSHOT_MAX_CHAIN,
+        "layers": [
+            {"file": f, "active": i == 0, "snapshot": by_file.get(f)}
+            for i, f in enumerate(chain)
+        ],
+    }
+
+
+def _unreferenced_layers(vm_id: str, chain: List[str], records: List[SnapshotRecord]) -> List[str]:
+    """
+    Non-active layers of this VM no snapshot points at anymore: they can be
+    merged away. Shared backing files (a template's disk) never are.
+    """
+    referenced = {r.file for r in records}
+    base_dir = str(Path(chain[0]).parent)
+    return [f for f in chain[1:] if f not in referenced and _owned_by_vm(vm_id, f, base_dir)]
+
+
+def compaction_pending(domain: libvirt.virDomain) -> bool:
+    """
+    Whether a snapshot delete left layers that no compaction has merged yet.
+    """
+    return get_metadata(domain, "compaction", inactive=True) is not None
+
+
+def _set_compaction_pending(domain: libvirt.virDomain, pending: bool) -> None:
+    set_metadata(domain, "compaction", ET.Element("compaction", pending="yes") if pending else None)
+
+
+def _disk_targets(domain: libvirt.virDomain) -> List[str]:
+    root = ET.fromstring(domain.XMLDesc(0))
+    out = []
+    for disk in root.findall("./devices/disk"):
+        target = disk.find("target")
+        if target is not None and target.get("dev"):
+            out.append(target.get("dev"))
+    return out
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Operations                                  #
+# ---------------------------------------------------------------------------- #
+def ensure_not_hibernated(domain: libvirt.virDomain, action: str) -> None:
+    """
+    A hibernated VM's saved RAM expects vda's chain exactly as it was saved;
+    restoring it on top of a changed chain corrupts the guest.
+
+    :raises SnapshotError: The VM has a managed save image
+    """
+    if domain.hasManagedSaveImage(0):
+        raise SnapshotError(f"VM is hibernated; resume it or discard its saved state before {action}")
+
+
+@traced("snapshot.create_snapshot")
+def create_snapshot(
+    domain: libvirt.virDomain,
+    name: str,
+    pristine: bool = False,
+    os_name: Optional[str] = None,
+) -> SnapshotRecord:
+    """
+    Takes an external disk-only snapshot: the current top of vda is frozen and
+    a new empty overlay becomes the active layer. O(1) whether the VM runs or not.
+
+    :raises SnapshotError: invalid/duplicate name, raw disk, hibernated or the chain is full
+    """
+    ensure_not_hibernated(domain, "taking a snapshot")
+    if get_vda_format(domain) != "qcow2":
+        raise SnapshotError("Snapshots need a qcow2 disk (this VM has a raw disk)")
+    if not _SAFE_NAME.match(name):
+        raise SnapshotError("Invalid snapshot name (letters, numbers, dot, underscore, dash)")
+
+    records = read_snapshots(domain)
+    if any(r.name == name for r in records):
+        raise SnapshotError(f"Snapshot '{name}' already exists")
+
+    top = get_vda_path(domain)
+    chain = backing_chain(top)
+    if len(chain) >= SNAPSHOT_MAX_CHAIN:
+        pending = _unreferenced_layers(domain.name(), chain, records)
+        hint = "compaction is pending, retry shortly" if pending else "delete a snapshot first"
+        raise SnapshotError(f"Snapshot chain is full ({len(chain)}/{SNAPSHOT_MAX_CHAIN}); {hint}")
+
+    overlay = _overlay_path(domain.name(), top)
+    disks = "".join(
+        f"<disk name='{dev}' snapshot='no'/>" for dev in _disk_targets(domain) if dev != "vda"
+    )
+    snap_xml = (
+        f"<domainsnapshot><name>{name}</name><disks>"
+        f"<disk name='vda' snapshot='external'><driver type='qcow2'/><source file='{overlay}'/></disk>"
+        f"{disks}</disks></domainsnapshot>"
+    )
+    flags = (
+        libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY
+        | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA
+        | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+    )
+    if domain.isActive():
+        try:
+            # consistent filesystems if the guest agent is there
+            domain.snapshotCreateXML(snap_xml, flags | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_QUIESCE)
+        except libvirt.libvirtError:
+            domain.snapshotCreateXML(snap_xml, flags)
+    else:
+        domain.snapshotCreateXML(snap_xml, flags)
+
+    record = SnapshotRecord(name=name, file=top, created_at=time.time(), pristine=pristine, os_name=os_name)
+    write_snapshots(domain, records + [record])
+    return record
+
+
+@traced("snapshot.revert_snapshot")
+def revert_snapshot(conn: libvirt.virConnect, domain: libvirt.virDomain, name: str) -> dict:
+    """
+    Reverts vda to a snapshot: a fresh overlay is created on the snapshot's
+    frozen layer and everything above it (newer snapshots and the old active
+    overlay) is discarded. No data is copied. The VM must be off.
+
+    :return: New active overlay and bytes freed
+    :rtype: dict
+    """
+    if domain.isActive():
+        raise SnapshotError("VM must be shut off to revert")
+    ensure_not_hibernated(domain, "reverting")
+
+    records = read_snapshots(domain)
+    idx = next((i for i, r in enumerate(records) if r.name == name), None)
+    if idx is None:
+        raise SnapshotError(f"Snapshot '{name}' not found")
+    target = records[idx]
+
+    top = get_vda_path(domain)
+    base_dir = str(Path(top).parent)
+    chain = backing_chain(top)
+    if target.file not in chain:
+        raise SnapshotError(f"Snapshot '{name}' is not part of the current disk chain")
+
+    overlay = _overlay_path(domain.name(), top)
+    create_overlay(target.file, overlay)
+    domain = set_vda_source(conn, domain, overlay)
+    write_snapshots(domain, records[:idx + 1])
+
+    freed = 0
+    for f in chain[:chain.index(target.file)]:
+        if _owned_by_vm(domain.name(), f, base_dir):
+            freed += _unlink(f)
+    return {"snapshot": name, "active": overlay, "freed_bytes": freed}
+
+
+@traced("snapshot.discard_chain")
+def discard_chain(conn: libvirt.virConnect, domain: libvirt.virDomain) -> str:
+    """
+    Drops every snapshot and overlay, pointing vda back at the bottom layer
+    (the pool volume). Used before a full re-clone. Returns that path.
+    """
+    top = get_vda_path(domain)
+    chain = backing_chain(top)
+    base = chain[-1]
+    if len(chain) > 1:
+        domain = set_vda_source(conn, domain, base)
+        base_dir = str(Path(top).parent)
+        for f in chain[:-1]:
+            if _owned_by_vm(domain.name(), f, base_dir):
+                _unlink(f)
+    if read_snapshots(domain):
+        write_snapshots(domain, [])
+    return base
+
+
+def delete_snapshot(domain: libvirt.virDomain, name: str) -> bool:
+    """
+    Forgets a snapshot. Its layer stays in the chain until compact_chain()
+    merges it, so this returns immediately. The VM is marked so the
+    periodic task compacts it if no job gets to it first.
+
+    :return: True if the chain now has layers to compact
+    :rtype: bool
+    """
+    records = read_snapshots(domain)
+    if not any(r.name == name for r in records):
+        raise SnapshotError(f"Snapshot '{name}' not found")
+    records = [r for r in records if r.name != name]
+    write_snapshots(domain, records)
+    pending = bool(_unreferenced_layers(domain.name(), backing_chain(get_vda_path(domain)), records))
+    if pending:
+        _set_compaction_pending(domain, True)
+    return pending
+
+
+def _wait_block_job(domain: libvirt.virDomain, job: Optional[Job], active_commit: bool) -> None:
+    """
+    Waits for the vda block job. Active commits are pivoted once they reach
+    the ready state.
+    """
+    while True:
+        info = domain.blockJobInfo("vda", 0)
+        if not info:
+            return
+        if job is not None:
+            update_progress(job, block_job_cur=info.get("cur"), block_job_end=info.get("end"))
+        if active_commit and info.get("end") and info.get("cur") == info.get("end"):
+            domain.blockJobAbort("vda", libvirt.VIR_DOMAIN_BLOCK_JOB_ABORT_PIVOT)
+            # the pivot completes asynchronously
+            while domain.blockJobInfo("vda", 0):
+                time.sleep(0.2)
+            return
+        time.sleep(0.5)
+
+
+@traced("snapshot.compact_chain")
+def compact_chain(vm_id: str, job: Optional[Job] = None) -> dict:
+    """
+    Merges layers no snapshot references anymore. For an unreferenced layer
+    L with child X, X is block-committed down into L (L is free to change),
+    and whatever referenced X now references L. Works live (blockCommit,
+    with a pivot when X is the active layer) or offline (qemu-img).
+
+    :return: Layers merged and bytes freed
+    :rtype: dict
+    :raises SnapshotError: The VM is hibernated (the pending marker stays)
+    """
+    conn = get_connection()
+    merged = 0
+    freed = 0
+    try:
+        with vm_lock(vm_id):
+            domain = conn.lookupByName(vm_id)
+            ensure_not_hibernated(domain, "compacting its snapshots")
+            while True:
+                records = read_snapshots(domain)
+                top = get_vda_path(domain)
+                chain = backing_chain(top)
+                pending = _unreferenced_layers(vm_id, chain, records)
+                if not pending:
+                    if compaction_pending(domain):
+                        _set_compaction_pending(domain, False)
+                    break
+
+                # oldest first keeps the child lookups simple
+                layer = pending[-1]
+                child_idx = chain.index(layer) - 1
+                child = chain[child_idx]
+                base_dir = str(Path(top).parent)
+                if job is not None:
+                    update_progress(job, merging=child, into=layer, chain_length=len(chain))
+
+                if domain.isActive():
+                    if child_idx == 0:
+                        # libvirt updates the live and persistent definitions on pivot
+                        domain.blockCommit("vda", layer, None, 0, libvirt.VIR_DOMAIN_BLOCK_COMMIT_ACTIVE)
+                        _wait_block_job(domain, job, active_commit=True)
+                    else:
+                        domain.blockCommit("vda", layer, child, 0, 0)
+                        _wait_block_job(domain, job, active_commit=False)
+                else:
+                    commit(child)
+                    if child_idx == 0:
+                        domain = set_vda_source(conn, domain, layer)
+                    else:
+                        rebase_unsafe(chain[child_idx - 1], layer)
+
+                # the snapshot that pointed at the merged child now points at its content's new home
+                for r in records:
+                    if r.file == child:
+                        r.file = layer
+                write_snapshots(domain, records)
+
+                if _owned_by_vm(vm_id, child, base_dir):
+                    freed += _unlink(child)
+                merged += 1
+
+        return {"vm_id": vm_id, "merged_layers": merged, "freed_bytes": freed}
+    finally:
+        conn.close()
+
+
+def compact_pending_chains() -> List[str]:
+    """
+    Periodic task: queues a compaction job for every VM a snapshot delete
+    marked, once it has no active job and is not hibernated.
+
+    :return: VMs a job was queued for
+    """
+    busy = {j.vm_id for j in list_jobs(active_only=True) if j.vm_id}
+    conn = get_connection()
+    try:
+        pending = [
+            d.name() for d in conn.listAllDomains()
+            if d.name() not in busy and not d.hasManagedSaveImage(0) and compaction_pending(d)
+        ]
+    finally:
+        conn.close()
+    for vm_id in pending:
+        submit_job("snapshot-compact", lambda job, vm_id=vm_id: compact_chain(vm_id, job), vm_id=vm_id)
+    return pending
@@ -0,0 +1,419 @@
+import mmap
+import os
+import statistics
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.store import storage_pools as pool_store
+from . import capacity
+from .connection import get_connection
+from .errors import InsufficientResourcesError
+from .get_pool_dir import get_pool_dir
+
+load_dotenv()
+
+# Pools the agent manages, separated by commas: "name:tier:path" for a directory
+# pool, "name:tier:logical:vg" or "name:tier:logical:vg/thinpool" for an existing
+# LVM volume group (raw disks only), e.g.
+# "thin:fast:logical:vg0/vms,ssd:standard:/var/lib/libvirt/images,hdd:bulk:/srv/hdd/vms".
+# A pool that already exists in libvirt keeps its own path.
+STORAGE_POOLS_SPEC = os.getenv("STORAGE_POOLS", "default:standard:/var/lib/libvirt/images")
+# Tier for creates that don't ask for one; empty = any pool
+STORAGE_DEFAULT_TIER = os.getenv("STORAGE_DEFAULT_TIER", "")
+# Pools whose latency is within this much of the fastest candidate count as equally
+# fast; among those the one with the most free capacity (by fraction) wins
+STORAGE_LATENCY_TOLERANCE_PCT = float(os.getenv("STORAGE_LATENCY_TOLERANCE_PCT", "25"))
+STORAGE_PROBE_INTERVAL_S = float(os.getenv("STORAGE_PROBE_INTERVAL_S", "300"))
+STORAGE_PROBE_SAMPLES = int(os.getenv("STORAGE_PROBE_SAMPLES", "16"))
+
+GIB = 1024 ** 3
+BLOCK = 4096
+# Scratch file in each directory pool; libvirt lists it as a volume, the
+# reconciler skips it by this name
+PROBE_FILENAME = ".latency-probe"
+PROBE_FILE_BYTES = 16 * 1024 ** 2
+
+_POOL_TEMPLATE = Path(__file__).resolve().parent / "templates" / "storage_pool_template.xml"
+_LOGICAL_POOL_TEMPLATE = Path(__file__).resolve().parent / "templates" / "storage_pool_logical_template.xml"
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    name: str
+    tier: str
+    path: str
+    type: str = "dir"  # dir | logical
+    volume_group: Optional[str] = None
+    thin_pool: Optional[str] = None  # LVM thin pool in volume_group; None = thick LVs
+
+    @property
+    def block(self) -> bool:
+        # volumes are block devices: raw only, no qcow2 chains
+        return self.type == "logical"
+
+    def supports(self, disk_format: str) -> bool:
+        return disk_format == "raw" or not self.block
+
+
+def _parse(spec: str) -> List[PoolConfig]:
+    pools = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        parts = [p.strip() for p in item.split(":", 2)]
+        if len(parts) != 3 or not all(parts):
+            raise ValueError(f"STORAGE_POOLS entry '{item}' is not name:tier:path or name:tier:logical:vg[/thinpool]")
+        name, tier, rest = parts
+        if rest.startswith("logical:"):
+            vg, _, thin = rest[len("logical:"):].partition("/")
+            if not vg:
+                raise ValueError(f"STORAGE_POOLS entry '{item}' has no volume group")
+            pools.append(PoolConfig(name, tier, f"/dev/{vg}", "logical", vg, thin or None))
+        else:
+            pools.append(PoolConfig(name, tier, rest))
+    if not pools:
+        raise ValueError("STORAGE_POOLS is empty")
+    if len({p.name for p in pools}) != len(pools):
+        raise ValueError("STORAGE_POOLS has duplicate pool names")
+    return pools
+
+
+STORAGE_POOLS = _parse(STORAGE_POOLS_SPEC)
+
+
+def pool_config(name: str) -> Optional[PoolConfig]:
+    return next((p for p in STORAGE_POOLS if p.name == name), None)
+
+
+def tiers() -> List[str]:
+    return sorted({p.tier for p in STORAGE_POOLS})
+
+
+def default_pool() -> PoolConfig:
+    """
+    First directory pool of STORAGE_DEFAULT_TIER (or the first directory
+    pool); where templates and other agent-owned images go.
+
+    :raises ValueError: Only block pools are configured
+    """
+    dirs = [p for p in STORAGE_POOLS if not p.block]
+    if not dirs:
+        raise ValueError("STORAGE_POOLS has no directory pool for templates")
+    for p in dirs:
+        if not STORAGE_DEFAULT_TIER or p.tier == STORAGE_DEFAULT_TIER:
+            return p
+    return dirs[0]
+
+
+def candidate_pools(tier: Optional[str], pool: Optional[str] = None, disk_format: str = "qcow2") -> List[PoolConfig]:
+    """
+    Configured pools a disk of this tier (or this named pool) and format may go to.
+
+    :raises ValueError: Unknown tier or pool, the pool isn't in the tier,
+        or no pool of the tier can hold the format
+    """
+    if pool is not None:
+        cfg = pool_config(pool)
+        if cfg is None:
+            raise ValueError(f"Storage pool '{pool}' is not configured")
+        if tier is not None and cfg.tier != tier:
+            raise ValueError(f"Storage pool '{pool}' is in tier '{cfg.tier}', not '{tier}'")
+        if not cfg.supports(disk_format):
+            raise ValueError(f"Storage pool '{pool}' holds block volumes; use disk_format 'raw'")
+        return [cfg]
+    candidates = [p for p in STORAGE_POOLS if tier is None or p.tier == tier]
+    if not candidates:
+        raise ValueError(f"Unknown storage tier '{tier}' (configured: {', '.join(tiers())})")
+    candidates = [p for p in candidates if p.supports(disk_format)]
+    if not candidates:
+        raise ValueError(f"Tier '{tier}' only has block pools; use disk_format 'raw'")
+    return candidates
+
+
+def ensure_pool(conn: libvirt.virConnect, cfg: PoolConfig) -> libvirt.virStoragePool:
+    """
+    Looks up a configured pool, defining, building and starting it first
+    if needed.
+    """
+    try:
+        pool = conn.storagePoolLookupByName(cfg.name)
+        if not pool.isActive():
+            pool.create(0)
+        return pool
+    except libvirt.libvirtError:
+        pass
+    print(f"Defining storage pool {cfg.name} ({cfg.tier}) at {cfg.path}")
+    if cfg.type == "logical":
+        # the volume group must exist already; building would format its disks
+        pool = conn.storagePoolDefineXML(
+            _LOGICAL_POOL_TEMPLATE.read_text().format(name=cfg.name, vg=cfg.volume_group, path=cfg.path), 0
+        )
+    else:
+        pool = conn.storagePoolDefineXML(_POOL_TEMPLATE.read_text().format(name=cfg.name, path=cfg.path), 0)
+        pool.build(0)
+    pool.create(0)
+    pool.setAutostart(True)
+    return pool
+
+
+# ---------------------------------------------------------------------------- #
+#                                   Placement                                  #
+# ---------------------------------------------------------------------------- #
+def select_pool(
+    conn: libvirt.virConnect,
+    disk_gb: int,
+    tier: Optional[str] = None,
+    pool: Optional[str] = None,
+    exclude: Optional[str] = None,
+    disk_format: str = "qcow2",
+) -> str:
+    """
+    Picks the pool for a new disk: a configured pool of the tier (or the
+    named one) with room for disk_gb under DISK_OVERCOMMIT_RATIO, fastest
+    by measured latency, then most free. Unprobed pools rank after probed
+    ones. Callers hold PLACEMENT_LOCK and reserve the disk with
+    capacity.admit afterwards.
+
+    :param exclude: VM whose own ledger row is not counted (re-creates)
+    :param disk_format: qcow2 disks only go to directory pools
+    :raises ValueError: Unknown tier or pool, or none can hold the format
+    :raises InsufficientResourcesError: No candidate pool has room
+    """
+    if pool is None:
+        tier = tier or STORAGE_DEFAULT_TIER or None
+    candidates = candidate_pools(tier, pool, disk_format)
+    for cfg in candidates:
+        ensure_pool(conn, cfg)
+    usage = capacity.pool_usage(conn, exclude=exclude)
+    measured = pool_store.list_pools()
+
+    fitting, problems = [], []
+    for cfg in candidates:
+        u = usage.get(cfg.name)
+        if u is None:
+            problems.append(f"{cfg.name}: not active")
+        elif capacity.CAPACITY_ADMISSION and disk_gb * GIB > u["free_bytes"]:
+            problems.append(f"{cfg.name}: {max(u['free_bytes'], 0) // GIB} GiB left")
+        else:
+            fitting.append((cfg, u, (measured.get(cfg.name) or {}).get("latency_ms")))
+    if not fitting:
+        where = f"tier '{tier}'" if tier else "any pool"
+        raise InsufficientResourcesError(f"No room for {disk_gb} GiB in {where}: " + "; ".join(problems))
+
+    latencies = [lat for _, _, lat in fitting if lat is not None]
+    fastest = min(latencies) if latencies else None
+
+    def rank(item):
+        cfg, u, lat = item
+        if lat is None:
+            band = 2
+        else:
+            band = 0 if lat <= fastest * (1 + STORAGE_LATENCY_TOLERANCE_PCT / 100) else 1
+        free_fraction = u["free_bytes"] / u["allocatable_bytes"] if u["allocatable_bytes"] else 0
+        return band, lat if band == 1 else 0, -free_fraction, cfg.name
+
+    return min(fitting, key=rank)[0].name
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Latency probe                                #
+# ---------------------------------------------------------------------------- #
+def _probe_dir(path: str, samples: int) -> dict:
+    """
+    4 KiB synchronous writes (O_DSYNC) and, where the filesystem allows
+    it, uncached reads (O_DIRECT) at random offsets of a probe file.
+
+    :return: {"read_ms": median or None, "write_ms": median}
+    """
+    probe = Path(path) / PROBE_FILENAME
+    if not probe.exists() or probe.stat().st_size < PROBE_FILE_BYTES:
+        # real data: reads of holes never reach the device
+        with open(probe, "wb") as f:
+            for _ in range(PROBE_FILE_BYTES // (1024 ** 2)):
+                f.write(os.urandom(1024 ** 2))
+            f.flush()
+            os.fsync(f.fileno())
+
+    buf = mmap.mmap(-1, BLOCK)  # page-aligned, as O_DIRECT wants
+    buf.write(os.urandom(BLOCK))
+    blocks = PROBE_FILE_BYTES // BLOCK
+    writes, reads = [], []
+
+    fd = os.open(probe, os.O_WRONLY | os.O_DSYNC)
+    try:
+        for _ in range(samples):
+            offset = int.from_bytes(os.urandom(4), "little") % blocks * BLOCK
+            t0 = time.perf_counter()
+            os.pwrite(fd, buf, offset)
+            writes.append((time.perf_counter() - t0) * 1000)
+    finally:
+        os.close(fd)
+
+    try:
+        fd = os.open(probe, os.O_RDONLY | getattr(os, "O_DIRECT", 0))
+    except OSError:
+        # tmpfs and some FUSE filesystems refuse O_DIRECT; cached reads say nothing
+        fd = None
+    if fd is not None and hasattr(os, "O_DIRECT"):
+        try:
+            for _ in range(samples):
+                offset = int.from_bytes(os.urandom(4), "little") % blocks * BLOCK
+                t0 = time.perf_counter()
+                os.preadv(fd, [buf], offset)
+                reads.append((time.perf_counter() - t0) * 1000)
+        except OSError:
+            reads = []
+        finally:
+            os.close(fd)
+    elif fd is not None:
+        os.close(fd)
+    buf.close()
+
+    return {
+        "read_ms": round(statistics.median(reads), 3) if reads else None,
+        "write_ms": round(statistics.median(writes), 3),
+    }
+
+
+def _probe_block(pool: libvirt.virStoragePool, samples: int) -> dict:
+    """
+    Uncached 4 KiB reads of an existing volume of a block pool. Writes
+    would need a scratch volume, so block pools are ranked by reads only.
+
+    :raises RuntimeError: The pool has no volume yet
+    """
+    volumes = pool.listAllVolumes(0)
+    if not volumes:
+        raise RuntimeError("no volume to read from yet")
+    vol = volumes[0]
+    blocks = vol.info()[1] // BLOCK
+    buf = mmap.mmap(-1, BLOCK)
+    reads = []
+    fd = os.open(vol.path(), os.O_RDONLY | getattr(os, "O_DIRECT", 0))
+    try:
+        for _ in range(samples):
+            offset = int.from_bytes(os.urandom(4), "little") % max(blocks, 1) * BLOCK
+            t0 = time.perf_counter()
+            os.preadv(fd, [buf], offset)
+            reads.append((time.perf_counter() - t0) * 1000)
+    finally:
+        os.close(fd)
+        buf.close()
+    return {"read_ms": round(statistics.median(reads), 3), "write_ms": None}
+
+
+def probe_pools() -> Dict[str, dict]:
+    """
+    Latency probe of every configured pool (background task). Results go to
+    the state store, where select_pool reads them in every worker.
+    """
+    results = {}
+    conn = get_connection()
+    try:
+        for cfg in STORAGE_POOLS:
+            try:
+                pool = conn.storagePoolLookupByName(cfg.name)
+                if not pool.isActive():
+                    continue
+                if cfg.block:
+                    results[cfg.name] = _probe_block(pool, STORAGE_PROBE_SAMPLES)
+                else:
+                    results[cfg.name] = _probe_dir(get_pool_dir(pool), STORAGE_PROBE_SAMPLES)
+                pool_store.record_probe(cfg.name, cfg.tier, results[cfg.name]["read_ms"], results[cfg.name]["write_ms"])
+            except (libvirt.libvirtError, OSError, RuntimeError) as e:
+                pool_store.record_error(cfg.name, cfg.tier, f"{type(e).__name__}: {e}")
+    finally:
+        conn.close()
+    return results
+
+
+# ---------------------------------------------------------------------------- #
+#                                    Report                                    #
+# ---------------------------------------------------------------------------- #
+def _volume_owners(conn: libvirt.virConnect) -> Dict[str, str]:
+    """
+    Disk path -> name of the domain using it (persistent definitions).
+    """
+    owners = {}
+    for domain in conn.listAllDomains():
+        root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        for src in root.findall("./devices/disk/source"):
+            path = src.get("file") or src.get("dev")
+            if path:
+                owners[path] = domain.name()
+    return owners
+
+
+def pool_stats(conn: libvirt.virConnect) -> List[dict]:
+    """
+    Every configured pool: tier, libvirt state and sizes, committed disk
+    from the capacity ledger, and measured latency.
+    """
+    usage = capacity.pool_usage(conn)
+    measured = pool_store.list_pools()
+    out = []
+    for cfg in STORAGE_POOLS:
+        entry = {
+            "name": cfg.name,
+            "tier": cfg.tier,
+            "type": cfg.type,
+            "thin_pool": cfg.thin_pool,
+            "path": cfg.path,
+            "defined": False,
+            "active": False,
+        }
+        try:
+            pool = conn.storagePoolLookupByName(cfg.name)
+            entry["defined"] = True
+            entry["active"] = bool(pool.isActive())
+            if entry["active"]:
+                _, size, allocation, available = pool.info()
+                entry.update({
+                    "path": get_pool_dir(pool),
+                    "capacity_bytes": size,
+                    "allocation_bytes": allocation,
+                    "available_bytes": available,
+                    "volumes": pool.numOfVolumes(),
+                })
+        except libvirt.libvirtError:
+            pass
+        u = usage.get(cfg.name)
+        if u is not None:
+            entry.update({
+                "allocatable_bytes": u["allocatable_bytes"],
+                "committed_bytes": u["committed_bytes"],
+                "free_bytes": u["free_bytes"],
+            })
+        m = measured.get(cfg.name) or {}
+        entry["latency"] = {k: m.get(k) for k in ("latency_ms", "read_ms", "write_ms", "samples", "probed_at", "error")}
+        out.append(entry)
+    return out
+
+
+def pool_volumes(conn: libvirt.virConnect, name: str) -> List[dict]:
+    """
+    :raises ValueError: The pool isn't configured
+    :raises libvirt.libvirtError: It isn't defined or active in libvirt
+    """
+    if pool_config(name) is None:
+        raise ValueError(f"Storage pool '{name}' is not configured")
+    pool = conn.storagePoolLookupByName(name)
+    pool.refresh(0)
+    owners = _volume_owners(conn)
+    volumes = []
+    for vol in pool.listAllVolumes(0):
+        _, size, allocation = vol.info()
+        volumes.append({
+            "name": vol.name(),
+            "path": vol.path(),
+            "capacity_bytes": size,
+            "allocation_bytes": allocation,
+            "vm": owners.get(vol.path()),
+        })
+    return sorted(volumes, key=lambda v: v["name"])
@@ -0,0 +1,553 @@
+import math
+import os
+import shutil
+import socket
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Optional
+
+import libvirt
+from dotenv import load_dotenv
+
+from src.libs.cloudimgs.check import ensure_cloudimg
+from src.libs.jobs.jobs import Job, check_cancelled, update_progress
+from src.libs.store import provisioning
+from src.libs.store import vm_templates as template_store
+from src.libs.telemetry.tracing import span
+from src.models.create_vm import CreateVMParams, NetworkSpec
+from src.models.resources_vm import ResourcesUpdate
+from src.models.template_vm import TemplateBuildRequest, TemplateCloneRequest
+from . import capacity
+from .cloud_init import MetaTemplate, gen_dns_defaults, generate_cloud_init_iso, generate_meta_data, load_template, sha512_crypt
+from .connection import get_connection
+from .create import __mbps_to_kibps__
+from .format import attach_seed_iso, detach_seed_iso, get_vda_path
+from .get_pool_dir import get_pool_dir
+from .guest_agent import GuestAgentError, agent_command, grow_root_filesystem, guest_exec, render_guest_agent_channel
+from .guest_facts import agent_channel_state
+from .iotune import render_iotune
+from .placement import PLACEMENT_LOCK
+from .qemu_img import backing_chain, create_overlay, resize
+from .resources import plan_maximums, resize_resources
+from .save_image import read_save_xml, write_image_with_xml
+from .storage_pools import default_pool, ensure_pool, select_pool
+from .volumes import render_disk_params
+
+load_dotenv()
+
+# First boot (cloud-init installing the guest agent) and second boot of a template build
+TEMPLATE_BUILD_TIMEOUT_S = int(os.getenv("TEMPLATE_BUILD_TIMEOUT_S", "900"))
+# How long a restored clone's guest agent gets to answer
+TEMPLATE_AGENT_WAIT_S = float(os.getenv("TEMPLATE_AGENT_WAIT_S", "30"))
+# false = a clone whose guest can't be re-identified is kept (same SSH host keys
+# and machine-id as the template); only for test setups
+TEMPLATE_REQUIRE_REIDENTIFY = os.getenv("TEMPLATE_REQUIRE_REIDENTIFY", "true").lower() == "true"
+# Wait for the clone's port 22 to measure time-to-SSH; 0 = don't wait
+TEMPLATE_SSH_WAIT_S = float(os.getenv("TEMPLATE_SSH_WAIT_S", "10"))
+
+# Template disks and save images live in <pool>/.templates/<os_name>/. libvirt
+# lists the directory as a "dir" volume; the reconciler skips it by this name
+TEMPLATE_DIRNAME = ".templates"
+TEMPLATE_PREFIX = "tmpl-"
+GIB = 1024 ** 3
+
+_TEMPLATE_XML = Path(__file__).resolve().parent / "templates" / "vm_template.xml"
+
+# Run in the template right before it is saved: settle, then shrink the memory image
+_PREPARE = r"""
+timeout 120 systemctl is-system-running --wait >/dev/null 2>&1 || true
+sync
+echo 3 > /proc/sys/vm/drop_caches
+"""
+
+# Run in every clone: $1 hostname, $2 user, $3 ssh key, $4 password hash,
+# $5 mac, $6 address/prefix, $7 gateway, $8 dns servers
+_REIDENTIFY = r"""
+set -e
+host="$1"; user="$2"; key="$3"; pwhash="$4"; mac="$5"; addr="$6"; gw="$7"; dns="$8"
+
+hostnamectl set-hostname "$host" 2>/dev/null || { echo "$host" > /etc/hostname; hostname "$host"; }
+sed -i "s/^127\.0\.1\.1.*/127.0.1.1 $host/" /etc/hosts || true
+
+rm -f /etc/machine-id /var/lib/dbus/machine-id
+systemd-machine-id-setup >/dev/null 2>&1 || dbus-uuidgen --ensure=/etc/machine-id
+rm -f /etc/ssh/ssh_host_*
+ssh-keygen -A >/dev/null
+
+id "$user" >/dev/null 2>&1 || useradd -m -s /bin/bash "$user"
+echo "$user ALL=(ALL) NOPASSWD:ALL" > "/etc/sudoers.d/90-$user"
+chmod 440 "/etc/sudoers.d/90-$user"
+home=$(getent passwd "$user" | cut -d: -f6)
+if [ -n "$key" ]; then
+    install -d -m 700 -o "$user" -g "$user" "$home/.ssh"
+    printf '%s\n' "$key" > "$home/.ssh/authorized_keys"
+    chown "$user:$user" "$home/.ssh/authorized_keys"
+    chmod 600 "$home/.ssh/authorized_keys"
+fi
+if [ -n "$pwhash" ]; then
+    usermod -p "$pwhash" "$user"
+    sed -i 's/^PasswordAuthentication .*/PasswordAuthentication yes/' /etc/ssh/sshd_config.d/99-platform.conf || true
+fi
+
+cat > /etc/netplan/01-netcfg.yaml <<EOF
+network:
+  version: 2
+  renderer: networkd
+  ethernets:
+    nic0:
+      match:
+        macaddress: "$mac"
+      set-name: eth0
+      dhcp4: false
+      addresses: [$addr]
+      routes:
+        - to: default
+          via: $gw
+      nameservers:
+        addresses: [$dns]
+EOF
+chmod 600 /etc/netplan/01-netcfg.yaml
+netplan apply
+systemctl restart ssh || systemctl restart sshd || true
+"""
+
+
+def templates_dir(conn: libvirt.virConnect) -> Path:
+    return Path(get_pool_dir(ensure_pool(conn, default_pool()))) / TEMPLATE_DIRNAME
+
+
+# ---------------------------------------------------------------------------- #
+#                                     Build                                    #
+# ---------------------------------------------------------------------------- #
+def _render_template_xml(conn: libvirt.virConnect, name: str, disk_path: str, req: TemplateBuildRequest) -> str:
+    vm = CreateVMParams(
+        vcpus=req.vcpus,
+        memory=req.memory,
+        max_vcpus=req.max_vcpus,
+        max_memory=req.max_memory,
+        disk_size=req.disk_size,
+        mac=req.network.mac_address,
+        network=NetworkSpec(
+            in_avg_mbps=1000, in_peak_mbps=1000, in_burst_mbps=1000,
+            out_avg_mbps=1000, out_peak_mbps=1000, out_burst_mbps=1000,
+        ),
+        numa_pinning=False,
+    )
+    max_vcpus, max_memory_mib = plan_maximums(conn, vm, hugepages=False)
+    bw = __mbps_to_kibps__(1000)
+    xml = _TEMPLATE_XML.read_text().format(
+        domain_type=os.getenv("VM_DOMAIN_TYPE", "kvm"),
+        name=name,
+        vcpus=vm.vcpus,
+        max_vcpus=max_vcpus,
+        memory_mib=vm.memory,
+        max_memory_mib=max_memory_mib,
+        disk_iotune=render_iotune(None),
+        mac=vm.mac,
+        cputune="",
+        numatune="",
+        memory_backing="",
+        guest_agent_channel=render_guest_agent_channel(True),
+        **render_disk_params(disk_path, "qcow2", block=False),
+        net_in_kbps=bw, net_in_peak_kbps=bw, net_in_burst_kb=bw,
+        net_out_kbps=bw, net_out_peak_kbps=bw, net_out_burst_kb=bw,
+    )
+    root = ET.fromstring(xml)
+    # VM generation ID: each clone gets a new one, so guest kernels reseed their RNG
+    root.insert(list(root).index(root.find("name")) + 1, ET.Element("genid"))
+    return ET.tostring(root, encoding="unicode")
+
+
+def _wait_shutoff(job: Job, domain: libvirt.virDomain, timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while domain.isActive():
+        check_cancelled(job)
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Template VM did not power off within {timeout_s:.0f}s (cloud-init stuck?)")
+        time.sleep(1)
+
+
+def _wait_agent(domain: libvirt.virDomain, timeout_s: float, job: Optional[Job] = None) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        if job is not None:
+            check_cancelled(job)
+        try:
+            agent_command(domain, "guest-ping", timeout_s=2)
+            return
+        except GuestAgentError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.2)
+
+
+def _unplug_interfaces(domain: libvirt.virDomain, timeout_s: float = 30) -> str:
+    """
+    Detaches every NIC (live and config) and waits for the guest to let go.
+    A clone can't change the MAC of a device in the saved state, so it gets
+    a new NIC hotplugged instead.
+
+    :return: XML of the first interface, the model for clones' NICs
+    """
+    root = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+    interfaces = [ET.tostring(i, encoding="unicode") for i in root.findall("./devices/interface")]
+    if not interfaces:
+        raise RuntimeError("Template VM has no network interface")
+    for iface in interfaces:
+        domain.detachDeviceFlags(iface, libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_AFFECT_CONFIG)
+
+    deadline = time.monotonic() + timeout_s
+    while ET.fromstring(domain.XMLDesc(0)).find("./devices/interface") is not None:
+        if time.monotonic() >= deadline:
+            raise RuntimeError("Guest did not release its NIC; is ACPI hotplug enabled?")
+        time.sleep(0.2)
+    return interfaces[0]
+
+
+def build_template(job: Job, req: TemplateBuildRequest) -> dict:
+    """
+    Job: boots a golden VM for an OS image once and saves its running state.
+    The first boot runs cloud-init (guest agent, network, no users) and
+    powers off; the second boot is the state clones resume from. The NIC is
+    unplugged before the save and the domain undefined afterwards: only the
+    disk and the save image are kept, under <pool>/.templates/<os_name>/.
+
+    Callers mark the build started with vm_templates.begin_build.
+    """
+    os_name = req.os.os_name
+    name = f"{TEMPLATE_PREFIX}{os_name}"
+    t0 = time.perf_counter()
+    conn = get_connection()
+    domain = None
+    tdir = None
+    try:
+        update_progress(job, stage="image")
+        image = ensure_cloudimg(os_name, req.os.os_url, req.os.os_checksum)
+
+        tdir = templates_dir(conn) / os_name
+        if tdir.exists():
+            shutil.rmtree(tdir)
+        tdir.mkdir(parents=True)
+        disk = tdir / "disk.qcow2"
+        create_overlay(str(image), str(disk))
+        resize(str(disk), req.disk_size * GIB)
+
+        user_data = load_template("template_user_data.yaml").format(
+            hostname=name,
+            mac=req.network.mac_address,
+            vm_ip=req.network.ip_cidr,
+            vm_prefix=24,
+            vms_gateway=req.network.gateway,
+            dns_servers=gen_dns_defaults(req.network.dns_servers),
+        )
+        seed = tdir / "seed.iso"
+        generate_cloud_init_iso(generate_meta_data(MetaTemplate(vm_id=name, hostname=name)), None, user_data, str(seed))
+
+        update_progress(job, stage="first_boot")
+        domain = conn.defineXML(_render_template_xml(conn, name, str(disk), req))
+        attach_seed_iso(domain, str(seed))
+        domain.create()
+        _wait_shutoff(job, domain, TEMPLATE_BUILD_TIMEOUT_S)
+        detach_seed_iso(domain, seed_iso_path=str(seed))
+        seed.unlink()
+
+        update_progress(job, stage="boot")
+        domain.create()
+        _wait_agent(domain, TEMPLATE_BUILD_TIMEOUT_S, job)
+        guest_exec(domain, "/bin/sh", ["-c", _PREPARE], timeout_s=180)
+
+        update_progress(job, stage="unplug_nic")
+        interface_xml = _unplug_interfaces(domain)
+
+        update_progress(job, stage="save")
+        save_path = tdir / "state.save"
+        with span("template.save", template=os_name):
+            domain.saveFlags(str(save_path), None, libvirt.VIR_DOMAIN_SAVE_BYPASS_CACHE)
+        domain.undefine()
+        domain = None
+
+        build_ms = (time.perf_counter() - t0) * 1000
+        template_store.mark_ready(
+            os_name,
+            disk_path=str(disk),
+            save_path=str(save_path),
+            interface_xml=interface_xml,
+            vcpus=req.vcpus,
+            memory_mib=req.memory,
+            disk_bytes=req.disk_size * GIB,
+            image_bytes=save_path.stat().st_size,
+            build_ms=build_ms,
+        )
+        print(f"Template {os_name} ready in {build_ms / 1000:.0f}s")
+        return {"template": template_store.get(os_name)}
+    except BaseException as e:
+        template_store.mark_failed(os_name, f"{type(e).__name__}: {e}")
+        if domain is not None:
+            try:
+                if domain.isActive():
+                    domain.destroy()
+                domain.undefine()
+            except libvirt.libvirtError:
+                pass
+        if tdir is not None:
+            shutil.rmtree(tdir, ignore_errors=True)
+        raise
+    finally:
+        conn.close()
+
+
+def template_clones(conn: libvirt.virConnect, disk_path: str) -> list:
+    """
+    Domains whose vda chain is backed by a template disk.
+    """
+    clones = []
+    for domain in conn.listAllDomains():
+        try:
+            if disk_path in backing_chain(get_vda_path(domain)):
+                clones.append(domain.name())
+        except Exception:
+            continue
+    return clones
+
+
+def delete_template(conn: libvirt.virConnect, os_name: str) -> None:
+    """
+    :raises ValueError: VMs cloned from the template still use its disk
+    """
+    record = template_store.get(os_name)
+    if record is None:
+        return
+    if record["disk_path"]:
+        clones = template_clones(conn, record["disk_path"])
+        if clones:
+            raise ValueError(f"Template disk is the base of {len(clones)} VM(s): {', '.join(sorted(clones))}")
+        shutil.rmtree(Path(record["disk_path"]).parent, ignore_errors=True)
+    template_store.forget(os_name)
+
+
+# ---------------------------------------------------------------------------- #
+#                                     Clone                                    #
+# ---------------------------------------------------------------------------- #
+def _clone_xml(xml: str, vm_id: str, disk_path: str) -> str:
+    """
+    The template's saved definition turned into the clone's: new name,
+    UUID and generation ID, vda on the clone's overlay, no NIC.
+    """
+    root = ET.fromstring(xml)
+    root.find("name").text = vm_id
+    root.find("uuid").text = str(uuid.uuid4())
+    genid = root.find("genid")
+    if genid is not None:
+        genid.text = str(uuid.uuid4())
+    devices = root.find("devices")
+    for disk in devices.findall("disk"):
+        target = disk.find("target")
+        if disk.get("device") == "disk" and target is not None and target.get("dev") == "vda":
+            disk.find("source").set("file", disk_path)
+            backing = disk.find("backingStore")
+            if backing is not None:
+                disk.remove(backing)
+    for iface in devices.findall("interface"):
+        devices.remove(iface)
+    # dynamic labels are generated again for the new domain
+    for seclabel in root.findall("seclabel"):
+        if seclabel.get("type") == "dynamic":
+            root.remove(seclabel)
+    return ET.tostring(root, encoding="unicode")
+
+
+def _clone_interface(interface_xml: str, mac: str, bandwidth: NetworkSpec) -> str:
+    iface = ET.fromstring(interface_xml)
+    iface.find("mac").set("address", mac)
+    bw = iface.find("bandwidth")
+    if bw is not None:
+        iface.remove(bw)
+    bw = ET.SubElement(iface, "bandwidth")
+    ET.SubElement(bw, "inbound", {
+        "average": str(__mbps_to_kibps__(bandwidth.in_avg_mbps)),
+        "peak": str(__mbps_to_kibps__(bandwidth.in_peak_mbps)),
+        "burst": str(__mbps_to_kibps__(bandwidth.in_burst_mbps)),
+    })
+    ET.SubElement(bw, "outbound", {
+        "average": str(__mbps_to_kibps__(bandwidth.out_avg_mbps)),
+        "peak": str(__mbps_to_kibps__(bandwidth.out_peak_mbps)),
+        "burst": str(__mbps_to_kibps__(bandwidth.out_burst_mbps)),
+    })
+    return ET.tostring(iface, encoding="unicode")
+
+
+def reidentify_guest(domain: libvirt.virDomain, req: TemplateCloneRequest) -> dict:
+    """
+    Through the guest agent: sets the clock, hostname, a new machine-id and
+    SSH host keys, the user's credentials and the static address of the
+    new NIC.
+
+    :raises GuestAgentError: The agent didn't answer or the script failed
+    """
+    _wait_agent(domain, TEMPLATE_AGENT_WAIT_S)
+    # the guest clock stopped when the template was saved
+    agent_command(domain, "guest-set-time", {"time": time.time_ns()})
+
+    pwhash = sha512_crypt(req.host.password) if req.host.password else ""
+    out = guest_exec(domain, "/bin/sh", [
+        "-c", _REIDENTIFY, "sh",
+        req.host.hostname,
+        req.host.username,
+        req.host.public_key or "",
+        pwhash,
+        req.network.mac_address,
+        f"{req.network.ip_cidr}/24",  # same fixed prefix as the cloud-init templates
+        req.network.gateway,
+        gen_dns_defaults(req.network.dns_servers),
+    ], timeout_s=120)
+    if out["exitcode"] != 0:
+        raise GuestAgentError(f"re-identification failed ({out['exitcode']}): {out['stderr'][-500:]}")
+    return out
+
+
+def _wait_ssh(address: str, timeout_s: float) -> Optional[float]:
+    """
+    :return: Seconds until port 22 accepted a connection, None on timeout
+    """
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout_s:
+        try:
+            with socket.create_connection((address, 22), timeout=1):
+                return time.monotonic() - t0
+        except OSError:
+            time.sleep(0.1)
+    return None
+
+
+def clone_from_template(job: Job, os_name: str, req: TemplateCloneRequest) -> dict:
+    """
+    Job: creates a VM by restoring a template's saved state instead of
+    booting. The clone gets a thin overlay on the template disk, a copy of
+    the save image with its own name/UUID/disk, a hotplugged NIC with the
+    requested MAC and bandwidth, and a new identity set through the guest
+    agent. Anything that fails is rolled back.
+    """
+    template = template_store.get(os_name)
+    if template is None or template["state"] != "ready":
+        raise RuntimeError(f"Template '{os_name}' is not ready")
+
+    vm_id = req.vm_id
+    t0 = time.perf_counter()
+    timings = {}
+
+    def lap(stage: str, started: float) -> None:
+        timings[f"{stage}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    conn = get_connection()
+    overlay = image = domain = None
+    provisioning.begin(vm_id, "clone", template=os_name)
+    try:
+        disk_gb = max(req.disk_size or 0, math.ceil(template["disk_bytes"] / GIB))
+
+        update_progress(job, stage="prepare")
+        started = time.perf_counter()
+        with PLACEMENT_LOCK:
+            pool_name = select_pool(conn, disk_gb, tier=req.storage_tier, pool=req.storage_pool, exclude=vm_id)
+            pool = conn.storagePoolLookupByName(pool_name)
+            disk = Path(get_pool_dir(pool)) / f"{vm_id}.qcow2"
+            if disk.exists():
+                # someone else's volume (a concurrent create, a disk awaiting quarantine): not ours to roll back
+                raise RuntimeError(f"{disk} already exists")
+            capacity.admit(conn, vm_id, template["vcpus"], template["memory_mib"], None, disk_gb, pool_name)
+            create_overlay(template["disk_path"], str(disk))
+            overlay = disk
+            if disk_gb * GIB > template["disk_bytes"]:
+                resize(str(overlay), disk_gb * GIB)
+            pool.refresh(0)
+            provisioning.step(vm_id, "volume_created", volume_path=str(overlay))
+
+            restore = Path(template["save_path"]).with_name(f"{vm_id}.restore")
+            if restore.exists():
+                raise RuntimeError(f"{restore} already exists")
+            xml = _clone_xml(read_save_xml(template["save_path"]), vm_id, str(overlay))
+            image = restore
+            write_image_with_xml(template["save_path"], str(image), xml)
+            provisioning.step(vm_id, "image_written", restore_image=str(image))
+        lap("prepare", started)
+
+        update_progress(job, stage="restore")
+        started = time.perf_counter()
+        with span("libvirt.restore", vm=vm_id, template=os_name):
+            conn.restoreFlags(str(image), None, 0)
+        domain = conn.lookupByName(vm_id)
+        # restore gives a transient domain; defining it makes it persistent
+        conn.defineXML(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_SECURE | libvirt.VIR_DOMAIN_XML_INACTIVE))
+        provisioning.step(vm_id, "defined")
+        image.unlink()
+        image = None
+        lap("restore", started)
+
+        update_progress(job, stage="network")
+        started = time.perf_counter()
+        domain.attachDeviceFlags(
+            _clone_interface(template["interface_xml"], req.network.mac_address, req.bandwidth),
+            libvirt.VIR_DOMAIN_AFFECT_LIVE | libvirt.VIR_DOMAIN_AFFECT_CONFIG,
+        )
+        lap("nic", started)
+
+        update_progress(job, stage="reidentify")
+        started = time.perf_counter()
+        reidentified, reidentify_error = False, None
+        try:
+            if agent_channel_state(domain) is None:
+                raise GuestAgentError("template has no guest agent channel")
+            reidentify_guest(domain, req)
+            reidentified = True
+        except GuestAgentError as e:
+            if TEMPLATE_REQUIRE_REIDENTIFY:
+                raise
+            reidentify_error = str(e)
+        lap("reidentify", started)
+
+        if reidentified and disk_gb * GIB > template["disk_bytes"]:
+            grow_root_filesystem(domain)
+
+        resources = None
+        if req.vcpus or req.memory:
+            resources = resize_resources(conn, domain, ResourcesUpdate(vcpus=req.vcpus, memory=req.memory))
+
+        capacity.refresh_vm(conn, vm_id)
+        provisioning.finish(vm_id)
+        template_store.count_clone(os_name)
+        timings["ready_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+        if reidentified and TEMPLATE_SSH_WAIT_S > 0:
+            update_progress(job, stage="wait_ssh")
+            ssh_s = _wait_ssh(req.network.ip_cidr, TEMPLATE_SSH_WAIT_S)
+            timings["ssh_ms"] = round((time.perf_counter() - t0) * 1000, 1) if ssh_s is not None else None
+
+        return {
+            "vm": {"uuid": domain.UUIDString(), "name": vm_id, "state": "running"},
+            "template": os_name,
+            "reidentified": reidentified,
+            "reidentify_error": reidentify_error,
+            "resources": resources,
+            "timings": timings,
+        }
+    except BaseException as e:
+        provisioning.finish(vm_id, error=f"{type(e).__name__}: {e}")
+        if domain is not None:
+            try:
+                if domain.isActive():
+                    domain.destroy()
+                if domain.isPersistent():
+                    domain.undefine()
+            except libvirt.libvirtError:
+                pass
+        for path in (image, overlay):
+            if path is not None:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        capacity.refresh_vm(conn, vm_id)
+        raise
+    finally:
+        conn.close()
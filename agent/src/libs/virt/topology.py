@@ -0,0 +1,184 @@
+import os
+import threading
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import libvirt
+
+from src.libs.host.sysfs import list_numa_node_dirs, parse_cpulist, read_int, read_text
+
+
+@dataclass
+class HostCPU:
+    id: int
+    socket_id: int
+    core_id: int
+    siblings: List[int]
+
+
+@dataclass
+class NumaNode:
+    id: int
+    memory_kib: int
+    cpus: List[HostCPU] = field(default_factory=list)
+
+    @property
+    def cpu_ids(self) -> List[int]:
+        return [c.id for c in self.cpus]
+
+
+@dataclass
+class HostTopology:
+    nodes: List[NumaNode]
+    source: str  # "capabilities" | "sysfs" | "flat"
+
+    @property
+    def sockets(self) -> int:
+        return len({c.socket_id for n in self.nodes for c in n.cpus})
+
+    @property
+    def cores(self) -> int:
+        return len({(c.socket_id, c.core_id) for n in self.nodes for c in n.cpus})
+
+    @property
+    def threads(self) -> int:
+        return sum(len(n.cpus) for n in self.nodes)
+
+    def node_of_cpu(self) -> Dict[int, int]:
+        return {c.id: n.id for n in self.nodes for c in n.cpus}
+
+    def to_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "sockets": self.sockets,
+            "cores": self.cores,
+            "threads": self.threads,
+            "nodes": [
+                {
+                    "id": n.id,
+                    "memory_kib": n.memory_kib,
+                    "cpus": n.cpu_ids,
+                    "cores": [sorted(s) for s in {tuple(c.siblings) for c in n.cpus}],
+                }
+                for n in self.nodes
+            ],
+        }
+
+
+_TOPOLOGY: Optional[HostTopology] = None
+_TOPOLOGY_LOCK = threading.Lock()
+
+
+def _from_capabilities(caps_xml: str) -> Optional[HostTopology]:
+    """
+    Builds the topology from `virConnect.getCapabilities()` (host/topology/cells).
+    """
+    root = ET.fromstring(caps_xml)
+    cells = root.findall("./host/topology/cells/cell")
+    if not cells:
+        return None
+
+    nodes: List[NumaNode] = []
+    for cell in cells:
+        mem_el = cell.find("memory")
+        memory_kib = int(mem_el.text) if mem_el is not None and mem_el.text else 0
+        if mem_el is not None and (mem_el.get("unit") or "KiB") != "KiB":
+            # libvirt always reports KiB today; guard against surprises
+            memory_kib = 0
+        node = NumaNode(id=int(cell.get("id", "0")), memory_kib=memory_kib)
+        for cpu in cell.findall("./cpus/cpu"):
+            cpu_id = int(cpu.get("id"))
+            siblings = parse_cpulist(cpu.get("siblings") or str(cpu_id))
+            node.cpus.append(HostCPU(
+                id=cpu_id,
+                socket_id=int(cpu.get("socket_id", "0")),
+                core_id=int(cpu.get("core_id", str(cpu_id))),
+                siblings=siblings,
+            ))
+        nodes.append(node)
+
+    if not any(n.cpus for n in nodes):
+        return None
+    return HostTopology(nodes=nodes, source="capabilities")
+
+
+def _from_sysfs() -> Optional[HostTopology]:
+    """
+    Builds the topology from /sys/devices/system/{node,cpu}.
+    """
+    node_dirs = list_numa_node_dirs()
+    if not node_dirs:
+        return None
+
+    nodes: List[NumaNode] = []
+    for nd in node_dirs:
+        memory_kib = 0
+        meminfo = read_text(str(nd / "meminfo")) or ""
+        for line in meminfo.splitlines():
+            # "Node 0 MemTotal:       32768000 kB"
+            if "MemTotal:" in line:
+                try:
+                    memory_kib = int(line.split("MemTotal:", 1)[1].split()[0])
+                except (IndexError, ValueError):
+                    pass
+                break
+
+        node = NumaNode(id=int(nd.name[4:]), memory_kib=memory_kib)
+        for cpu_id in parse_cpulist(read_text(str(nd / "cpulist")) or ""):
+            topo = f"/sys/devices/system/cpu/cpu{cpu_id}/topology"
+            socket_id = read_int(f"{topo}/physical_package_id")
+            # core 0 is a real id on every socket; only a missing file falls back
+            core_id = read_int(f"{topo}/core_id")
+            node.cpus.append(HostCPU(
+                id=cpu_id,
+                socket_id=0 if socket_id is None else socket_id,
+                core_id=cpu_id if core_id is None else core_id,
+                siblings=parse_cpulist(read_text(f"{topo}/thread_siblings_list") or str(cpu_id)),
+            ))
+        nodes.append(node)
+
+    if not any(n.cpus for n in nodes):
+        return None
+    return HostTopology(nodes=nodes, source="sysfs")
+
+
+def _flat(conn: libvirt.virConnect) -> HostTopology:
+    """
+    Last resort: one node holding every host CPU, no SMT information.
+    """
+    _model, memory_mib, cpus, *_rest = conn.getInfo()
+    node = NumaNode(id=0, memory_kib=memory_mib * 1024)
+    node.cpus = [HostCPU(id=i, socket_id=0, core_id=i, siblings=[i]) for i in range(cpus)]
+    return HostTopology(nodes=[node], source="flat")
+
+
+def get_host_topology(conn: libvirt.virConnect, refresh: bool = False) -> HostTopology:
+    """
+    Returns the host NUMA/CPU topology. The result is cached for the lifetime
+    of the process since the topology doesn't change while we run.
+
+    :param conn: Open libvirt connection
+    :type conn: libvirt.virConnect
+    :param refresh: Force a re-read (e.g. after CPU hotplug on the host)
+    :type refresh: bool
+    :return: Host topology
+    :rtype: HostTopology
+    """
+    global _TOPOLOGY
+    with _TOPOLOGY_LOCK:
+        if _TOPOLOGY is not None and not refresh:
+            return _TOPOLOGY
+
+        topo = None
+        try:
+            topo = _from_capabilities(conn.getCapabilities())
+        except (libvirt.libvirtError, ET.ParseError) as e:
+            print(f"Could not read topology from capabilities: {e}")
+        if topo is None and os.path.isdir("/sys/devices/system/node"):
+            topo = _from_sysfs()
+        if topo is None:
+            topo = _flat(conn)
+
+        _TOPOLOGY = topo
+        return topo
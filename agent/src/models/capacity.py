@@ -0,0 +1,14 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from .create_vm import DiskFormat, HugepageSize
+
+class CapacityCheck (BaseModel):
+    # same units as CreateVMParams
+    vcpus: int = Field(gt=0)
+    memory: int = Field(gt=0)  # MiB
+    disk_size: int = Field(gt=0)  # GiB
+    hugepages: Optional[HugepageSize] = None
+    disk_format: DiskFormat = DiskFormat.QCOW2
+    storage_tier: Optional[str] = None
+    storage_pool: Optional[str] = None
@@ -1,5 +1,7 @@
 from typing import Optional
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, Field, model_validator
+
+from enum import Enum
 
 class NetworkSpec (BaseModel):
     in_avg_mbps: float
@@ -9,13 +11,94 @@ class NetworkSpec (BaseModel):
     out_peak_mbps: float
     out_burst_mbps: float
 
+class DiskSpec (BaseModel):
+    """
+    vda I/O limits (libvirt <iotune>). Unset = unlimited, 0 clears a limit.
+    total_* can't be combined with read_*/write_* of the same kind.
+    *_max is the burst limit and *_max_length how many seconds it may last.
+    """
+    total_bytes_sec: Optional[int] = Field(default=None, ge=0)
+    read_bytes_sec: Optional[int] = Field(default=None, ge=0)
+    write_bytes_sec: Optional[int] = Field(default=None, ge=0)
+    total_iops_sec: Optional[int] = Field(default=None, ge=0)
+    read_iops_sec: Optional[int] = Field(default=None, ge=0)
+    write_iops_sec: Optional[int] = Field(default=None, ge=0)
+    total_bytes_sec_max: Optional[int] = Field(default=None, ge=0)
+    read_bytes_sec_max: Optional[int] = Field(default=None, ge=0)
+    write_bytes_sec_max: Optional[int] = Field(default=None, ge=0)
+    total_iops_sec_max: Optional[int] = Field(default=None, ge=0)
+    read_iops_sec_max: Optional[int] = Field(default=None, ge=0)
+    write_iops_sec_max: Optional[int] = Field(default=None, ge=0)
+    total_bytes_sec_max_length: Optional[int] = Field(default=None, ge=0)
+    read_bytes_sec_max_length: Optional[int] = Field(default=None, ge=0)
+    write_bytes_sec_max_length: Optional[int] = Field(default=None, ge=0)
+    total_iops_sec_max_length: Optional[int] = Field(default=None, ge=0)
+    read_iops_sec_max_length: Optional[int] = Field(default=None, ge=0)
+    write_iops_sec_max_length: Optional[int] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def _check_limits(self):
+        for kind in ("bytes", "iops"):
+            for suffix in ("", "_max"):
+                total = getattr(self, f"total_{kind}_sec{suffix}")
+                split = getattr(self, f"read_{kind}_sec{suffix}") or getattr(self, f"write_{kind}_sec{suffix}")
+                if total and split:
+                    raise ValueError(f"total_{kind}_sec{suffix} can't be combined with read/write limits")
+            for op in ("total", "read", "write"):
+                base = getattr(self, f"{op}_{kind}_sec")
+                burst = getattr(self, f"{op}_{kind}_sec_max")
+                length = getattr(self, f"{op}_{kind}_sec_max_length")
+                if burst and base and burst < base:
+                    raise ValueError(f"{op}_{kind}_sec_max must be >= {op}_{kind}_sec")
+                if length and not burst:
+                    raise ValueError(f"{op}_{kind}_sec_max_length needs {op}_{kind}_sec_max")
+        return self
+
+class HugepageSize(str, Enum):
+    SIZE_2M = "2M"
+    SIZE_1G = "1G"
+
+class DiskFormat(str, Enum):
+    QCOW2 = "qcow2"  # thin file, snapshots
+    RAW = "raw"  # sparse file or LVM volume (block pools); no snapshots, less write overhead
+
 class CreateVMParams (BaseModel):
     vcpus: int
     memory: int
+    # Hotplug ceilings; default from VM_MAX_VCPUS_FACTOR / VM_MAX_MEMORY_FACTOR
+    max_vcpus: Optional[int] = Field(default=None, gt=0)
+    max_memory: Optional[int] = Field(default=None, gt=0)  # MiB
     disk_size: int
     network: NetworkSpec
+    disk: Optional[DiskSpec] = None  # vda I/O limits; None = unlimited
+    disk_format: DiskFormat = DiskFormat.QCOW2
     mac: str
+    numa_pinning: bool = True  # pin vCPUs/emulator/memory to the least-loaded NUMA node
+    hugepages: Optional[HugepageSize] = None  # back guest RAM with 2M / 1G pages
+    hugepages_fallback: bool = True  # use regular pages instead of failing when none are left
+    guest_agent: bool = True  # add the qemu-ga channel (guest facts, filesystem resize)
+    ksm: bool = True  # False = <nosharepages/>: never merge this guest's memory with others
+
+    @model_validator(mode="after")
+    def _check_maximums(self):
+        if self.max_vcpus is not None and self.max_vcpus < self.vcpus:
+            raise ValueError("max_vcpus can't be below vcpus")
+        if self.max_memory is not None and self.max_memory < self.memory:
+            raise ValueError("max_memory can't be below memory")
+        return self
+
+    @model_validator(mode="after")
+    def _check_hugepage_alignment(self):
+        if self.hugepages == HugepageSize.SIZE_1G and self.memory % 1024:
+            raise ValueError("memory must be a multiple of 1024 MiB for 1G hugepages")
+        if self.hugepages == HugepageSize.SIZE_2M and self.memory % 2:
+            raise ValueError("memory must be a multiple of 2 MiB for 2M hugepages")
+        return self
 
 class VMCreateRequest(BaseModel):
     vm_id: str
     vm: CreateVMParams
+    # tier from STORAGE_POOLS (e.g. "fast", "bulk"); None = STORAGE_DEFAULT_TIER
+    storage_tier: Optional[str] = None
+    # pin the disk to one configured pool instead of letting placement pick
+    storage_pool: Optional[str] = None
@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+
+class DiskResizeRequest(BaseModel):
+    size_gb: int = Field(gt=0)        # new virtual size of vda (grow only)
+    grow_filesystem: bool = False     # grow the guest root fs through the guest agent
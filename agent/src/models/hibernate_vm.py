@@ -0,0 +1,21 @@
+from typing import Optional
+from pydantic import BaseModel
+
+from enum import Enum
+
+class SaveImageFormat(str, Enum):
+    RAW = "raw"
+    GZIP = "gzip"
+    BZIP2 = "bzip2"
+    XZ = "xz"
+    LZOP = "lzop"
+    ZSTD = "zstd"
+
+class HibernateRequest(BaseModel):
+    # None = HIBERNATE_IMAGE_FORMAT, or qemu.conf save_image_format when that's unset too
+    image_format: Optional[SaveImageFormat] = None
+    # O_DIRECT save/restore: keeps multi-GiB images out of the host page cache
+    bypass_cache: Optional[bool] = None  # None = HIBERNATE_BYPASS_CACHE
+
+class HibernatePolicyUpdate(BaseModel):
+    idle: bool  # False = the idle policy never hibernates this VM
@@ -0,0 +1,24 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from enum import Enum
+
+class MigrateCompression(str, Enum):
+    XBZRLE = "xbzrle"
+    MT = "mt"
+    ZLIB = "zlib"
+    ZSTD = "zstd"
+
+class MigrateRequest(BaseModel):
+    dest_uri: str                                   # e.g. qemu+tls://host-b/system
+    bandwidth_mibps: Optional[int] = Field(default=None, gt=0)
+    postcopy_bandwidth_mibps: Optional[int] = Field(default=None, gt=0)
+    compression: list[MigrateCompression] = []
+    parallel_connections: Optional[int] = Field(default=None, gt=0)
+    auto_converge: bool = True
+    postcopy: bool = False
+    postcopy_after_s: int = Field(default=30, ge=0)  # switch to post-copy after this long in pre-copy
+    copy_storage: bool = False                      # copy disks too (pools aren't shared)
+    max_downtime_ms: Optional[int] = Field(default=None, gt=0)
+    undefine_source: bool = True
+    strip_pinning: bool = True                      # drop cputune/numatune; the destination places the VM
@@ -0,0 +1,12 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+class NetworkBandwidthUpdate(BaseModel):
+    # Same units as NetworkSpec; unset fields keep their current value,
+    # in_avg_mbps / out_avg_mbps = 0 removes the limit in that direction
+    in_avg_mbps: Optional[float] = Field(default=None, ge=0)
+    in_peak_mbps: Optional[float] = Field(default=None, ge=0)
+    in_burst_mbps: Optional[float] = Field(default=None, ge=0)
+    out_avg_mbps: Optional[float] = Field(default=None, ge=0)
+    out_peak_mbps: Optional[float] = Field(default=None, ge=0)
+    out_burst_mbps: Optional[float] = Field(default=None, ge=0)
@@ -0,0 +1,9 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+class ResourcesUpdate(BaseModel):
+    vcpus: Optional[int] = Field(default=None, gt=0)
+    memory: Optional[int] = Field(default=None, gt=0)  # MiB
+    # Restart the VM (as a job) when part of the change can only apply on next boot
+    restart: bool = False
+    restart_delay_s: int = Field(default=0, ge=0)
@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+class SnapshotCreateRequest(BaseModel):
+    name: str
+
+class SnapshotRevertRequest(BaseModel):
+    start: bool = False  # boot the VM after reverting (it is booted anyway if it was running)
+    discard_saved_state: bool = False  # drop a hibernated VM's saved RAM so it can be reverted
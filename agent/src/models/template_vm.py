@@ -0,0 +1,30 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from .create_vm import NetworkSpec
+from .format_vm import CreateVMHost, FormatOSNetwork, FormatOSVM
+
+class TemplateBuildRequest(BaseModel):
+    os: FormatOSVM
+    # address the template VM uses while cloud-init installs the guest agent
+    network: FormatOSNetwork
+    vcpus: int = Field(default=1, gt=0)
+    memory: int = Field(default=1024, gt=0)  # MiB; clones start with this much
+    # hotplug ceilings clones can be scaled up to; default from VM_MAX_*_FACTOR
+    max_vcpus: Optional[int] = Field(default=None, gt=0)
+    max_memory: Optional[int] = Field(default=None, gt=0)
+    disk_size: int = Field(default=10, gt=0)  # GiB
+
+class TemplateCloneRequest(BaseModel):
+    vm_id: str
+    host: CreateVMHost
+    network: FormatOSNetwork  # mac_address is the clone's new MAC
+    bandwidth: NetworkSpec
+    # grown from the template's size when larger
+    disk_size: Optional[int] = Field(default=None, gt=0)
+    # changed live after the restore, up to the template's maximums
+    vcpus: Optional[int] = Field(default=None, gt=0)
+    memory: Optional[int] = Field(default=None, gt=0)
+    # where the clone's overlay goes, as for VMCreateRequest
+    storage_tier: Optional[str] = None
+    storage_pool: Optional[str] = None
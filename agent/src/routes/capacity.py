@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException
+from src.libs.virt.capacity import capacity_report, check_fit
+from src.libs.virt.connection import get_connection
+from src.libs.virt.errors import InsufficientResourcesError
+from src.libs.virt.hugepages import PAGE_SIZES_KIB
+from src.libs.virt.storage_pools import select_pool
+from src.models.capacity import CapacityCheck
+
+router = APIRouter(prefix="/capacity", tags=["Capacity"])
+
+@router.get("")
+async def get_capacity():
+    """
+    Allocatable vs committed resources under the overcommit ratios, for
+    placing new VMs across hosts.
+    """
+    return {"capacity": capacity_report()}
+
+@router.post("/check")
+async def check_capacity(body: CapacityCheck):
+    """
+    Whether a VM of this size would be admitted right now, and which pool
+    its disk would go to. Nothing is reserved; a create can still lose the
+    race to another one.
+    """
+    problems = []
+    conn = get_connection()
+    try:
+        pool = select_pool(
+            conn, body.disk_size, tier=body.storage_tier, pool=body.storage_pool,
+            disk_format=body.disk_format.value,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InsufficientResourcesError as e:
+        pool = None
+        problems.append(f"disk: {e}")
+    finally:
+        conn.close()
+    problems = check_fit(
+        body.vcpus,
+        body.memory,
+        PAGE_SIZES_KIB[body.hugepages.value] if body.hugepages else None,
+        body.disk_size,
+        pool,
+    ) + problems
+    return {"fits": not problems, "pool": pool, "problems": problems}
@@ -1,7 +1,25 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from src.libs.health.checks import readiness
 
 router = APIRouter(prefix="/health", tags=["Health Check"])
 
 @router.get("/")
 def health():
     return {"status": "ok"}
+
+@router.get("/live")
+async def live():
+    """
+    Liveness: the process is up and the event loop answers.
+    """
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness: libvirt, storage pool, image cache, job queue and event loop.
+    Served from the background checker's cache, so probing is free.
+    """
+    report = readiness()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 import asyncio
 import json
 import subprocess
@@ -9,6 +9,13 @@ import struct
 import socket
 import psutil
 import platform
+import libvirt
+from src.libs.host.sysfs import iface_link_speed_mbps
+from src.libs.virt.connection import get_connection_read_only
+from src.libs.virt.hugepages import hugepages_report
+from src.libs.virt.ksm import ksm_report
+from src.libs.virt.placement import node_loads
+from src.libs.virt.topology import get_host_topology
 
 router = APIRouter(prefix="/info", tags=["Info"])
 
@@ -16,39 +23,6 @@ router = APIRouter(prefix="/info", tags=["Info"])
 # ---------------------------------------------------------------------------- #
 #                                    Helpers                                   #
 # ---------------------------------------------------------------------------- #
-def _read_int(path: str) -> Optional[int]:
-    """
-    Reads an integer from a file. Returns None if the file doesn't exist or
-    the content is invalid.
-    
-    :param path: File path
-    :type path: str
-    :return: Integer value or None
-    :rtype: int | None
-    """
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            s = f.read().strip()
-        if not s or s == "-1":
-            return None
-        return int(s)
-    except Exception:
-        return None
-
-
-def _iface_link_speed_mbps(iface: str) -> Optional[int]:
-    """
-    Reads the link speed in Mbps for a given network interface on Linux.
-    Returns None if not available.
-    
-    :param iface: Network interface name
-    :type iface: str
-    :return: Link speed in Mbps or None if not available
-    :rtype: int | None
-    """
-    return _read_int(f"/sys/class/net/{iface}/speed")
-
-
 def _tc_json() -> Dict[str, Any]:
     """
     Returns traffic control (tc) configuration as JSON.
@@ -439,6 +413,19 @@ async def info(sample_interval: float = 1.0, include_tc: bool = False) -> Dict[s
         "percent_used": vm.percent,
     }
 
+    # Hugepage pools (kernel view + what our VMs use/reserve)
+    try:
+        hp_conn = get_connection_read_only()
+    except Exception:
+        hp_conn = None
+    try:
+        hugepages = hugepages_report(hp_conn)
+        # Kernel Samepage Merging: shared pages and what they save
+        ksm = ksm_report(hp_conn)
+    finally:
+        if hp_conn is not None:
+            hp_conn.close()
+
     # ---------------------------------------------------------------------------- #
     #                                     Disks                                    #
     # ---------------------------------------------------------------------------- #
@@ -494,7 +481,7 @@ async def info(sample_interval: float = 1.0, include_tc: bool = False) -> Dict[s
             "errors_out_total": b.errout,
             "drops_in_total": b.dropin,
             "drops_out_total": b.dropout,
-            "link_speed_mbps": _iface_link_speed_mbps(iface),
+            "link_speed_mbps": iface_link_speed_mbps(iface),
         }
 
     # ---------------------------------------------------------------------------- #
@@ -544,6 +531,8 @@ async def info(sample_interval: float = 1.0, include_tc: bool = False) -> Dict[s
             "per_logical_cpu_percent": per_cpu_percent,
         },
         "memory": memory,
+        "hugepages": hugepages,
+        "ksm": ksm,
         "disks": disks,
         "disk_summary": disk_summary,
         "network": net,
@@ -554,3 +543,20 @@ async def info(sample_interval: float = 1.0, include_tc: bool = False) -> Dict[s
         result["traffic_control"] = _tc_json()
 
     return result
+
+
+@router.get("/numa")
+async def numa_info() -> Dict[str, Any]:
+    """
+    Host CPU/NUMA topology and how many vCPUs/memory are placed on each node.
+    """
+    conn = get_connection_read_only()
+    try:
+        return {
+            "topology": get_host_topology(conn).to_dict(),
+            "nodes": node_loads(conn),
+        }
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
@@ -0,0 +1,24 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import get_job, list_jobs, request_cancel
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+@router.get("/")
+async def list_all_jobs(kind: Optional[str] = None, vm_id: Optional[str] = None, active: bool = False):
+    jobs = list_jobs(kind=kind, vm_id=vm_id, active_only=active)
+    return {"jobs": [j.to_dict() for j in jobs], "total": len(jobs)}
+
+@router.get("/{job_id}")
+async def get_one_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"found": True, "job": job.to_dict()}
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = request_cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"found": True, "job": job.to_dict()}
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, HTTPException
+import libvirt
+from src.libs.console.relay import console_stats
+from src.libs.crypto.verify import signature_stats
+from src.libs.controlplane.client import client_stats
+from src.libs.tasks.periodic import list_tasks
+from src.libs.telemetry.http import route_stats
+from src.libs.telemetry.tracing import span_stats
+from src.libs.virt.balloon import balloon_report
+from src.libs.virt.guest_facts import guest_facts_stats
+from src.libs.virt.hibernate import hibernation_stats
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@router.get("/console")
+async def console_metrics():
+    """
+    Active and recent console sessions with throughput and relay latency.
+    """
+    return console_stats()
+
+@router.get("/auth")
+async def auth_metrics():
+    """
+    Request signature verification counters, nonce cache size and latency.
+    """
+    return signature_stats()
+
+@router.get("/controlplane")
+async def controlplane_metrics():
+    """
+    Agent -> control plane client: retries, connection reuse and latency.
+    """
+    return client_stats()
+
+@router.get("/tasks")
+async def task_metrics():
+    """
+    Background tasks: last run, duration and error.
+    """
+    return {"tasks": list_tasks()}
+
+@router.get("/routes")
+async def route_metrics():
+    """
+    Per-route latency histograms, status classes and in-flight requests.
+    """
+    return route_stats()
+
+@router.get("/spans")
+async def span_metrics():
+    """
+    Aggregated span timings (provisioning steps, downloads, libvirt calls).
+    """
+    return span_stats()
+
+@router.get("/guest-agent")
+async def guest_agent_metrics():
+    """
+    Guest fact collections: failures, in-flight guests and latency.
+    """
+    return guest_facts_stats()
+
+@router.get("/balloon")
+async def balloon_metrics():
+    """
+    Memory reclaimed from guests by the balloon controller, per VM and per host.
+    """
+    try:
+        return balloon_report()
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/hibernation")
+async def hibernation_metrics():
+    """
+    Hibernated VMs, save image sizes, save/restore latency and the idle policy.
+    """
+    return hibernation_stats()
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from src.libs.virt.connection import get_connection
+from src.libs.virt.reconcile import last_report, reconcile
+
+router = APIRouter(prefix="/reconcile", tags=["Reconcile"])
+
+@router.get("")
+async def get_last_report():
+    """
+    Result of the last reconcile pass (startup, periodic or manual).
+    """
+    return {"report": last_report()}
+
+@router.post("")
+async def run(dry_run: Optional[bool] = None):
+    """
+    Runs a reconcile pass now.
+
+    :param dry_run: Only report what would be deleted/quarantined (default: RECONCILE_APPLY)
+    """
+    def _run():
+        conn = get_connection()
+        try:
+            if dry_run is None:
+                return reconcile(conn)
+            return reconcile(conn, dry_run=dry_run)
+        finally:
+            conn.close()
+
+    try:
+        report = await asyncio.to_thread(_run)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"report": report}
@@ -4,6 +4,13 @@ from .health import router as health
 from .uuid import router as uuid
 from .info import router as info
 from .key import router as key
+from .jobs import router as jobs
+from .metrics import router as metrics
+from .state import router as state
+from .reconcile import router as reconcile
+from .capacity import router as capacity
+from .templates import router as templates
+from .storage import router as storage
 
 api_router = APIRouter(prefix="/v1")
 
@@ -11,4 +18,11 @@ api_router.include_router(health)
 api_router.include_router(uuid)
 api_router.include_router(vms)
 api_router.include_router(info)
-api_router.include_router(key)
\ No newline at end of file
+api_router.include_router(key)
+api_router.include_router(jobs)
+api_router.include_router(metrics)
+api_router.include_router(state)
+api_router.include_router(reconcile)
+api_router.include_router(capacity)
+api_router.include_router(templates)
+api_router.include_router(storage)
\ No newline at end of file
@@ -0,0 +1,25 @@
+from typing import Optional
+from fastapi import APIRouter
+from src.libs.store import images, provisioning
+
+router = APIRouter(prefix="/state", tags=["State"])
+
+@router.get("/provisioning")
+async def list_provisioning(status: Optional[str] = None):
+    """
+    Create/format operations per VM, including interrupted ones.
+    """
+    records = provisioning.list_records(status=status)
+    return {"provisioning": records, "total": len(records)}
+
+@router.get("/provisioning/{vm_id}")
+async def get_provisioning(vm_id: str):
+    record = provisioning.get(vm_id)
+    return {"found": record is not None, "provisioning": record}
+
+@router.get("/images")
+async def list_images():
+    """
+    Cached cloud images: source, checksum, size, last use.
+    """
+    return {"images": images.list_images()}
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import submit_job
+from src.libs.virt.connection import get_connection
+from src.libs.virt.reclaim import reclaim_report, run_reclaim
+from src.libs.virt.storage_pools import STORAGE_DEFAULT_TIER, pool_stats, pool_volumes, probe_pools
+import asyncio
+import libvirt
+
+router = APIRouter(prefix="/storage", tags=["Storage"])
+
+@router.get("/pools")
+async def list_pools():
+    """
+    Configured pools with tier, libvirt sizes, committed disk (capacity
+    ledger) and measured read/write latency.
+    """
+    conn = get_connection()
+    try:
+        return {"default_tier": STORAGE_DEFAULT_TIER or None, "pools": pool_stats(conn)}
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@router.get("/pools/{name}/volumes")
+async def list_pool_volumes(name: str):
+    """
+    Volumes of one pool and the VM each belongs to (None = unreferenced).
+    """
+    conn = get_connection()
+    try:
+        return {"pool": name, "volumes": pool_volumes(conn, name)}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=409, detail=f"Pool is not defined or not active: {e}")
+    finally:
+        conn.close()
+
+@router.post("/pools/probe")
+async def probe():
+    """
+    Measures every pool's latency now instead of waiting for the next
+    periodic probe.
+    """
+    return {"results": await asyncio.to_thread(probe_pools)}
+
+
+@router.get("/reclaim")
+async def get_reclaim():
+    """
+    Host allocation against virtual size of every VM disk, what trims and
+    compactions reclaimed per VM, and the latest reclaim passes.
+    """
+    def _report():
+        conn = get_connection()
+        try:
+            return reclaim_report(conn)
+        finally:
+            conn.close()
+
+    try:
+        return await asyncio.to_thread(_report)
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/reclaim")
+async def start_reclaim():
+    """
+    Runs a reclaim pass now as a job: running VMs are trimmed through the
+    guest agent, stopped ones compacted.
+    """
+    job = submit_job("reclaim", lambda job: run_reclaim(job, trigger="manual"))
+    return {"job": job.to_dict()}
@@ -0,0 +1,93 @@
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import active_job_for, submit_job
+from src.libs.store import vm_templates as template_store
+from src.libs.virt.connection import get_connection
+from src.libs.virt.storage_pools import candidate_pools
+from src.libs.virt.template_vms import build_template, clone_from_template, delete_template
+from src.models.template_vm import TemplateBuildRequest, TemplateCloneRequest
+import libvirt
+
+router = APIRouter(prefix="/templates", tags=["Templates"])
+
+@router.get("")
+async def list_templates():
+    """
+    Saved golden VMs per OS image, with build time, image size and clone count.
+    """
+    return {"templates": template_store.list_templates()}
+
+@router.get("/{os_name}")
+async def get_template(os_name: str):
+    template = template_store.get(os_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return {"found": True, "template": template}
+
+@router.post("")
+async def build(body: TemplateBuildRequest):
+    """
+    Builds the template for an OS image as a job: one cloud-init boot, a
+    second boot, then its running state is saved. Takes minutes; clones
+    take seconds afterwards.
+    """
+    existing = template_store.get(body.os.os_name)
+    if existing is not None and existing["state"] == "ready":
+        raise HTTPException(status_code=409, detail="Template already built; delete it first to rebuild")
+    if not template_store.begin_build(body.os.os_name):
+        raise HTTPException(status_code=409, detail="Template is already being built")
+    job = submit_job("template_build", lambda job: build_template(job, body))
+    return {"job": job.to_dict()}
+
+@router.delete("/{os_name}")
+async def delete(os_name: str):
+    """
+    Deletes a template's disk and save image. Refused while VMs cloned from
+    it exist: their disks are overlays on the template disk.
+    """
+    template = template_store.get(os_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    if template["state"] == "building":
+        raise HTTPException(status_code=409, detail="Template is being built")
+    conn = get_connection()
+    try:
+        delete_template(conn, os_name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+    return {"deleted": True}
+
+@router.post("/{os_name}/clone")
+async def clone(os_name: str, body: TemplateCloneRequest):
+    """
+    Creates a running VM from a template's saved state instead of booting
+    it (job). The result has the per-stage timings.
+    """
+    template = template_store.get(os_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    if template["state"] != "ready":
+        raise HTTPException(status_code=409, detail=f"Template is {template['state']}")
+    try:
+        candidate_pools(body.storage_tier, body.storage_pool)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    conn = get_connection()
+    try:
+        try:
+            conn.lookupByName(body.vm_id)
+            raise HTTPException(status_code=409, detail="VM already exists")
+        except libvirt.libvirtError:
+            pass
+    finally:
+        conn.close()
+
+    running = active_job_for(body.vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM has an active {running.kind} job ({running.id})")
+    job = submit_job("clone", lambda job: clone_from_template(job, os_name, body), vm_id=body.vm_id)
+    return {"job": job.to_dict()}
@@ -1,15 +1,29 @@
+import asyncio
+import math
+import os
 import traceback
 from typing import Optional
 from fastapi import APIRouter, HTTPException
 from src.libs.virt.list import list_virtual_machines, get_virtual_machine_read, get_virtual_machine_changes, __domain_to_dict__
 from src.libs.virt.create import create_virtual_machine
+from src.libs.virt.errors import InsufficientResourcesError, VMBusyError
+from src.libs.virt.storage_pools import candidate_pools
 from .status import router as vm_status_router
+from .placement import router as vm_placement_router
+from .migrate import router as vm_migrate_router
+from .snapshots import router as vm_snapshots_router
+from .disk import router as vm_disk_router
+from .console import router as vm_console_router
+from .guest import router as vm_guest_router
+from .network import router as vm_network_router
+from .resources import router as vm_resources_router
+from .hibernate import router as vm_hibernate_router
 import libvirt
 from src.models.create_vm import VMCreateRequest
 from src.models.format_vm import VMFormatBody
 from src.models.finalize_vm import FinalizeRequest
-from src.libs.virt.helpers import ensure_shutoff, get_virtual_size_gb
-from src.libs.virt.format import attach_seed_iso, detach_seed_iso, get_vda_path, detach_cdroms
+from src.libs.virt.helpers import ensure_shutoff
+from src.libs.virt.format import attach_seed_iso, detach_seed_iso, get_vda_format, get_vda_path, detach_cdroms
 from src.libs.virt.cloud_init import (
     MetaTemplate,
     NetworkingTemplate,
@@ -21,9 +35,28 @@ from src.libs.virt.cloud_init import (
 from src.libs.virt.create import get_connection
 from src.libs.cloudimgs.check import CLOUDIMG_DIR, ensure_cloudimg
 from src.libs.virt.clone_cloudimg import full_clone_cloud_image_into_volume
+from src.libs.virt.volumes import remove_disk, stream_image_into_volume
+from src.libs.virt.qemu_img import backing_chain, resize as qemu_img_resize
+from src.libs.virt.disk import vda_block_info
+from src.libs.virt.snapshots import (
+    PRISTINE_SNAPSHOT,
+    create_snapshot,
+    discard_chain,
+    read_snapshots,
+    revert_snapshot,
+    vm_lock,
+    vm_lock_within,
+)
+from src.libs.jobs.jobs import active_job_for
+from src.libs.telemetry.tracing import span
+from src.libs.store import guest_facts, hibernation, provisioning, reclaim
+from src.libs.store import capacity as capacity_ledger
 from pathlib import Path
 
 router = APIRouter(prefix="/vms", tags=["VMs Management"])
+
+# Take a "pristine" snapshot right after the OS image is cloned so reformats are O(1)
+PRISTINE_ENABLED = os.getenv("SNAPSHOT_PRISTINE", "true").lower() == "true"
         
 
 @router.get("/")
@@ -38,7 +71,14 @@ async def get_vm(vm_id: str):
 
 @router.post("/")
 async def create_vm(body: VMCreateRequest):
-    status: Optional[libvirt.virDomain] = create_virtual_machine(body)
+    try:
+        candidate_pools(body.storage_tier, body.storage_pool, body.vm.disk_format.value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        status: Optional[libvirt.virDomain] = create_virtual_machine(body)
+    except InsufficientResourcesError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if status is None:
         # Send 500 error
         raise HTTPException(status_code=500, detail="New Error Found")
@@ -64,39 +104,96 @@ async def format_vm_disk(vm_id: str, body: VMFormatBody):
         raise HTTPException(400, "Provide exactly one of host.public_key or host.password")
 
     conn = get_connection()
+    chain_lock = None
     try:
         # NOTE: this looks up libvirt domain by *name*.
         # In your create_vm you used name=req.host.hostname, so vm_id must match that or this will 404.
-        try:
-            domain = conn.lookupByName(vm_id)
-        except libvirt.libvirtError:
-            # fallback: try hostname if that's your libvirt domain name
+        with span("format.lookup", vm=vm_id):
             try:
-                domain = conn.lookupByName(body.host.hostname)
+                domain = conn.lookupByName(vm_id)
             except libvirt.libvirtError:
-                raise HTTPException(404, f"Domain not found for '{vm_id}' (or hostname '{body.host.hostname}')")
+                # fallback: try hostname if that's your libvirt domain name
+                try:
+                    domain = conn.lookupByName(body.host.hostname)
+                except libvirt.libvirtError:
+                    raise HTTPException(404, f"Domain not found for '{vm_id}' (or hostname '{body.host.hostname}')")
+
+        running = active_job_for(domain.name())
+        if running is not None:
+            raise HTTPException(409, f"VM has an active {running.kind} job ({running.id})")
+        lock = vm_lock(domain.name())
+        # this handler runs on the event loop: never wait for a compaction or reclaim to finish
+        if not lock.acquire(blocking=False):
+            raise HTTPException(409, "VM is locked by another operation (e.g. disk compaction); retry later")
+        chain_lock = lock
+        provisioning.begin(domain.name(), "format", os_name=body.os.os_name, seed_iso=f"/tmp/{vm_id}-seed.iso")
 
         # 1) stop it
-        if domain.isActive():
-            domain.destroy()
+        provisioning.step(domain.name(), "stop")
+        with span("format.stop", vm=vm_id):
+            if domain.isActive():
+                domain.destroy()
+            # a hibernated VM would resume its old RAM on top of the new disk
+            if domain.hasManagedSaveImage(0):
+                domain.managedSaveRemove(0)
         print("Step 1: done")
 
-        # 2) find current vda disk path + current size
-        vda_path = get_vda_path(domain)
-        current_disk_gb = get_virtual_size_gb(conn, vda_path)
-        print("Step 2: done")
-
-        print("Step 3: ensuring image", body.os.os_name, body.os.os_url, "into", CLOUDIMG_DIR)
-        try:
-            base_path = ensure_cloudimg(body.os.os_name, body.os.os_url, body.os.os_checksum)
-        except Exception as e:
-            print("Step 3 ERROR:", type(e).__name__, str(e))
-            raise
-        print("Step 3: done", base_path)
-
-        # 4) overwrite vda with a full clone, keeping current disk size
-        full_clone_cloud_image_into_volume(str(base_path), vda_path, current_disk_gb)
-        print("Step 4: done")
+        # 2) same OS as the pristine snapshot: drop the overlay and start over from it (O(1))
+        pristine = next(
+            (r for r in read_snapshots(domain) if r.pristine and r.os_name == body.os.os_name),
+            None,
+        )
+        # current size comes from the active layer, so live resizes are kept
+        current_bytes = vda_block_info(domain)["capacity_bytes"]
+        current_disk_gb = max(1, math.ceil(current_bytes / 1024 ** 3))
+        if pristine is not None:
+            provisioning.step(domain.name(), "revert_pristine")
+            with span("format.revert_pristine", vm=vm_id, os=body.os.os_name):
+                revert_snapshot(conn, domain, pristine.name)
+                domain = conn.lookupByName(domain.name())
+                vda_path = get_vda_path(domain)
+                if vda_block_info(domain)["capacity_bytes"] < current_bytes:
+                    qemu_img_resize(vda_path, current_bytes)
+            print("Step 2-4: reverted to pristine snapshot", vda_path)
+        else:
+            # find the base vda volume (dropping any snapshot chain)
+            provisioning.step(domain.name(), "discard_chain")
+            with span("format.discard_chain", vm=vm_id):
+                vda_path = discard_chain(conn, domain)
+                domain = conn.lookupByName(domain.name())
+            print("Step 2: done")
+
+            print("Step 3: ensuring image", body.os.os_name, body.os.os_url, "into", CLOUDIMG_DIR)
+            provisioning.step(domain.name(), "ensure_image")
+            try:
+                with span("format.ensure_image", os=body.os.os_name):
+                    base_path = ensure_cloudimg(body.os.os_name, body.os.os_url, body.os.os_checksum)
+            except Exception as e:
+                print("Step 3 ERROR:", type(e).__name__, str(e))
+                raise
+            print("Step 3: done", base_path)
+
+            # 4) overwrite vda with a full clone, keeping current disk size
+            raw_disk = get_vda_format(domain) == "raw"
+            if raw_disk:
+                # raw files and LVs are written in place, there is no temp copy
+                provisioning.step(domain.name(), "clone")
+                with span("format.stream_raw", vm=vm_id, disk_gb=current_disk_gb):
+                    stream_image_into_volume(str(base_path), vda_path)
+            else:
+                provisioning.step(domain.name(), "clone", clone_tmp=f"{vda_path}.tmp")
+                with span("format.clone", vm=vm_id, disk_gb=current_disk_gb):
+                    full_clone_cloud_image_into_volume(str(base_path), vda_path, current_disk_gb)
+            print("Step 4: done")
+
+            # 4b) freeze the fresh OS as "pristine" so the next reformat is instant
+            # (qcow2 only: raw disks have no overlays)
+            if PRISTINE_ENABLED and not raw_disk:
+                provisioning.step(domain.name(), "pristine_snapshot")
+                with span("format.pristine_snapshot", vm=vm_id):
+                    create_snapshot(domain, PRISTINE_SNAPSHOT, pristine=True, os_name=body.os.os_name)
+                vda_path = get_vda_path(domain)
+                print("Step 4b: pristine snapshot taken, active overlay", vda_path)
 
         # 5) create seed ISO
         seed_iso_path = f"/tmp/{vm_id}-seed.iso"
@@ -127,17 +224,24 @@ async def format_vm_disk(vm_id: str, body: VMFormatBody):
                 password=body.host.password,
             )
 
-        generate_cloud_init_iso_alt(meta, net_for_iso, user, seed_iso_path)
+        provisioning.step(domain.name(), "iso_build")
+        with span("format.iso_build", vm=vm_id):
+            generate_cloud_init_iso_alt(meta, net_for_iso, user, seed_iso_path)
         print("Step 5: done")
 
         # 6) attach seed ISO (replace old one if any)
-        detach_seed_iso(domain, "sda")
-        attach_seed_iso(domain, seed_iso_path, "sda")
+        provisioning.step(domain.name(), "attach")
+        with span("format.attach", vm=vm_id):
+            detach_seed_iso(domain, "sda")
+            attach_seed_iso(domain, seed_iso_path, "sda")
         print("Step 6: done")
 
         # 7) boot
-        domain.create()
+        provisioning.step(domain.name(), "boot")
+        with span("format.boot", vm=vm_id):
+            domain.create()
         print("Step 7: done")
+        provisioning.finish(domain.name())
 
         return {
             "found": True,
@@ -150,11 +254,17 @@ async def format_vm_disk(vm_id: str, body: VMFormatBody):
         }
 
     except HTTPException:
+        if chain_lock is not None:
+            provisioning.finish(domain.name(), error="rejected")
         raise
     except Exception as e:
         traceback.print_exc()
+        if chain_lock is not None:
+            provisioning.finish(domain.name(), error=f"{type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {e}")
     finally:
+        if chain_lock is not None:
+            chain_lock.release()
         conn.close()
 
 @router.post("/{vm_id}/finalize")
@@ -180,60 +290,92 @@ async def finalize_vm(vm_id: str):
 
 @router.delete("/{vm_id}")
 async def delete_vm(vm_id: str):
-    conn = get_connection()
-    try:
-        try:
-            dom = conn.lookupByName(vm_id)
-        except libvirt.libvirtError:
-            raise HTTPException(404, f"Domain '{vm_id}' not found")
-
-        # Capture paths before undefine
-        disk_path = get_vda_path(dom)
-        seed_iso_path = f"/tmp/{vm_id}-seed.iso"
+    # a compaction, migration, reclaim or clone would keep writing files we remove
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(409, f"VM has an active {running.kind} job ({running.id})")
 
-        # Hard power-off (fast)
-        if dom.isActive():
-            dom.destroy()
-
-        # Undefine (remove from libvirt)
-        flags = 0
-        # add flags only if your libvirt supports them
-        try:
-            flags |= libvirt.VIR_DOMAIN_UNDEFINE_MANAGED_SAVE
-        except AttributeError:
-            pass
-        try:
-            flags |= libvirt.VIR_DOMAIN_UNDEFINE_SNAPSHOTS_METADATA
-        except AttributeError:
-            pass
+    def _delete():
+        conn = get_connection()
         try:
-            flags |= libvirt.VIR_DOMAIN_UNDEFINE_NVRAM
-        except AttributeError:
-            pass
-
-        if flags:
-            dom.undefineFlags(flags)
-        else:
-            dom.undefine()
-
-        # Delete disk + seed ISO files (optional but usually desired for temporary VMs)
-        if disk_path:
             try:
-                Path(disk_path).unlink()
-            except FileNotFoundError:
-                pass
-
-        try:
-            Path(seed_iso_path).unlink()
-        except FileNotFoundError:
-            pass
-
-        return {"found": True, "vm": {"status": "deleted", "disk_deleted": bool(disk_path)}}
+                dom = conn.lookupByName(vm_id)
+            except libvirt.libvirtError:
+                raise HTTPException(404, f"Domain '{vm_id}' not found")
+
+            with vm_lock_within(vm_id):
+                # Capture paths before undefine (snapshot layers and overlays included)
+                disk_path = get_vda_path(dom)
+                try:
+                    chain = backing_chain(disk_path)
+                except Exception:
+                    chain = [disk_path]
+
+                # Hard power-off (fast)
+                if dom.isActive():
+                    dom.destroy()
+
+                # Undefine (remove from libvirt)
+                flags = 0
+                # add flags only if your libvirt supports them
+                try:
+                    flags |= libvirt.VIR_DOMAIN_UNDEFINE_MANAGED_SAVE
+                except AttributeError:
+                    pass
+                try:
+                    flags |= libvirt.VIR_DOMAIN_UNDEFINE_SNAPSHOTS_METADATA
+                except AttributeError:
+                    pass
+                try:
+                    flags |= libvirt.VIR_DOMAIN_UNDEFINE_NVRAM
+                except AttributeError:
+                    pass
+
+                if flags:
+                    dom.undefineFlags(flags)
+                else:
+                    dom.undefine()
+
+                # Delete disk + seed ISO files (optional but usually desired for temporary VMs)
+                if disk_path:
+                    for layer in chain:
+                        # never touch shared backing files (e.g. cached cloud images)
+                        if layer != disk_path and not Path(layer).name.startswith(f"{vm_id}."):
+                            continue
+                        try:
+                            remove_disk(conn, layer)
+                        except libvirt.libvirtError as e:
+                            print(f"Could not delete volume {layer}: {e}")
+            return disk_path
+        finally:
+            conn.close()
 
+    try:
+        disk_path = await asyncio.to_thread(_delete)
+    except VMBusyError as e:
+        raise HTTPException(409, str(e))
     except libvirt.libvirtError as e:
         raise HTTPException(500, f"Error deleting VM: {str(e)}")
-    finally:
-        conn.close()
-    
+
+    try:
+        Path(f"/tmp/{vm_id}-seed.iso").unlink()
+    except FileNotFoundError:
+        pass
+    guest_facts.forget(vm_id)
+    capacity_ledger.forget(vm_id)
+    reclaim.forget(vm_id)
+    hibernation.forget(vm_id)
+
+    return {"found": True, "vm": {"status": "deleted", "disk_deleted": bool(disk_path)}}
+
 
 router.include_router(vm_status_router)
+router.include_router(vm_placement_router)
+router.include_router(vm_migrate_router)
+router.include_router(vm_snapshots_router)
+router.include_router(vm_disk_router)
+router.include_router(vm_console_router)
+router.include_router(vm_guest_router)
+router.include_router(vm_network_router)
+router.include_router(vm_resources_router)
+router.include_router(vm_hibernate_router)
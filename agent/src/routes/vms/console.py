@@ -0,0 +1,65 @@
+from fastapi import APIRouter, WebSocket, status
+from src.libs.console.relay import (
+    close_session,
+    console_endpoint,
+    relay_pty,
+    relay_tcp,
+    try_open_session,
+)
+from src.libs.crypto.verify import verify_console_token
+from src.libs.virt.connection import get_connection_read_only
+import libvirt
+
+router = APIRouter()
+
+@router.websocket("/{vm_id}/console")
+async def vm_console(websocket: WebSocket, vm_id: str, token: str, kind: str = "vnc"):
+    """
+    Relays the VM's VNC server (kind=vnc) or serial pty (kind=serial) over a websocket.
+    The token is minted by the control plane and signed with its Ed25519 key.
+    """
+    if kind not in ("vnc", "serial"):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="kind must be vnc or serial")
+        return
+
+    try:
+        claims = verify_console_token(token, vm_id)
+    except Exception as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+        return
+    if claims.get("kind", kind) != kind:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token is for another console kind")
+        return
+
+    conn = get_connection_read_only()
+    try:
+        domain = conn.lookupByName(vm_id)
+        transport, target, port = console_endpoint(domain, kind)
+    except (libvirt.libvirtError, LookupError) as e:
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason=str(e))
+        return
+    finally:
+        conn.close()
+
+    session = try_open_session(vm_id, kind)
+    if session is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many console sessions")
+        return
+
+    # noVNC speaks the "binary" subprotocol
+    subprotocols = websocket.scope.get("subprotocols") or []
+    await websocket.accept(subprotocol="binary" if "binary" in subprotocols else None)
+    print(f"Console {session.id}: {vm_id} ({kind}) -> {target}" + (f":{port}" if port else ""))
+    try:
+        if transport == "tcp":
+            await relay_tcp(websocket, session, target, port)
+        else:
+            await relay_pty(websocket, session, target)
+    except Exception as e:
+        print(f"Console {session.id} ended with error: {type(e).__name__}: {e}")
+    finally:
+        close_session(session)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
@@ -0,0 +1,143 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import active_job_for, submit_job
+from src.libs.virt.capacity import refresh_vm
+from src.libs.virt.connection import get_connection
+from src.libs.virt.disk import resize_vda, vda_block_info
+from src.libs.virt.errors import InsufficientResourcesError, VMBusyError
+from src.libs.virt.guest_agent import GuestAgentError, grow_root_filesystem
+from src.libs.virt.iotune import get_iotune, set_iotune
+from src.libs.virt.reclaim import reclaim_vm
+from src.libs.virt.snapshots import vm_lock_within
+from src.models.create_vm import DiskSpec
+from src.models.disk_vm import DiskResizeRequest
+import libvirt
+
+router = APIRouter(prefix="/{vm_id}/disk")
+
+@router.get("/")
+async def get_disk(vm_id: str):
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        return {"found": True, "disk": vda_block_info(domain)}
+    finally:
+        conn.close()
+
+@router.patch("/")
+async def resize_disk(vm_id: str, body: DiskResizeRequest):
+    """
+    Grows vda without stopping the VM.
+    """
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM has an active {running.kind} job ({running.id})")
+
+    def _resize():
+        conn = get_connection()
+        try:
+            try:
+                domain = conn.lookupByName(vm_id)
+            except libvirt.libvirtError:
+                raise HTTPException(status_code=404, detail="VM not found")
+
+            with vm_lock_within(vm_id):
+                if domain.hasManagedSaveImage(0):
+                    # its saved RAM expects the disk at its old size
+                    raise HTTPException(status_code=409, detail="VM is hibernated; resume it before resizing its disk")
+                result = resize_vda(conn, domain, body.size_gb)
+            if result["changed"]:
+                refresh_vm(conn, vm_id)
+
+            filesystem = None
+            if body.grow_filesystem and result["changed"]:
+                if not domain.isActive():
+                    filesystem = {"grown": False, "reason": "VM is not running; cloud-init growpart handles it on boot"}
+                else:
+                    try:
+                        out = grow_root_filesystem(domain)
+                        filesystem = {"grown": out["exitcode"] == 0, **out}
+                    except GuestAgentError as e:
+                        filesystem = {"grown": False, "reason": str(e)}
+            return {**result, "filesystem": filesystem}
+        finally:
+            conn.close()
+
+    try:
+        disk = await asyncio.to_thread(_resize)
+        return {"found": True, "disk": disk}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (InsufficientResourcesError, VMBusyError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/iotune")
+async def get_disk_iotune(vm_id: str):
+    """
+    vda I/O limits in effect (live) and persisted (config). 0 = unlimited.
+    """
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        return {"found": True, "iotune": get_iotune(domain)}
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@router.patch("/iotune")
+async def update_disk_iotune(vm_id: str, body: DiskSpec):
+    """
+    Changes vda I/O limits without a reboot. Only the fields sent change;
+    0 removes a limit.
+    """
+    def _update():
+        conn = get_connection()
+        try:
+            try:
+                domain = conn.lookupByName(vm_id)
+            except libvirt.libvirtError:
+                raise HTTPException(status_code=404, detail="VM not found")
+            with vm_lock_within(vm_id):
+                return set_iotune(domain, body)
+        finally:
+            conn.close()
+
+    try:
+        iotune = await asyncio.to_thread(_update)
+        return {"found": True, "iotune": iotune}
+    except VMBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        if e.get_error_code() in (libvirt.VIR_ERR_INVALID_ARG, libvirt.VIR_ERR_CONFIG_UNSUPPORTED):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/reclaim")
+async def reclaim_disk(vm_id: str):
+    """
+    Gives vda's unused space back to the pool as a job: fstrim through the
+    guest agent when running, offline compaction when stopped.
+    """
+    conn = get_connection()
+    try:
+        try:
+            conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+    finally:
+        conn.close()
+
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM has an active {running.kind} job ({running.id})")
+    job = submit_job("reclaim", lambda job: reclaim_vm(job, vm_id), vm_id=vm_id)
+    return {"found": True, "job": job.to_dict()}
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+from src.libs.store import guest_facts as facts_store
+from src.libs.virt.guest_facts import refresh_guest_facts
+from src.libs.virt.list import get_virtual_machine_read
+
+router = APIRouter(prefix="/{vm_id}/guest")
+
+@router.get("/")
+async def get_guest_facts(vm_id: str, refresh: bool = False):
+    """
+    What the guest agent last reported: IP addresses, filesystem usage,
+    OS info and cloud-init status. Collected in the background every
+    GUEST_FACTS_INTERVAL_S; `refresh=true` collects now, but answers from
+    the cache (`stale: true`) if the guest is slow.
+    """
+    if get_virtual_machine_read(vm_id) is None:
+        raise HTTPException(status_code=404, detail="VM not found")
+
+    stale = False
+    if refresh:
+        stale = not await refresh_guest_facts(vm_id)
+
+    record = facts_store.get(vm_id)
+    return {"found": True, "guest": record, "stale": stale}
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import active_job_for, submit_job
+from src.libs.store import hibernation as hibernation_store
+from src.libs.virt.connection import get_connection
+from src.libs.virt.hibernate import (
+    hibernate_job,
+    idle_policy_allowed,
+    idle_seconds,
+    set_idle_policy,
+    start_or_resume,
+)
+from src.libs.virt.snapshots import vm_lock
+from src.models.hibernate_vm import HibernatePolicyUpdate, HibernateRequest
+import libvirt
+
+router = APIRouter(prefix="/{vm_id}/hibernate")
+
+@router.get("/")
+async def get_hibernation(vm_id: str):
+    """
+    Whether the VM has a managed save image, its last save/restore timings
+    and image size, and its idle policy setting.
+    """
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        return {
+            "found": True,
+            "hibernated": bool(domain.hasManagedSaveImage(0)),
+            "idle_policy": idle_policy_allowed(domain),
+            "idle_s": idle_seconds(vm_id),
+            "last": hibernation_store.get(vm_id),
+        }
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@router.post("/")
+async def hibernate_vm(vm_id: str, body: Optional[HibernateRequest] = None):
+    """
+    Suspends the VM to disk (managed save) as a job; its RAM goes back to
+    the host. Starting the VM again resumes it.
+    """
+    body = body or HibernateRequest()
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        if not domain.isActive():
+            raise HTTPException(status_code=409, detail="VM is not running")
+    finally:
+        conn.close()
+
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM has an active {running.kind} job ({running.id})")
+    image_format = body.image_format.value if body.image_format else None
+    if image_format and not hasattr(libvirt, "VIR_DOMAIN_SAVE_PARAM_IMAGE_FORMAT"):
+        raise HTTPException(status_code=400, detail="This libvirt can't choose the save image format per VM")
+    job = submit_job(
+        "hibernate",
+        lambda job: hibernate_job(job, vm_id, image_format, body.bypass_cache),
+        vm_id=vm_id,
+    )
+    return {"found": True, "job": job.to_dict()}
+
+@router.post("/resume")
+async def resume_vm(vm_id: str, bypass_cache: Optional[bool] = None):
+    """
+    Restores a hibernated VM (same as POST /status/start, with timings).
+    """
+    def _resume():
+        conn = get_connection()
+        try:
+            try:
+                domain = conn.lookupByName(vm_id)
+            except libvirt.libvirtError:
+                raise HTTPException(status_code=404, detail="VM not found")
+            if domain.isActive():
+                raise HTTPException(status_code=409, detail="VM is already running")
+            if not domain.hasManagedSaveImage(0):
+                raise HTTPException(status_code=409, detail="VM is not hibernated")
+            with vm_lock(vm_id):
+                return start_or_resume(domain, bypass_cache)
+        finally:
+            conn.close()
+
+    try:
+        result = await asyncio.to_thread(_resume)
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"found": True, "vm": {"status": "started", **result}}
+
+@router.patch("/")
+async def update_hibernation_policy(vm_id: str, body: HibernatePolicyUpdate):
+    """
+    Opts the VM in or out of automatic idle hibernation.
+    """
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        set_idle_policy(domain, body.idle)
+        return {"found": True, "idle_policy": idle_policy_allowed(domain)}
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
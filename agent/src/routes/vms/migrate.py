@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import active_job_for, submit_job
+from src.libs.virt.list import get_virtual_machine_read
+from src.libs.virt.migrate import migrate_domain
+from src.models.migrate_vm import MigrateRequest
+
+router = APIRouter()
+
+@router.post("/{vm_id}/migrate", status_code=202)
+async def migrate_vm(vm_id: str, body: MigrateRequest):
+    """
+    Starts a live migration to another host. Progress is reported through
+    GET /jobs/{job_id}.
+    """
+    vm = get_virtual_machine_read(vm_id)
+    if vm is None:
+        raise HTTPException(status_code=404, detail="VM not found")
+
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM already has an active {running.kind} job ({running.id})")
+
+    job = submit_job("migrate", lambda job: migrate_domain(job, vm_id, body), vm_id=vm_id)
+    return {"found": True, "job": job.to_dict()}
@@ -0,0 +1,56 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from src.libs.virt.bandwidth import get_bandwidth, set_bandwidth, uplink_speed_mbps
+from src.libs.virt.connection import get_connection
+from src.libs.virt.errors import VMBusyError
+from src.libs.virt.snapshots import vm_lock_within
+from src.models.network_vm import NetworkBandwidthUpdate
+import libvirt
+
+router = APIRouter(prefix="/{vm_id}/network")
+
+@router.get("/")
+async def get_network(vm_id: str):
+    """
+    Bandwidth limits of the VM's interface (live and config), in Mbps.
+    """
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        return {"found": True, "network": {**get_bandwidth(domain), "link_speed_mbps": uplink_speed_mbps(conn, domain)}}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@router.patch("/")
+async def update_network(vm_id: str, body: NetworkBandwidthUpdate):
+    """
+    Changes average/peak/burst of the VM's interface without a reboot.
+    """
+    def _update():
+        conn = get_connection()
+        try:
+            try:
+                domain = conn.lookupByName(vm_id)
+            except libvirt.libvirtError:
+                raise HTTPException(status_code=404, detail="VM not found")
+            with vm_lock_within(vm_id):
+                return set_bandwidth(conn, domain, body)
+        finally:
+            conn.close()
+
+    try:
+        network = await asyncio.to_thread(_update)
+        return {"found": True, "network": network}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except VMBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
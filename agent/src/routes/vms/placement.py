@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException
+from src.libs.virt.connection import get_connection
+from src.libs.virt.placement import rebalance, repin_domain
+import libvirt
+
+router = APIRouter()
+
+@router.post("/repin")
+async def repin_all_vms():
+    """
+    Rebalances every running VM over the host NUMA nodes (live).
+    """
+    conn = get_connection()
+    try:
+        results = rebalance(conn)
+        return {"vms": results, "changed": sum(1 for r in results if r.get("changed"))}
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@router.post("/{vm_id}/repin")
+async def repin_vm(vm_id: str):
+    """
+    Moves one VM to the currently least-loaded NUMA node (live).
+    """
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+
+        applied = repin_domain(conn, domain)
+        if applied is None:
+            raise HTTPException(status_code=409, detail="No single NUMA node can hold this VM")
+        return {"found": True, "vm": {"placement": applied}}
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
@@ -0,0 +1,70 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import active_job_for, submit_job
+from src.libs.virt.capacity import refresh_vm
+from src.libs.virt.connection import get_connection
+from src.libs.virt.errors import InsufficientResourcesError, VMBusyError
+from src.libs.virt.resources import get_resources, resize_resources, restart_to_apply
+from src.libs.virt.snapshots import vm_lock_within
+from src.models.resources_vm import ResourcesUpdate
+import libvirt
+
+router = APIRouter(prefix="/{vm_id}/resources")
+
+@router.get("/")
+async def get_vm_resources(vm_id: str):
+    """
+    vCPUs and memory: live, config and the hotplug maximums.
+    """
+    conn = get_connection()
+    try:
+        try:
+            domain = conn.lookupByName(vm_id)
+        except libvirt.libvirtError:
+            raise HTTPException(status_code=404, detail="VM not found")
+        return {"found": True, "resources": get_resources(domain)}
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@router.patch("/")
+async def update_vm_resources(vm_id: str, body: ResourcesUpdate):
+    """
+    Scales vCPUs/memory of a running VM live. What can't change live is
+    saved to the config; with `restart=true` a restart job applies it
+    after `restart_delay_s`.
+    """
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM has an active {running.kind} job ({running.id})")
+
+    def _resize():
+        conn = get_connection()
+        try:
+            try:
+                domain = conn.lookupByName(vm_id)
+            except libvirt.libvirtError:
+                raise HTTPException(status_code=404, detail="VM not found")
+            with vm_lock_within(vm_id):
+                result = resize_resources(conn, domain, body)
+            refresh_vm(conn, vm_id)
+            return result
+        finally:
+            conn.close()
+
+    try:
+        result = await asyncio.to_thread(_resize)
+    except (InsufficientResourcesError, VMBusyError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    job = None
+    if result["restart_required"] and body.restart:
+        job = submit_job(
+            "restart",
+            lambda job: restart_to_apply(job, vm_id, body.restart_delay_s),
+            vm_id=vm_id,
+        )
+    return {"found": True, "resources": result, "job": job.to_dict() if job else None}
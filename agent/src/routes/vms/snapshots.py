@@ -0,0 +1,136 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from src.libs.jobs.jobs import active_job_for, submit_job
+from src.libs.virt.connection import get_connection
+from src.libs.virt.errors import VMBusyError
+from src.libs.virt.snapshots import (
+    SnapshotError,
+    chain_info,
+    compact_chain,
+    create_snapshot,
+    delete_snapshot,
+    read_snapshots,
+    revert_snapshot,
+    vm_lock_within,
+)
+from src.models.snapshot_vm import SnapshotCreateRequest, SnapshotRevertRequest
+import libvirt
+
+router = APIRouter(prefix="/{vm_id}/snapshots")
+
+
+def _lookup(conn, vm_id: str) -> libvirt.virDomain:
+    try:
+        return conn.lookupByName(vm_id)
+    except libvirt.libvirtError:
+        raise HTTPException(status_code=404, detail="VM not found")
+
+
+def _ensure_no_job(vm_id: str):
+    running = active_job_for(vm_id)
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"VM has an active {running.kind} job ({running.id})")
+
+
+@router.get("/")
+async def list_snapshots(vm_id: str):
+    conn = get_connection()
+    try:
+        domain = _lookup(conn, vm_id)
+        return {
+            "found": True,
+            "snapshots": [r.to_dict() for r in read_snapshots(domain)],
+            "chain": chain_info(domain),
+        }
+    finally:
+        conn.close()
+
+@router.post("/")
+async def take_snapshot(vm_id: str, body: SnapshotCreateRequest):
+    _ensure_no_job(vm_id)
+
+    def _take():
+        conn = get_connection()
+        try:
+            domain = _lookup(conn, vm_id)
+            with vm_lock_within(vm_id):
+                return create_snapshot(domain, body.name)
+        finally:
+            conn.close()
+
+    try:
+        record = await asyncio.to_thread(_take)
+        return {"found": True, "snapshot": record.to_dict()}
+    except (SnapshotError, VMBusyError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{name}")
+async def remove_snapshot(vm_id: str, name: str):
+    """
+    Forgets the snapshot right away; its layer is merged by a background job.
+    If the VM is hibernated, the periodic compaction task merges it once the
+    VM is resumed.
+    """
+    _ensure_no_job(vm_id)
+
+    def _remove():
+        conn = get_connection()
+        try:
+            domain = _lookup(conn, vm_id)
+            with vm_lock_within(vm_id):
+                return delete_snapshot(domain, name), bool(domain.hasManagedSaveImage(0))
+        finally:
+            conn.close()
+
+    try:
+        needs_compaction, hibernated = await asyncio.to_thread(_remove)
+    except SnapshotError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except VMBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    job = None
+    if needs_compaction and active_job_for(vm_id) is None and not hibernated:
+        job = submit_job("snapshot-compact", lambda job: compact_chain(vm_id, job), vm_id=vm_id)
+    return {
+        "found": True,
+        "deleted": name,
+        "job": job.to_dict() if job else None,
+        "compaction_deferred": needs_compaction and job is None,
+    }
+
+@router.post("/{name}/revert")
+async def revert_to_snapshot(vm_id: str, name: str, body: Optional[SnapshotRevertRequest] = None):
+    body = body or SnapshotRevertRequest()
+    _ensure_no_job(vm_id)
+
+    def _revert():
+        conn = get_connection()
+        try:
+            domain = _lookup(conn, vm_id)
+            was_running = domain.isActive()
+            with vm_lock_within(vm_id):
+                if body.discard_saved_state and domain.hasManagedSaveImage(0):
+                    domain.managedSaveRemove(0)
+                if was_running:
+                    domain.destroy()
+                result = revert_snapshot(conn, domain, name)
+
+            if was_running or body.start:
+                conn.lookupByName(vm_id).create()
+            return result
+        finally:
+            conn.close()
+
+    try:
+        result = await asyncio.to_thread(_revert)
+        return {"found": True, "vm": {"status": "reverted", **result}}
+    except (SnapshotError, VMBusyError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libvirt.libvirtError as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,9 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from src.libs.virt.errors import VMBusyError
+from src.libs.virt.hibernate import start_or_resume
+from src.libs.virt.snapshots import vm_lock_within
 from src.libs.virt.list import get_virtual_machine_read, get_virtual_machine_changes, __domain_to_dict__
 import libvirt
 
@@ -17,9 +21,18 @@ async def start_vm(vm_id: str):
     vm = get_virtual_machine_changes(vm_id)
     if vm is None:
         raise HTTPException(status_code=404, detail="VM not found")
+
+    def _start():
+        # an offline compaction or revert may be rewriting the disk right now
+        with vm_lock_within(vm_id):
+            # hibernated VMs are restored from their managed save image
+            return start_or_resume(vm)
+
     try:
-        vm.create()
-        return {"found": True, "vm": {"status": "started"}}
+        result = await asyncio.to_thread(_start)
+        return {"found": True, "vm": {"status": "started", **result}}
+    except VMBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except libvirt.libvirtError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2,15 +2,85 @@ from fastapi import FastAPI
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Request
-from src.libs.virt.connection import get_connection_read_only
+from fastapi.responses import JSONResponse
+from src.libs.virt.connection import get_connection, get_connection_read_only
+from src.libs.crypto.verify import NONCE_TTL_S, get_api_public_key, prune_nonces, verify_request_signature
+from src.libs.health.checks import HEALTH_CHECK_INTERVAL_S, monitor_loop_lag, run_checks
+from src.libs.tasks.periodic import register_task, start_tasks, stop_tasks
+from src.libs.jobs.jobs import recover_jobs, sync_cancellations
+from src.libs.store.provisioning import recover_provisioning
+from src.libs.telemetry.http import route_key, track_request
+from src.libs.telemetry.tracing import span
+from src.libs.virt.reconcile import RECONCILE_INTERVAL_S, run_reconcile
+from src.libs.virt.guest_facts import GUEST_FACTS_INTERVAL_S, collect_all_guest_facts
+from src.libs.virt.balloon import BALLOON_INTERVAL_S, balance_memory
+from src.libs.virt.ksm import KSM_INTERVAL_S, tune_ksm
+from src.libs.virt.capacity import CAPACITY_SYNC_INTERVAL_S, sync_ledger
+from src.libs.virt.hibernate import HIBERNATE_IDLE_INTERVAL_S, hibernate_idle_vms
+from src.libs.virt.storage_pools import STORAGE_PROBE_INTERVAL_S, probe_pools
+from src.libs.virt.reclaim import RECLAIM_INTERVAL_S, run_periodic_reclaim
+from src.libs.virt.snapshots import SNAPSHOT_COMPACT_INTERVAL_S, compact_pending_chains
 from src.routes import routes
+from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Require control plane (API -> agent) Ed25519 signatures on every request
+VERIFY_API_SIGNATURES = os.getenv("VERIFY_API_SIGNATURES", "false").lower() == "true"
+# Reachable without a signature (liveness probes, key exchange)
+UNSIGNED_PATHS = ("/api/v1/health", "/api/v1/info/key")
+
+# uvicorn worker processes; they share state through the SQLite store (src/libs/store)
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+
+register_task("health", HEALTH_CHECK_INTERVAL_S, run_checks)
+register_task("job-cancellations", 1, sync_cancellations)
+register_task("nonce-prune", NONCE_TTL_S, prune_nonces, singleton=True)
+# first pass right after startup recovery, then periodically; one worker per host
+register_task("reconcile", RECONCILE_INTERVAL_S, run_reconcile, singleton=True)
+# facts go to the state store, so one worker polls the guests for all of them
+register_task("guest-facts", GUEST_FACTS_INTERVAL_S, collect_all_guest_facts, singleton=True)
+register_task("balloon", BALLOON_INTERVAL_S, balance_memory, singleton=True)
+register_task("ksm", KSM_INTERVAL_S, tune_ksm, singleton=True)
+# the first pass fills the ledger at startup
+register_task("capacity-sync", CAPACITY_SYNC_INTERVAL_S, sync_ledger, singleton=True)
+register_task("idle-hibernate", HIBERNATE_IDLE_INTERVAL_S, hibernate_idle_vms, singleton=True)
+# latencies go to the state store; placement in every worker reads them
+register_task("storage-probe", STORAGE_PROBE_INTERVAL_S, probe_pools, singleton=True)
+register_task("reclaim", RECLAIM_INTERVAL_S, run_periodic_reclaim, singleton=True)
+# snapshot deletes that found the VM busy leave a marker; this picks them up
+register_task("snapshot-compact", SNAPSHOT_COMPACT_INTERVAL_S, compact_pending_chains, singleton=True)
+
+def recover_interrupted_work():
+    """
+    Fails jobs and rolls back provisioning left behind by a worker that died.
+    Safe to run in every worker: work owned by live workers is skipped.
+    """
+    recover_jobs()
+    try:
+        conn = get_connection()
+    except Exception as e:
+        print(f"Skipping provisioning recovery: {e}")
+        return
+    try:
+        recover_provisioning(conn)
+    finally:
+        conn.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(recover_interrupted_work)
+    start_tasks()
+    loop_lag = asyncio.create_task(monitor_loop_lag())
+    yield
+    loop_lag.cancel()
+    stop_tasks()
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -23,8 +93,26 @@ app.add_middleware(
 
 @app.middleware("http")
 async def check(request: Request, call_next):
-    response = await call_next(request)
-    
+    key = route_key(app, request.scope)
+    with track_request(key) as tracked, span("http.request", route=key) as s:
+        if VERIFY_API_SIGNATURES and request.method != "OPTIONS" and not request.url.path.startswith(UNSIGNED_PATHS):
+            # sign over the path exactly as sent, not the decoded/normalized one
+            path_with_query = request.scope.get("raw_path", request.url.path.encode()).decode("latin-1")
+            query = request.scope.get("query_string", b"").decode("latin-1")
+            if query:
+                path_with_query += "?" + query
+            try:
+                verify_request_signature(request.method, path_with_query, request.headers)
+            except ValueError as e:
+                tracked.status = 401
+                return JSONResponse(status_code=401, content={"error": str(e)})
+
+        response = await call_next(request)
+        tracked.status = response.status_code
+        s.set(status=response.status_code)
+        if s.trace_id:
+            response.headers["X-Trace-Id"] = s.trace_id
+
     return response
 
 app.include_router(prefix="/api", router=routes.api_router)
@@ -35,7 +123,16 @@ def run():
         raise Exception("Failed to establish read-only connection to libvirt"
                         " - is libvirtd running?")
     conn.close()
-    uvicorn.run(app, host=os.getenv("HOST", "127.0.0.1"), port=int(os.getenv("PORT", 5000)))
+    if VERIFY_API_SIGNATURES:
+        # load the key before serving so the first request doesn't pay for it
+        get_api_public_key()
+    host = os.getenv("HOST", "127.0.0.1")
+    port = int(os.getenv("PORT", 5000))
+    if AGENT_WORKERS > 1:
+        # workers need an import string: each one imports the app itself
+        uvicorn.run("src.server:app", host=host, port=port, workers=AGENT_WORKERS)
+    else:
+        uvicorn.run(app, host=host, port=port)
 
 if __name__ == "__main__":
     run()
\ No newline at end of file